@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+# the price archive (and its ticker catalog) is mapped when the server starts (asgi.py, wsgi.py) rather than in ready(),
+# so management commands that never touch prices do not pay for it
+class GameAppConfig(AppConfig):
+    name = "app"
+    default_auto_field = "django.db.models.BigAutoField"
@@ -2,6 +2,7 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django, WebSocket connections to the game consumers (routing.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -13,4 +14,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
-application = get_asgi_application()
+# set up Django before the consumers import any models
+django_application = get_asgi_application()
+
+# load the ticker catalog before the first request, see archive.py
+from app.data.data_processing.archive import get_archive  # noqa: E402
+get_archive()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from .routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    "http": django_application,
+    "websocket": URLRouter(websocket_urlpatterns)
+})
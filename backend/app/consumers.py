@@ -0,0 +1,40 @@
+from urllib.parse import parse_qs
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .push import game_group
+
+'''
+GameConsumer
+
+WebSocket connection to a game, at ws/game/<game_id>/ (routing.py), optionally with ?player_id=<id> to receive that
+player's fills and balance. Pushes are sent once per game to its group (push.py); each connection forwards the public
+part of a message (tick, price, order book deltas, trades) and only the fills and balance of its own player.
+'''
+
+
+class GameConsumer(AsyncJsonWebsocketConsumer):
+    async def connect(self):
+        self.game_id = self.scope["url_route"]["kwargs"]["game_id"]
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.player_id = query.get("player_id", [None])[0]
+        self.group = game_group(self.game_id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    # the message with fills and players narrowed down to this connection's player
+    def _own(self, message):
+        own = {key: value for key, value in message.items() if key not in ("fills", "players")}
+        own["type"] = message["type"].replace(".", "_")
+        own["fills"] = [fill for fill in message["fills"] if fill["player_id"] == self.player_id]
+        own["player"] = message["players"].get(self.player_id) if self.player_id is not None else None
+        return own
+
+    async def game_tick(self, message):
+        await self.send_json(self._own(message))
+
+    async def game_fills(self, message):
+        own = self._own(message)
+        if own["fills"]:
+            await self.send_json(own)
@@ -0,0 +1,184 @@
+import mmap
+import os
+import threading
+from collections import namedtuple
+import numpy as np
+from app.data.data_processing.decoder import COMPRESSED_DATA_DIR, CHECKPOINT_DTYPE, CHECKPOINT_INTERVAL, \
+    read_compressed, read_header, read_index, build_index, decode_window
+
+'''
+Price archive
+
+All of the compressed tickers packed into a single file, so picking and decoding a ticker is a slice of one memory
+mapped file instead of a directory scan, a file open and a full read per game. All values are little-endian.
+
+Layout:
+    header: 4 byte magic "TGPK", version (uint16), reserved (uint16), number of tickers (uint32), reserved (uint32)
+    directory: one DIRECTORY_DTYPE record per ticker, sorted by ticker name
+    checkpoint table: the seek index checkpoints of every ticker (CHECKPOINT_DTYPE records), back to back
+    data: the .bin file of every ticker, back to back
+
+The directory doubles as the ticker catalog: entry counts and first/last prices are available through metadata()
+without reading any ticker data.
+
+The archive is built from compressed_data/ by pack_data(), which the pack_prices management command runs as a deploy
+step. get_archive() maps it once per process; the server does so when it starts (asgi.py, wsgi.py), so the catalog
+is loaded before the first game is created.
+'''
+
+ARCHIVE_PATH = "app/data/prices.pack"
+ARCHIVE_MAGIC = b"TGPK"
+ARCHIVE_VERSION = 2
+
+HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "<u2"), ("reserved", "<u2"),
+                         ("num_tickers", "<u4"), ("reserved2", "<u4")])
+
+# ticker: name of the underlying stock, e.g. aapl
+# data_offset / data_length: where the ticker's compressed data lives in the archive
+# count: number of entries
+# interval / checkpoint_offset / num_checkpoints: the ticker's seek index
+# first_price / last_price: first and last price stored for the ticker, in cents
+DIRECTORY_DTYPE = np.dtype([("ticker", "S32"), ("data_offset", "<u8"), ("data_length", "<u4"), ("count", "<u4"),
+                            ("interval", "<u4"), ("num_checkpoints", "<u4"), ("checkpoint_offset", "<u8"),
+                            ("first_price", "<i8"), ("last_price", "<i8")])
+
+# metadata of a single ticker, prices are in cents
+TickerMeta = namedtuple("TickerMeta", ["ticker", "count", "first_price", "last_price"])
+
+
+# packs every compressed file (and its seek index) in directory into a single archive at output
+# the archive is written to a temporary file first and moved into place, so readers never see a partial archive
+def pack_data(directory=COMPRESSED_DATA_DIR, output=ARCHIVE_PATH):
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".bin"))
+
+    blobs = []
+    indexes = []
+    for fileName in files:
+        buf = read_compressed(fileName, directory)
+        index = read_index(fileName, directory)
+        if index is None:
+            index = (CHECKPOINT_INTERVAL, build_index(buf))
+        blobs.append(buf)
+        indexes.append(index)
+
+    directory_table = np.zeros(len(files), dtype=DIRECTORY_DTYPE)
+    checkpoint_offset = HEADER_DTYPE.itemsize + DIRECTORY_DTYPE.itemsize * len(files)
+    data_offset = checkpoint_offset + CHECKPOINT_DTYPE.itemsize * sum(len(index[1]) for index in indexes)
+
+    for i, (fileName, buf, (interval, checkpoints)) in enumerate(zip(files, blobs, indexes)):
+        entry = directory_table[i]
+        entry["ticker"] = fileName[:-11].encode()
+        entry["data_offset"] = data_offset
+        entry["data_length"] = len(buf)
+        _, count, first_price = read_header(buf)
+        entry["count"] = count
+        entry["first_price"] = first_price
+        entry["last_price"] = decode_window(buf, count - 1, 1, (interval, checkpoints))[0]
+        entry["interval"] = interval
+        entry["num_checkpoints"] = len(checkpoints)
+        entry["checkpoint_offset"] = checkpoint_offset
+
+        data_offset += len(buf)
+        checkpoint_offset += CHECKPOINT_DTYPE.itemsize * len(checkpoints)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = ARCHIVE_MAGIC
+    header["version"] = ARCHIVE_VERSION
+    header["num_tickers"] = len(files)
+
+    tmp_path = f'{output}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(directory_table.tobytes())
+        for _, checkpoints in indexes:
+            f.write(np.ascontiguousarray(checkpoints, dtype=CHECKPOINT_DTYPE).tobytes())
+        for buf in blobs:
+            f.write(buf)
+    os.replace(tmp_path, output)
+
+    return len(files)
+
+
+'''
+PriceArchive
+
+Read-only view of a packed archive. The file is memory mapped once; the directory, checkpoint tables and ticker
+data are all zero-copy views into the mapping.
+'''
+class PriceArchive():
+    def __init__(self, path=ARCHIVE_PATH):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = np.frombuffer(self._mmap[:HEADER_DTYPE.itemsize], dtype=HEADER_DTYPE)[0]
+        if header["magic"] != ARCHIVE_MAGIC or header["version"] != ARCHIVE_VERSION:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a version {ARCHIVE_VERSION} price archive')
+
+        self._directory = np.frombuffer(self._mmap, dtype=DIRECTORY_DTYPE, count=int(header["num_tickers"]),
+                                        offset=HEADER_DTYPE.itemsize)
+
+        # sorted list of ticker names, and ticker name -> position in the directory
+        self.tickers = [ticker.decode() for ticker in self._directory["ticker"]]
+        self._positions = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self._positions
+
+    # number of entries stored for a ticker
+    def count(self, ticker):
+        return int(self._directory[self._positions[ticker]]["count"])
+
+    # metadata of a ticker, read from the directory without touching the ticker's data
+    def metadata(self, ticker):
+        entry = self._directory[self._positions[ticker]]
+        return TickerMeta(ticker, int(entry["count"]), int(entry["first_price"]), int(entry["last_price"]))
+
+    # metadata of every ticker, in the same order as tickers
+    def catalog(self):
+        return [self.metadata(ticker) for ticker in self.tickers]
+
+    # compressed bytes of a ticker, as a zero-copy view into the archive
+    def data(self, ticker):
+        entry = self._directory[self._positions[ticker]]
+        start = int(entry["data_offset"])
+        return memoryview(self._mmap)[start:start + int(entry["data_length"])]
+
+    # seek index of a ticker, returns (interval, checkpoints)
+    def index(self, ticker):
+        entry = self._directory[self._positions[ticker]]
+        checkpoints = np.frombuffer(self._mmap, dtype=CHECKPOINT_DTYPE, count=int(entry["num_checkpoints"]),
+                                    offset=int(entry["checkpoint_offset"]))
+        return int(entry["interval"]), checkpoints
+
+    # returns an int64 array of numPoints prices (in cents) of ticker, starting at index start
+    def decode_window(self, ticker, start, numPoints):
+        return decode_window(self.data(ticker), start, numPoints, self.index(ticker))
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+# returns the process-wide price archive, packing compressed_data/ first if the archive does not exist yet
+# or was written by an older version of the packer (pack_prices was not run)
+def get_archive():
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                if not os.path.exists(ARCHIVE_PATH):
+                    pack_data()
+                try:
+                    _archive = PriceArchive()
+                except ValueError:
+                    pack_data()
+                    _archive = PriceArchive()
+    return _archive
+
+
+if __name__ == "__main__":
+    print(f'packed {pack_data()} tickers into {ARCHIVE_PATH}')
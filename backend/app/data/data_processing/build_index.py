@@ -0,0 +1,14 @@
+import os
+from app.data.data_processing.decoder import COMPRESSED_DATA_DIR, write_index
+
+# writes the seek index sidecar (.idx) for every compressed file
+# run from the backend directory: python -m app.data.data_processing.build_index
+def build_indexes(directory=COMPRESSED_DATA_DIR):
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".bin"))
+    for fileName in files:
+        write_index(fileName, directory)
+    return len(files)
+
+
+if __name__ == "__main__":
+    print(f'indexed {build_indexes()} files')
@@ -1,8 +1,13 @@
 import pandas as pd
-from decimal import Decimal, ROUND_HALF_UP
-import math
-from bitarray import bitarray
+from decimal import Decimal
+import numpy as np
 import os
+from app.data.data_processing.decoder import COMPRESSED_DATA_DIR, OFFSET_BITS, COUNT_BITS, INITIAL_PRICE_BITS, \
+    HEADER_BITS, WIDTH_BITS, V2_MAGIC, V2_VERSION, V2_HEADER_DTYPE, COLUMNS, COLUMN_FLAGS, \
+    read_compressed, index_path, encode_index, write_atomic, decode_prices, decode_window
+from app.engine.money import to_cents
+
+RAW_DATA_DIR = "app/data/raw_data"
 
 # removes all columns except for CLOSE (price at end of day)
 def process_data(fileName):
@@ -15,140 +20,161 @@ def process_data(fileName):
     df.to_csv(f'../compressed_data/{fileName}')
 
 
-# compresses file down
-# check FORMAT.md inside of app/data/ for how the compression works
-def compress_data(fileName):
-    filePath = f'../raw_data/{fileName}'
-
-
-    # only read in the CLOSE column (stock prices at day close)
-    # ignore the indexing columm pandas adds
-    data = pd.read_csv(filePath)
-    data = data["<CLOSE>"].to_list()
-
-
-    # read in as decimal to avoid floating point imprecision
-    data = [Decimal(str(num)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) for num in data]
-
-
-    # array to hold elements of binary string together
-    # build the string at the end
-    # more efficient than constantly having to create new strings
-    # save index 0 for the offset
-    binary_string = ['']
-
-
-    # store first price in cents as a binary string of length 27
-    binary_string.append(f'{int(data[0] * 100):027b}')
-
-
-    for i in range(len(data) - 1):
-        diff = int((data[i + 1] - data[i]) * 100)
-        sign = '0' if diff < 0 else '1'
-
-        diff = abs(diff)
+# lays out the delta entries for a series of values as an array of bits (one uint8 per bit), starting at bit 0
+# every entry takes 5 bits for the width, plus a sign bit and width - 1 bits for the change if it is non-zero
+def _encode_entries(values):
+    diffs = np.diff(values)
+    magnitudes = np.abs(diffs)
 
+    # number of bits needed for each change, 0 if there is no change
+    widths = np.zeros(len(diffs), dtype=np.int64)
+    remaining = magnitudes.copy()
+    while remaining.any():
+        widths += remaining > 0
+        remaining >>= 1
+    if len(widths) and widths.max() >= 1 << WIDTH_BITS:
+        raise ValueError(f'change does not fit in {(1 << WIDTH_BITS) - 1} bits')
 
-        # number of bits required for this value, store it in a binary string of length 5
-        bits = math.ceil(math.log2(diff + 1)) if diff > 0 else 0
-        binary_string.append(f'{bits:05b}')
+    lengths = WIDTH_BITS + widths
+    # first bit of every entry; a series of a single value has no entries
+    starts = (np.cumsum(lengths) - lengths).astype(np.int64)
+    bits = np.zeros(int(lengths.sum()), dtype=np.uint8)
 
+    for j in range(WIDTH_BITS):
+        bits[starts + j] = (widths >> (WIDTH_BITS - 1 - j)) & 1
 
-        # difference is 0, continue to next entry
-        if diff == 0:
-            continue
-
+    # positive / negative bit, then the change with its leading 1 removed
+    changed = widths > 0
+    bits[starts[changed] + WIDTH_BITS] = diffs[changed] > 0
+    for j in range(int(widths.max()) - 1 if len(widths) else 0):
+        valid = j < widths - 1
+        bits[starts[valid] + WIDTH_BITS + 1 + j] = (magnitudes[valid] >> (widths[valid] - 2 - j)) & 1
 
-        # positive / negative bit
-        binary_string.append(sign)
+    return bits
 
-        # finally, add in the binary representation of the difference
-        # remove the leading digit (always a 1)
-        binary_string.append(f'{diff:b}'[1:])
 
+# writes value into bits[start:start + length], most significant bit first
+def _write_uint(bits, start, length, value):
+    for j in range(length):
+        bits[start + j] = (value >> (length - 1 - j)) & 1
 
-    # get total length of strings, calculate offset to make it a multiple of 8
-    # add 3 to account for the bits needed to store the offset
-    total_len = sum(len(s) for s in binary_string) + 3
 
+# encodes a list of prices in cents into the version 1 compressed format
+# check FORMAT.md inside of app/data/ for how the compression works
+# the bits are laid out directly in a NumPy array and packed at the end, no '0'/'1' strings are built
+def encode_prices(prices):
+    prices = np.asarray(prices, dtype=np.int64)
+    if len(prices) == 0 or len(prices) >= 1 << COUNT_BITS:
+        raise ValueError(f'cannot encode {len(prices)} entries in version 1, it holds 1 to {(1 << COUNT_BITS) - 1}'
+                         f' (use version 2 for longer series)')
+    if prices[0] < 0 or prices[0] >= 1 << INITIAL_PRICE_BITS:
+        raise ValueError(f'initial price of {prices[0]} cents does not fit in {INITIAL_PRICE_BITS} bits')
+
+    entries = _encode_entries(prices)
+
+    # pad the end so the file is a whole number of bytes
+    total_len = HEADER_BITS + len(entries)
     offset = (8 - (total_len % 8)) % 8
-    binary_string[0] = f'{offset:03b}'
-    binary_string.append('0' * offset)
-    total_len = sum(len(s) for s in binary_string)
-
-
-    binary_string = "".join(binary_string)
-
-
-    ba = bitarray(binary_string)
-    with open(f'../compressed_data/{fileName}.bin', 'wb') as f:
-        ba.tofile(f)
-
-
-# uncompresses a compressed file; returns an array of numPoints values starting at index start
-def uncompress_data(fileName, start, numPoints):
-    filePath = f'app/data/compressed_data/{fileName}'
-    ba = bitarray()
-    with open(filePath, 'rb') as f:
-        ba.fromfile(f)
-
-    ba = ba.to01()
-
-    # read in the offset and trim it off
-    offset = int(ba[:3], 2)
 
-    ba = ba[3:len(ba) - offset]
+    bits = np.zeros(total_len + offset, dtype=np.uint8)
+    _write_uint(bits, 0, OFFSET_BITS, offset)
+    _write_uint(bits, OFFSET_BITS, COUNT_BITS, len(prices))
+    _write_uint(bits, OFFSET_BITS + COUNT_BITS, INITIAL_PRICE_BITS, int(prices[0]))
+    bits[HEADER_BITS:total_len] = entries
+
+    return np.packbits(bits).tobytes()
+
+
+# encodes several columns of the same length into the version 2 compressed format
+# columns is a dict of column name -> values (prices in cents, volume as a plain count); close is required
+def encode_columns(columns):
+    if "close" not in columns:
+        raise ValueError("version 2 files always store the close column")
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f'unknown columns: {", ".join(sorted(unknown))}')
+
+    count = len(columns["close"])
+    if count == 0 or count >= 1 << 32:
+        raise ValueError(f'cannot encode {count} entries in version 2, it holds 1 to {(1 << 32) - 1}')
+
+    header = np.zeros(1, dtype=V2_HEADER_DTYPE)
+    header["magic"] = V2_MAGIC
+    header["version"] = V2_VERSION
+    header["columns"] = sum(COLUMN_FLAGS[column] for column in columns)
+    header["count"] = count
+
+    parts = [header.tobytes()]
+    for column in COLUMNS:
+        if column not in columns:
+            continue
+        values = np.asarray(columns[column], dtype=np.int64)
+        if len(values) != count:
+            raise ValueError(f'column {column} has {len(values)} entries, expected {count}')
 
+        stream = np.int64(values[0]).astype("<i8").tobytes() + np.packbits(_encode_entries(values)).tobytes()
+        parts.append(np.uint32(len(stream)).astype("<u4").tobytes())
+        parts.append(stream)
 
-    ba = ba[16:]
+    return b"".join(parts)
 
-    prices = []
 
+# raw data file column for each compressed column
+RAW_COLUMNS = {"close": "<CLOSE>", "open": "<OPEN>", "high": "<HIGH>", "low": "<LOW>", "volume": "<VOL>"}
 
-    # read in initial value
-    prev_value = Decimal(str(int(ba[:27], 2) / 100)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    num_processed = 1
 
-    if start == 0:
-        prices.append(prev_value)
+# reads the closing prices (in cents) out of a raw data file
+def read_raw_prices(filePath):
+    return read_raw_columns(filePath, ["close"])["close"]
 
-    # current index
-    i = 27
 
-    while i < len(ba):
-        if len(prices) >= numPoints:
-            break
+# reads columns out of a raw data file; prices are converted to cents, volume is kept as an integer count
+def read_raw_columns(filePath, columns):
+    data = pd.read_csv(filePath, dtype={RAW_COLUMNS[column]: str for column in columns})
+    values = {}
+    for column in columns:
+        raw = data[RAW_COLUMNS[column]].to_list()
+        if column == "volume":
+            values[column] = [int(Decimal(num)) for num in raw]
+        else:
+            values[column] = [to_cents(num) for num in raw]
+    return values
 
-        bits_to_read = int(ba[i: i + 5], 2)
-        i += 5
 
-        num_processed += 1
+# compresses a raw data file into output_dir/<name>.bin and writes its seek index next to it
+# version 1 stores close prices only; version 2 stores close plus any of open / high / low / volume given in columns
+# if verify is set, the encoded file is decoded again and compared to the source values before anything is written
+# both files are written atomically, so a crash or a failed verification leaves the previous outputs in place
+# returns (file name, number of entries, raw size in bytes, compressed size in bytes, verified)
+def compress_file(filePath, output_dir, verify=True, version=1, columns=("close",)):
+    fileName = os.path.basename(filePath)
+    columns = ["close"] + [column for column in columns if column != "close"]
+    if version == 1 and columns != ["close"]:
+        raise ValueError("version 1 files only store close prices")
 
-        # no change in price, continue
-        if bits_to_read == 0:
-            if num_processed >= start:
-                prices.append(prev_value)
-            continue
+    values = read_raw_columns(filePath, columns)
+    encoded = encode_prices(values["close"]) if version == 1 else encode_columns(values)
 
-        # read in bit for positive/negative change
-        bit_sign = ba[i]
-        i += 1
-        sign = -1 if bit_sign == "0" else 1
+    verified = False
+    if verify:
+        for column in columns:
+            if not np.array_equal(decode_prices(encoded, column), np.asarray(values[column], dtype=np.int64)):
+                raise ValueError(f'{fileName} did not round-trip: decoded {column} values differ from the source')
+        verified = True
+    index = encode_index(encoded)
 
-        # read in the next bits_to_read bytes for the difference
-        # add the 1 back in 
-        diff = Decimal(str(sign * int("1" + ba[i : i + bits_to_read - 1], 2))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        i += bits_to_read - 1
+    write_atomic(f'{output_dir}/{fileName}.bin', encoded)
+    write_atomic(index_path(f'{fileName}.bin', output_dir), index)
 
-        if num_processed >= start:
-            prices.append(prev_value + diff / 100)
+    return fileName, len(values["close"]), os.path.getsize(filePath), len(encoded), verified
 
-        prev_value = prev_value + diff / 100
-    return prices
 
+# compresses file down
+# check FORMAT.md inside of app/data/ for how the compression works
+def compress_data(fileName):
+    compress_file(f'{RAW_DATA_DIR}/{fileName}', COMPRESSED_DATA_DIR)
 
-# process_data("aapl.us.txt")
-# compress_data("aapl.us.txt")
-# uncompress_data("aapl.us.txt")
 
-# files = [f for f in os.listdir("app/data/compressed_data") if os.path.isfile(os.path.join("app/data/compressed_data", f))]
+# uncompresses a compressed file (of either format version); returns a list of numPoints prices starting at index start
+def uncompress_data(fileName, start, numPoints):
+    return [Decimal(int(cents)).scaleb(-2) for cents in decode_window(read_compressed(fileName), start, numPoints)]
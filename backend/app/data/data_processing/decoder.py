@@ -0,0 +1,370 @@
+import os
+import numpy as np
+
+'''
+Vectorized decoder for the compressed price format (see FORMAT.md inside of app/data/)
+
+Works directly on the packed bytes instead of building a '0'/'1' string: the file is bit-unpacked into a NumPy
+array, the start of every entry is found with pointer doubling, the deltas are read out column by column and the
+prices are rebuilt with a cumulative sum. All prices are returned as int64 cents.
+
+Both format versions are supported: version 1 files (close prices only, 16-bit entry count) and version 2 files
+(magic/version header, 32-bit entry count, optional open/high/low/volume columns). Every function works on the close
+column unless a column is given.
+'''
+
+COMPRESSED_DATA_DIR = "app/data/compressed_data"
+
+OFFSET_BITS = 3
+COUNT_BITS = 16
+INITIAL_PRICE_BITS = 27
+HEADER_BITS = OFFSET_BITS + COUNT_BITS + INITIAL_PRICE_BITS
+WIDTH_BITS = 5
+
+# version 2: 12 byte header, then for each column present: stream length in bytes (uint32), initial value (int64)
+# and the delta entries, padded to a whole byte
+V2_MAGIC = b"TGPF"
+V2_VERSION = 2
+V2_HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "u1"), ("columns", "u1"), ("reserved", "<u2"),
+                            ("count", "<u4")])
+V2_STREAM_HEADER_BYTES = 4 + 8
+
+# columns in the order they are stored, with the bit that flags them in the header's column mask
+# close is always present
+COLUMNS = ("close", "open", "high", "low", "volume")
+COLUMN_FLAGS = {column: 1 << i for i, column in enumerate(COLUMNS)}
+
+# enough bytes to read the header and initial close price of either version
+HEADER_READ_BYTES = V2_HEADER_DTYPE.itemsize + V2_STREAM_HEADER_BYTES
+
+# largest possible entry: 5 width bits + 1 sign bit + 30 bits for the change
+MAX_ENTRY_BITS = WIDTH_BITS + 1 + 30
+
+# a seek index checkpoint is stored every CHECKPOINT_INTERVAL entries
+CHECKPOINT_INTERVAL = 256
+
+# checkpoint j: bit offset (from the start of the file) of the delta for entry j * interval + 1,
+# and the absolute price in cents of entry j * interval
+CHECKPOINT_DTYPE = np.dtype([("bit_offset", "<u4"), ("price", "<i8")])
+INDEX_HEADER_DTYPE = np.dtype([("interval", "<u4"), ("num_checkpoints", "<u4")])
+
+# entry starts are located ANCHOR_STRIDE = 2^ANCHOR_ROUNDS entries at a time
+ANCHOR_ROUNDS = 3
+ANCHOR_STRIDE = 1 << ANCHOR_ROUNDS
+
+
+# reads a compressed file in as raw bytes
+def read_compressed(fileName, directory=COMPRESSED_DATA_DIR):
+    with open(f'{directory}/{fileName}', 'rb') as f:
+        return f.read()
+
+
+# reads only the fixed-size header of a compressed file, returns (version, number of entries, initial price)
+def read_file_header(fileName, directory=COMPRESSED_DATA_DIR):
+    with open(f'{directory}/{fileName}', 'rb') as f:
+        return read_header(f.read(HEADER_READ_BYTES))
+
+
+# path of the seek index sidecar for a compressed file, aapl.us.txt.bin -> aapl.us.txt.idx
+def index_path(fileName, directory=COMPRESSED_DATA_DIR):
+    return f'{directory}/{fileName[:-4]}.idx'
+
+
+# reads an unsigned integer stored in bits[start:start + length] (most significant bit first)
+def _read_uint(bits, start, length):
+    value = 0
+    for bit in bits[start:start + length]:
+        value = (value << 1) | int(bit)
+    return value
+
+
+# returns the format version of a compressed file
+# version 1 files have no magic; a version 1 file would have to start with the exact bytes "TGPF" followed by
+# a 2 to be mistaken for version 2
+def format_version(buf):
+    if bytes(buf[:4]) == V2_MAGIC and len(buf) > 4 and buf[4] == V2_VERSION:
+        return V2_VERSION
+    return 1
+
+
+# returns (version, number of entries, initial close price in cents) of a compressed file
+# only the first HEADER_READ_BYTES bytes are needed
+def read_header(buf):
+    if format_version(buf) == V2_VERSION:
+        header = np.frombuffer(buf[:V2_HEADER_DTYPE.itemsize], dtype=V2_HEADER_DTYPE)[0]
+        initial_price = int(np.frombuffer(buf[V2_HEADER_DTYPE.itemsize + 4:HEADER_READ_BYTES], dtype="<i8")[0])
+        return V2_VERSION, int(header["count"]), initial_price
+
+    bits = np.unpackbits(np.frombuffer(buf[:6], dtype=np.uint8))
+    count = _read_uint(bits, OFFSET_BITS, COUNT_BITS)
+    initial_price = _read_uint(bits, OFFSET_BITS + COUNT_BITS, INITIAL_PRICE_BITS)
+    return 1, count, initial_price
+
+
+# returns the columns stored in a compressed file
+def read_columns(buf):
+    if format_version(buf) == V2_VERSION:
+        mask = int(np.frombuffer(buf[:V2_HEADER_DTYPE.itemsize], dtype=V2_HEADER_DTYPE)[0]["columns"])
+        return [column for column in COLUMNS if mask & COLUMN_FLAGS[column]]
+    return ["close"]
+
+
+# locates a column inside a compressed file
+# returns (number of entries, initial value, bit offset of the first delta entry, bit offset of the end of the entries)
+def _column_layout(buf, column="close"):
+    if format_version(buf) != V2_VERSION:
+        if column != "close":
+            raise KeyError(f'version 1 files only store close prices, not {column}')
+        bits = np.unpackbits(np.frombuffer(buf[:6], dtype=np.uint8))
+        offset = _read_uint(bits, 0, OFFSET_BITS)
+        _, count, initial_price = read_header(buf)
+        return count, initial_price, HEADER_BITS, len(buf) * 8 - offset
+
+    header = np.frombuffer(buf[:V2_HEADER_DTYPE.itemsize], dtype=V2_HEADER_DTYPE)[0]
+    mask = int(header["columns"])
+    if not mask & COLUMN_FLAGS.get(column, 0):
+        raise KeyError(f'column {column} is not stored in this file')
+
+    # skip over the streams stored before this column
+    position = V2_HEADER_DTYPE.itemsize
+    for other in COLUMNS:
+        if not mask & COLUMN_FLAGS[other]:
+            continue
+        length = int(np.frombuffer(buf[position:position + 4], dtype="<u4")[0])
+        if other == column:
+            initial_value = int(np.frombuffer(buf[position + 4:position + V2_STREAM_HEADER_BYTES], dtype="<i8")[0])
+            return int(header["count"]), initial_value, (position + V2_STREAM_HEADER_BYTES) * 8, \
+                (position + 4 + length) * 8
+        position += 4 + length
+
+
+# decodes up to num_entries delta entries from a bit array that starts at the beginning of an entry
+# returns (deltas in cents, bit position of each entry relative to the start of body)
+def _decode_deltas(body, num_entries):
+    length = len(body)
+    if num_entries <= 0 or length == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # pad so every read below stays inside the array, even for a truncated entry at the very end
+    padded = np.concatenate([body, np.zeros(MAX_ENTRY_BITS, dtype=np.uint8)])
+
+    # width of the entry that would start at each bit position
+    widths = padded[:length].astype(np.int32)
+    for j in range(1, WIDTH_BITS):
+        widths = (widths << 1) | padded[j:j + length]
+
+    # an entry with width x always takes up 5 + x bits (sign bit + x - 1 bits for the change)
+    # position length acts as the sentinel for "past the end"
+    step = np.minimum(np.arange(length, dtype=np.int32) + WIDTH_BITS + widths, length)
+    step = np.append(step, np.int32(length))
+
+    # pointer doubling: jump[p] is the position of the entry ANCHOR_STRIDE entries after the one starting at p
+    jump = step
+    for _ in range(ANCHOR_ROUNDS):
+        jump = jump[jump]
+
+    # walk the anchors (one every ANCHOR_STRIDE entries), then fill in the entries between them in bulk
+    num_anchors = -(-num_entries // ANCHOR_STRIDE)
+    anchors = np.empty(num_anchors, dtype=np.int32)
+    position = 0
+    for i in range(num_anchors):
+        anchors[i] = position
+        position = int(jump[position])
+
+    columns = [anchors]
+    for _ in range(ANCHOR_STRIDE - 1):
+        columns.append(step[columns[-1]])
+    starts = np.stack(columns, axis=1).ravel()[:num_entries]
+    starts = starts[starts < length]
+
+    entry_widths = widths[starts]
+    signs = padded[starts + WIDTH_BITS]
+
+    # the leading 1 of every change is implicit, read the remaining width - 1 bits
+    magnitudes = (entry_widths > 0).astype(np.int64)
+    max_width = int(entry_widths.max()) if len(entry_widths) else 0
+    for j in range(max_width - 1):
+        valid = j < entry_widths - 1
+        bits = padded[starts + WIDTH_BITS + 1 + j]
+        magnitudes = np.where(valid, (magnitudes << 1) | bits, magnitudes)
+
+    deltas = np.where(signs == 1, magnitudes, -magnitudes)
+    return deltas, starts
+
+
+# rebuilds absolute prices from a starting price and the deltas that follow it
+def _rebuild_prices(first_price, deltas):
+    prices = np.empty(len(deltas) + 1, dtype=np.int64)
+    prices[0] = first_price
+    np.cumsum(deltas, out=prices[1:])
+    prices[1:] += first_price
+    return prices
+
+
+# unpacks the delta entries of a column, returns (number of entries, initial value, start bit, entry bits)
+def _unpack_body(buf, column="close"):
+    count, initial_value, start_bit, end_bit = _column_layout(buf, column)
+    bits = np.unpackbits(np.frombuffer(buf, dtype=np.uint8))
+    return count, initial_value, start_bit, bits[start_bit:end_bit]
+
+
+# decodes every value of a column (close prices by default), returns an int64 array (prices are in cents)
+def decode_prices(buf, column="close"):
+    count, initial_price, _, body = _unpack_body(buf, column)
+
+    deltas, _ = _decode_deltas(body, count - 1)
+
+    prices = _rebuild_prices(initial_price, deltas)
+    return prices
+
+
+# decodes every column stored in a compressed file, returns a dict of column -> int64 array
+def decode_columns(buf):
+    return {column: decode_prices(buf, column) for column in read_columns(buf)}
+
+
+# builds the seek index of the close column: one checkpoint every interval entries
+def build_index(buf, interval=CHECKPOINT_INTERVAL):
+    count, initial_price, start_bit, body = _unpack_body(buf)
+
+    deltas, starts = _decode_deltas(body, count - 1)
+    prices = _rebuild_prices(initial_price, deltas)
+
+    # the delta for entry e (e >= 1) starts at starts[e - 1]; the last checkpoint may point at the end of the data
+    starts = np.append(starts, len(body)) + start_bit
+
+    entries = np.arange(0, len(prices), interval)
+    index = np.empty(len(entries), dtype=CHECKPOINT_DTYPE)
+    index["bit_offset"] = starts[entries]
+    index["price"] = prices[entries]
+    return index
+
+
+# returns the seek index sidecar of a compressed file (its raw bytes), as bytes
+def encode_index(buf, interval=CHECKPOINT_INTERVAL):
+    index = build_index(buf, interval)
+
+    header = np.zeros(1, dtype=INDEX_HEADER_DTYPE)
+    header["interval"] = interval
+    header["num_checkpoints"] = len(index)
+    return header.tobytes() + index.tobytes()
+
+
+# writes data to path atomically: readers either see the old file or the complete new one
+def write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# writes the seek index sidecar of a compressed file
+def write_index(fileName, directory=COMPRESSED_DATA_DIR, interval=CHECKPOINT_INTERVAL):
+    write_atomic(index_path(fileName, directory), encode_index(read_compressed(fileName, directory), interval))
+
+
+# reads the seek index sidecar of a compressed file, returns (interval, checkpoints)
+# returns None if the file has no index
+def read_index(fileName, directory=COMPRESSED_DATA_DIR):
+    try:
+        with open(index_path(fileName, directory), 'rb') as f:
+            buf = f.read()
+    except FileNotFoundError:
+        return None
+    return parse_index(buf)
+
+
+# parses the raw bytes of a seek index, returns (interval, checkpoints)
+def parse_index(buf):
+    header = np.frombuffer(buf, dtype=INDEX_HEADER_DTYPE, count=1)[0]
+    checkpoints = np.frombuffer(buf, dtype=CHECKPOINT_DTYPE, count=int(header["num_checkpoints"]),
+                                offset=INDEX_HEADER_DTYPE.itemsize)
+    return int(header["interval"]), checkpoints
+
+
+# returns an int64 array of numPoints close prices (in cents) starting at index start
+# if a seek index (interval, checkpoints) is given, decoding starts at the closest checkpoint at or before start,
+# so the cost only depends on numPoints and the checkpoint interval, not on where the window is
+def decode_window(buf, start, numPoints, index=None):
+    if index is None:
+        prices = decode_prices(buf)
+        return prices[start:start + numPoints]
+
+    count, _, _, data_end_bit = _column_layout(buf)
+    interval, checkpoints = index
+
+    checkpoint = min(start // interval, len(checkpoints) - 1)
+    first_entry = checkpoint * interval
+    bit_offset = int(checkpoints[checkpoint]["bit_offset"])
+    price = int(checkpoints[checkpoint]["price"])
+
+    # number of deltas to read after the checkpoint entry
+    num_deltas = min(start + numPoints, count) - 1 - first_entry
+    if num_deltas <= 0:
+        return np.full(max(min(numPoints, count - start), 0), price, dtype=np.int64)
+
+    prices, _ = _decode_from(buf, bit_offset, price, num_deltas, data_end_bit)
+    return prices[start - first_entry:start - first_entry + numPoints]
+
+
+# decodes num_deltas entries starting at bit_offset, where the entry before them has the given price
+# returns (prices, starting with the given price, bit offset right after the last decoded entry)
+def _decode_from(buf, bit_offset, price, num_deltas, data_end_bit):
+    # only unpack the bytes that can hold these entries
+    end_bit = min(bit_offset + num_deltas * MAX_ENTRY_BITS, data_end_bit)
+    bits = np.unpackbits(np.frombuffer(buf[bit_offset // 8:(end_bit + 7) // 8], dtype=np.uint8))
+    body = bits[bit_offset % 8:end_bit - (bit_offset // 8) * 8]
+
+    deltas, starts = _decode_deltas(body, num_deltas)
+    if len(deltas) == 0:
+        return _rebuild_prices(price, deltas), bit_offset
+
+    # an entry takes 5 bits plus as many bits as its change needs
+    last_width = abs(int(deltas[-1])).bit_length()
+    return _rebuild_prices(price, deltas), bit_offset + int(starts[-1]) + WIDTH_BITS + last_width
+
+
+# uncompresses a compressed file; returns an array of numPoints prices in cents starting at index start
+def uncompress_window(fileName, start, numPoints):
+    return decode_window(read_compressed(fileName), start, numPoints, read_index(fileName))
+
+
+'''
+StreamDecoder
+
+Resumable decoder for the close prices of a single compressed file. Keeps the position of the next entry (bit
+offset and price), so reading the entries that follow continues where the last read stopped instead of decoding
+from the start of the file again. seek() jumps anywhere using the seek index.
+'''
+class StreamDecoder():
+    def __init__(self, buf, index):
+        self._buf = buf
+        self._interval, self._checkpoints = index
+        self.count, _, _, self._data_end_bit = _column_layout(buf)
+        self.seek(0)
+
+    # moves to entry, so the next read() starts with it
+    def seek(self, entry):
+        checkpoint = min(entry // self._interval, len(self._checkpoints) - 1)
+
+        # state: price of the entry at position, and bit offset of the change for the entry after it
+        self.position = checkpoint * self._interval
+        self._price = int(self._checkpoints[checkpoint]["price"])
+        self._bit_offset = int(self._checkpoints[checkpoint]["bit_offset"])
+
+        if entry > self.position:
+            self.read(entry - self.position)
+
+    # returns the next numPoints prices (fewer at the end of the file) in cents, and moves past them
+    def read(self, numPoints):
+        numPoints = max(min(numPoints, self.count - self.position), 0)
+        if numPoints == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        # also decode the entry right after the window, it becomes the new current entry
+        num_deltas = min(numPoints, self.count - 1 - self.position)
+        prices, self._bit_offset = _decode_from(self._buf, self._bit_offset, self._price, num_deltas,
+                                                self._data_end_bit)
+        self.position += numPoints
+        self._price = int(prices[-1])
+        return prices[:numPoints]
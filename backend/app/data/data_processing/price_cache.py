@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from app.data.data_processing.archive import get_archive
+from app.data.data_processing.decoder import decode_prices
+
+'''
+PriceSeriesCache
+
+Process-wide LRU cache of decoded price series, keyed by ticker. Each entry is the full history of a ticker as a
+read-only int64 array of cents, so any window of a cached ticker is a slice that needs no decoding at all.
+
+The cache is bounded by the total size of the cached arrays (max_bytes); the least recently used tickers are evicted
+once that is exceeded. A series larger than max_bytes on its own is returned without being cached.
+
+window() only decodes the full series of tickers that are asked for again: the first miss on a ticker decodes just
+the requested window through the ticker's seek index, a second miss (within the last MAX_MISSED missed tickers)
+decodes and caches the whole series.
+
+hits / misses / evictions are counted for every lookup, see stats()
+'''
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+# number of recently missed tickers remembered, see window()
+MAX_MISSED = 1024
+
+
+class PriceSeriesCache():
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, archive=None):
+        self.max_bytes = max_bytes
+        self._archive = archive
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+        # tickers that missed once and were only decoded in part, least recent first
+        self._missed = OrderedDict()
+
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # returns the full price series of a ticker, decoding it on a miss
+    def get(self, ticker):
+        with self._lock:
+            series = self._series.get(ticker)
+            if series is not None:
+                self._series.move_to_end(ticker)
+                self.hits += 1
+                return series
+            self.misses += 1
+
+        archive = self._archive or get_archive()
+        series = decode_prices(archive.data(ticker))
+        series.flags.writeable = False
+
+        with self._lock:
+            # another thread may have decoded the same ticker in the meantime
+            if ticker in self._series:
+                self._series.move_to_end(ticker)
+                return self._series[ticker]
+
+            if series.nbytes <= self.max_bytes:
+                self._series[ticker] = series
+                self.current_bytes += series.nbytes
+                self._evict()
+        return series
+
+    # returns numPoints prices (in cents) of ticker starting at index start
+    def window(self, ticker, start, numPoints):
+        with self._lock:
+            series = self._series.get(ticker)
+            if series is not None:
+                self._series.move_to_end(ticker)
+                self.hits += 1
+                return series[start:start + numPoints]
+
+            missed = self._missed.pop(ticker, None) is not None
+            if not missed:
+                self.misses += 1
+                self._missed[ticker] = True
+                if len(self._missed) > MAX_MISSED:
+                    self._missed.popitem(last=False)
+
+        if not missed:
+            archive = self._archive or get_archive()
+            return archive.decode_window(ticker, start, numPoints)
+        return self.get(ticker)[start:start + numPoints]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._missed.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._series),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    # drops least recently used series until the cache fits in max_bytes, caller must hold the lock
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._series:
+            _, series = self._series.popitem(last=False)
+            self.current_bytes -= series.nbytes
+            self.evictions += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# returns the process-wide price cache, sized by the PRICE_CACHE_MAX_BYTES setting
+def get_price_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from django.conf import settings
+                _cache = PriceSeriesCache(getattr(settings, "PRICE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    return _cache
@@ -0,0 +1,138 @@
+import zlib
+import numpy as np
+from .money import to_cents, from_cents
+from .order_book import BookOrder, BUY, SELL, TYPE_GOOD_FOR_DAY
+
+'''
+BotPopulation
+
+The bots of a regular game, simulated together. Instead of one object per bot, every attribute of the population is
+a NumPy array indexed by bot, so deciding what all of the bots do on a tick is a handful of vectorized operations
+no matter how many bots there are. Only the orders that actually get placed are turned into BookOrders.
+
+Each bot keeps at most one order in the book. On every tick a bot trades with probability activity; if it does, its
+previous order is cancelled and replaced by a new good for day limit order:
+side: trend followers (trend > 0) buy after the price went up and sell after it went down, contrarians (trend < 0)
+    do the opposite; noise decides when there is no clear signal
+price: around the current price; aggressive bots price through it (and trade right away), passive bots rest behind
+    it. How far from the current price a bot quotes scales with the game's volatility
+quantity: a fraction (size) of what the bot can afford, where a bot can short as many shares as its cash would buy
+
+activity, aggression and size grow with the bot's play_style (1-100); trend is drawn once from the game seed. The
+random draws of a tick depend only on the game seed and the tick, so a game replays identically.
+
+Bot orders only exist in the engine (their ref is None). Fills involving bots are applied to cash / position here
+instead of in the database; the database copy of the bots is brought up to date whenever the game's state is
+flushed (flush(), settlement.py).
+'''
+
+# how strongly a relative price move feeds into trend following / mean reversion
+MOMENTUM_GAIN = 200.0
+
+
+class BotPopulation():
+    def __init__(self, player_ids, cash, positions, play_styles, seed, volatility):
+        self.player_ids = list(player_ids)
+        self._index = {player_id: i for i, player_id in enumerate(self.player_ids)}
+        self._seed = zlib.crc32(str(seed).encode())
+
+        # cash in cents and shares held
+        self.cash = np.asarray(cash, dtype=np.int64)
+        self.positions = np.asarray(positions, dtype=np.int64)
+
+        style = (np.asarray(play_styles, dtype=np.float64).clip(1, 100) - 1) / 99
+        self.activity = 0.05 + 0.45 * style
+        self.aggression = style
+        self.size = 0.02 + 0.18 * style
+        self.trend = np.random.default_rng(self._seed).uniform(-1, 1, len(self.player_ids))
+
+        # maximum distance of a quote from the current price, as a fraction of it
+        self.spread = max(volatility, 1) / 1000
+
+        # each bot's order in the book, or None
+        self.live_orders = [None] * len(self.player_ids)
+        self._next_order_id = 0
+
+        # whether cash / positions changed since the last flush
+        self.dirty = False
+
+    # builds the population from the bot Players of a game; stock_id is the key of the game's stock in owned_stocks
+    @classmethod
+    def from_players(cls, players, stock_id, seed, volatility):
+        players = list(players)
+        return cls([player.id for player in players],
+                   [to_cents(player.money) for player in players],
+                   [player.owned_stocks.get(stock_id, 0) for player in players],
+                   [player.play_style for player in players],
+                   seed, volatility)
+
+    def __len__(self):
+        return len(self.player_ids)
+
+    def __contains__(self, player_id):
+        return player_id in self._index
+
+    # decides what every bot does at tick, given the current and previous price in cents
+    # returns (indices of the bots that trade, sides, limit prices in cents, quantities)
+    def decide(self, tick, price, previous_price):
+        n = len(self.player_ids)
+        rng = np.random.default_rng([self._seed, tick])
+
+        momentum = (price - previous_price) / previous_price if previous_price else 0.0
+        signal = self.trend * momentum * MOMENTUM_GAIN + rng.standard_normal(n)
+        sides = np.where(signal >= 0, BUY, SELL)
+
+        offset = self.spread * (self.aggression - 0.5 + rng.normal(0, 0.5, n))
+        prices = np.maximum(np.rint(price * (1 + sides * offset)), 1).astype(np.int64)
+
+        affordable = np.maximum(self.cash, 0) // prices
+        capacity = np.where(sides == BUY, affordable, self.positions + affordable)
+        quantities = np.floor(capacity * self.size).astype(np.int64)
+
+        trading = (rng.random(n) < self.activity) & (quantities > 0)
+        bots = np.flatnonzero(trading)
+        return bots, sides[bots], prices[bots], quantities[bots]
+
+    # requotes the bots that trade at tick and submits their orders to book; returns the fills produced
+    # fills are not applied to the bots yet, see apply_fills()
+    def step(self, book, tick, price, previous_price, day):
+        bots, sides, prices, quantities = self.decide(tick, price, previous_price)
+
+        fills = []
+        for i, side, limit, quantity in zip(bots.tolist(), sides.tolist(), prices.tolist(), quantities.tolist()):
+            previous = self.live_orders[i]
+            if previous is not None and previous.active:
+                book.cancel(previous.id)
+
+            self._next_order_id += 1
+            order = BookOrder(("bot", self._next_order_id), self.player_ids[i], side, limit, quantity,
+                              TYPE_GOOD_FOR_DAY, day)
+            self.live_orders[i] = order
+            fills.extend(book.submit(order))
+        return fills
+
+    # applies the bot side of fills to cash and positions
+    def apply_fills(self, fills):
+        for fill in fills:
+            cost = fill.price * fill.quantity
+            buyer = self._index.get(fill.buy_player_id)
+            if buyer is not None:
+                self.cash[buyer] -= cost
+                self.positions[buyer] += fill.quantity
+                self.dirty = True
+            seller = self._index.get(fill.sell_player_id)
+            if seller is not None:
+                self.cash[seller] += cost
+                self.positions[seller] -= fill.quantity
+                self.dirty = True
+
+    # adds amounts (cents, one per bot) to the bots' cash
+    def add_cash(self, amounts):
+        if len(amounts):
+            self.cash += amounts
+            self.dirty = True
+
+    # current cash (as a Decimal) and position of every bot, as (player id, money, shares)
+    def state(self):
+        return [(player_id, from_cents(cash), int(position))
+                for player_id, cash, position in zip(self.player_ids, self.cash.tolist(), self.positions.tolist())]
@@ -0,0 +1,299 @@
+import os
+import pickle
+import struct
+import uuid
+import zlib
+from collections import namedtuple
+from django.conf import settings
+
+'''
+EventLog
+
+Append-only binary log of a regular game, one per game, plus a file of periodic snapshots of its engine state.
+
+The log records the inputs of the game's engine, the players' orders and cancels and every tick's price, which
+(together with the game seed) is all the engine needs to get to the same state again, and its outputs, fills and
+interest, so a replay can check it did the same thing as the live game. Bots and market makers are not logged: they
+are driven by the seed and the ticks.
+
+Every EventLog.snapshot() pickles the whole EngineState (state.py) together with the log offset it corresponds to.
+Rebuilding the state at any tick starts from the latest snapshot at or before it and only reads the log from there,
+see replay.py; the game writes a snapshot every EVENT_LOG_SNAPSHOT_INTERVAL ticks, so a replay never covers more
+than that many ticks.
+
+Log file: 4 bytes magic "TGEL", 1 byte version, then records. A record is one byte of kind followed by the fixed
+size, little-endian fields of that kind (see RECORDS); ids are UUIDs as 16 raw bytes, all zero for no id, prices and
+cash are cents.
+EVENT_TICK: tick, price
+EVENT_ORDER: order id, player id, side, limit price (-1 for a market order), quantity, type, trading day
+EVENT_CANCEL: order id
+EVENT_FILL: buy order id, sell order id, buyer id, seller id, price, quantity, tick (order ids of engine-only orders
+    are zero)
+EVENT_INTEREST: player id, trading day, amount (negative when the player paid interest)
+
+Snapshot file: 4 bytes magic "TGES", 1 byte version, then snapshots. A snapshot is a header (tick, log offset,
+length) followed by length bytes of zlib compressed pickle.
+
+Durability: every append is flushed to the operating system right away, so a crash of the server process loses
+nothing that was logged. Both files are fsynced when a snapshot is written, and the log when the game's state is
+flushed to the database (sync(), see HotState in models.py); a crash of the machine can lose the events after the
+last of these. A record cut off by a crash is dropped when the log is opened again.
+'''
+
+EVENT_TICK = 1
+EVENT_ORDER = 2
+EVENT_CANCEL = 3
+EVENT_FILL = 4
+EVENT_INTEREST = 5
+
+RECORDS = {
+    EVENT_TICK: struct.Struct("<qq"),
+    EVENT_ORDER: struct.Struct("<16s16sbqqBi"),
+    EVENT_CANCEL: struct.Struct("<16s"),
+    EVENT_FILL: struct.Struct("<16s16s16s16sqqq"),
+    EVENT_INTEREST: struct.Struct("<16siq"),
+}
+
+LOG_MAGIC = b"TGEL"
+SNAPSHOT_MAGIC = b"TGES"
+# bumped whenever the layout of the records or of a pickled EngineState changes; files of another version are not
+# read, games with one get a new log (GameManager.get_engine, models.py)
+VERSION = 3
+HEADER_SIZE = len(LOG_MAGIC) + 1
+SNAPSHOT_HEADER = struct.Struct("<qqq")
+
+DEFAULT_SNAPSHOT_INTERVAL = 100
+
+# bytes read at a time when reading the log
+READ_SIZE = 1 << 20
+
+NO_ID = bytes(16)
+
+# a decoded record: kind, its fields (ids as UUIDs or None), and the log offset right after it
+Event = namedtuple("Event", ["kind", "fields", "end"])
+
+
+class EventLogError(Exception):
+    pass
+
+
+# directory the event logs are kept in, from the EVENT_LOG_DIR setting
+def event_log_dir():
+    return getattr(settings, "EVENT_LOG_DIR", os.path.join(settings.BASE_DIR, "event_logs"))
+
+
+# ticks between two snapshots, from the EVENT_LOG_SNAPSHOT_INTERVAL setting
+def snapshot_interval():
+    return getattr(settings, "EVENT_LOG_SNAPSHOT_INTERVAL", DEFAULT_SNAPSHOT_INTERVAL)
+
+
+# deletes the event log and snapshots of a game, if there are any
+def delete_event_log(game_id, directory=None):
+    log_path, snapshot_path = _paths(directory or event_log_dir(), game_id)
+    for path in (log_path, snapshot_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _paths(directory, game_id):
+    return os.path.join(directory, f'{game_id}.log'), os.path.join(directory, f'{game_id}.snapshots')
+
+
+def _id_bytes(value):
+    if value is None:
+        return NO_ID
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(str(value))
+    return value.bytes
+
+
+# engine-only order ids (tuples, see BotPopulation / MarketMakers) are not UUIDs and are logged as no id
+def _order_id_bytes(value):
+    return _id_bytes(value) if value is not None and not isinstance(value, tuple) else NO_ID
+
+
+def _decode_id(raw):
+    return uuid.UUID(bytes=raw) if raw != NO_ID else None
+
+
+def _encode_fill(fill):
+    return RECORDS[EVENT_FILL].pack(_order_id_bytes(fill.buy_ref), _order_id_bytes(fill.sell_ref),
+                                    _id_bytes(fill.buy_player_id), _id_bytes(fill.sell_player_id),
+                                    fill.price, fill.quantity, fill.tick)
+
+
+# decodes the fields of a record, turning raw ids back into UUIDs
+def decode(kind, raw):
+    fields = RECORDS[kind].unpack(raw)
+    return tuple(_decode_id(field) if isinstance(field, bytes) else field for field in fields)
+
+
+# the fields of a fill as they read back from the log, to compare the fills of a replay against
+def fill_fields(fill):
+    return decode(EVENT_FILL, _encode_fill(fill))
+
+
+class EventLog():
+    # read_only opens an existing log for replays only: nothing is created, written or truncated, so it is safe to
+    # read the log of a game that is running
+    def __init__(self, directory, game_id, read_only=False):
+        self.game_id = game_id
+        self.read_only = read_only
+        self.log_path, self.snapshot_path = _paths(directory, game_id)
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+
+        self._log = self._open(self.log_path, LOG_MAGIC)
+        self._snapshots = self._open(self.snapshot_path, SNAPSHOT_MAGIC)
+        self.size = self._log.seek(0, os.SEEK_END)
+
+        # (tick, log offset, position of the pickle in the snapshot file, length), oldest first
+        self.snapshot_index = self._read_snapshot_index()
+
+    # whether a game has an event log with at least one snapshot to replay from
+    @staticmethod
+    def exists(game_id, directory=None):
+        log_path, snapshot_path = _paths(directory or event_log_dir(), game_id)
+        return os.path.exists(log_path) and os.path.exists(snapshot_path) and \
+            os.path.getsize(snapshot_path) > HEADER_SIZE
+
+    def _open(self, path, magic):
+        if self.read_only:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                raise EventLogError(f'{path} does not exist')
+        else:
+            f = open(path, "ab+")
+        f.seek(0)
+        header = f.read(HEADER_SIZE)
+        if not header and not self.read_only:
+            f.write(magic + bytes([VERSION]))
+            f.flush()
+        elif header[:len(magic)] != magic or header[len(magic):] != bytes([VERSION]):
+            f.close()
+            raise EventLogError(f'{path} is not a version {VERSION} event log file')
+        return f
+
+    def _read_snapshot_index(self):
+        index = []
+        f = self._snapshots
+        end = f.seek(0, os.SEEK_END)
+        position = HEADER_SIZE
+        while position + SNAPSHOT_HEADER.size <= end:
+            f.seek(position)
+            tick, offset, length = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            if position + SNAPSHOT_HEADER.size + length > end:
+                break
+            index.append((tick, offset, position + SNAPSHOT_HEADER.size, length))
+            position += SNAPSHOT_HEADER.size + length
+
+        # a snapshot cut off by a crash is dropped (a read only log leaves it, it may still be being written)
+        if position != end and not self.read_only:
+            f.truncate(position)
+        return index
+
+    def _append(self, data):
+        self._log.write(data)
+        self._log.flush()
+        self.size += len(data)
+
+    def tick(self, tick, price):
+        self._append(bytes([EVENT_TICK]) + RECORDS[EVENT_TICK].pack(tick, price))
+
+    # logs a player's order as it is submitted to the book (a BookOrder)
+    def order(self, order):
+        price = order.price if order.price is not None else -1
+        self._append(bytes([EVENT_ORDER]) + RECORDS[EVENT_ORDER].pack(_id_bytes(order.id), _id_bytes(order.player_id),
+                                                                      order.side, price, order.quantity,
+                                                                      order.type, order.day))
+
+    def cancel(self, order_id):
+        self._append(bytes([EVENT_CANCEL]) + RECORDS[EVENT_CANCEL].pack(_id_bytes(order_id)))
+
+    def fills(self, fills):
+        if fills:
+            kind = bytes([EVENT_FILL])
+            self._append(b"".join(kind + _encode_fill(fill) for fill in fills))
+
+    def interest(self, player_id, day, amount):
+        self._append(bytes([EVENT_INTEREST]) + RECORDS[EVENT_INTEREST].pack(_id_bytes(player_id), day, amount))
+
+    # makes everything logged so far durable
+    def sync(self):
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    # drops everything after offset (the end of a complete record), and the snapshots taken after it
+    def truncate(self, offset):
+        if offset < self.size:
+            self._log.truncate(offset)
+            self.size = offset
+
+        index = self.snapshot_index
+        kept = [snapshot for snapshot in index if snapshot[1] <= offset]
+        if len(kept) < len(index):
+            _, _, position, _ = index[len(kept)]
+            self._snapshots.truncate(position - SNAPSHOT_HEADER.size)
+            self._snapshots.flush()
+            self.snapshot_index = kept
+
+    # empties the log and its snapshots, the game starts a new log from its current state
+    def reset(self):
+        for f in (self._log, self._snapshots):
+            f.truncate(HEADER_SIZE)
+            f.flush()
+        self.size = HEADER_SIZE
+        self.snapshot_index = []
+
+    # stores state (an EngineState) as of the current end of the log, and makes both files durable
+    def snapshot(self, state):
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+        data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), 1)
+        f = self._snapshots
+        position = f.seek(0, os.SEEK_END)
+        f.write(SNAPSHOT_HEADER.pack(state.tick, self.size, len(data)))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        self.snapshot_index.append((state.tick, self.size, position + SNAPSHOT_HEADER.size, len(data)))
+
+    # returns (log offset, state) of the latest snapshot taken at or before tick (the latest one if tick is None)
+    # and at or before log offset end (if given), or None if there is none
+    def latest_snapshot(self, tick=None, end=None):
+        for snapshot_tick, offset, position, length in reversed(self.snapshot_index):
+            if (tick is None or snapshot_tick <= tick) and (end is None or offset <= end):
+                with open(self.snapshot_path, "rb") as f:
+                    f.seek(position)
+                    return offset, pickle.loads(zlib.decompress(f.read(length)))
+        return None
+
+    # reads the log from offset on, yielding an Event per record; stops at a record cut off by a crash
+    def events(self, offset=HEADER_SIZE):
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            buffer = b""
+            position = 0
+            while True:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    return
+                buffer = buffer[position:] + chunk
+                position = 0
+                while position < len(buffer):
+                    kind = buffer[position]
+                    record = RECORDS.get(kind)
+                    if record is None:
+                        raise EventLogError(f'unknown record kind {kind} at offset {offset}')
+                    end = position + 1 + record.size
+                    if end > len(buffer):
+                        break
+                    offset += 1 + record.size
+                    yield Event(kind, decode(kind, buffer[position + 1:end]), offset)
+                    position = end
+
+    def close(self):
+        self._log.close()
+        self._snapshots.close()
@@ -0,0 +1,71 @@
+import numpy as np
+from .money import RATE_SCALE, INTEREST_RATE, INTEREST_LOAN_RATE, to_cents, from_cents, interest_cents
+
+'''
+Interest
+
+Interest on the cash of every player of a regular game, accrued once per tick. Positive balances earn INTEREST_RATE
+and negative balances are charged INTEREST_LOAN_RATE (money.py); interest_cents_array() computes it for all of the
+game's balances in one vectorized pass, with the same fixed point rounding as interest_cents().
+
+InterestLedger keeps the interest every player earned and paid per trading day, as two int64 arrays of cents
+(players x days) that live in the engine state. The Players' interest_earned / interest_paid arrays are only written
+from it when the game's state is flushed (flush(), settlement.py), for every player of the game in one bulk update,
+instead of rewriting a player's arrays on every tick.
+'''
+
+# largest balance (cents) whose product with either rate still fits in an int64
+MAX_VECTORIZED_CENTS = (np.iinfo(np.int64).max - RATE_SCALE) // max(INTEREST_RATE, INTEREST_LOAN_RATE)
+
+
+# returns the interest for one period on every balance of cash (cents), as an int64 array
+def interest_cents_array(cash):
+    cash = np.asarray(cash, dtype=np.int64)
+    if cash.size and np.abs(cash).max() > MAX_VECTORIZED_CENTS:
+        return np.array([interest_cents(int(cents)) for cents in cash.tolist()], dtype=np.int64)
+
+    rates = np.where(cash >= 0, INTEREST_RATE, INTEREST_LOAN_RATE)
+    scaled = (np.abs(cash) * rates + RATE_SCALE // 2) // RATE_SCALE
+    return np.where(cash >= 0, scaled, -scaled)
+
+
+class InterestLedger():
+    def __init__(self, player_ids, earned, paid):
+        self.player_ids = list(player_ids)
+
+        # cents earned / paid by player (rows, in player_ids order) and trading day (columns, day 1 first)
+        self.earned = np.asarray(earned, dtype=np.int64).reshape(len(self.player_ids), -1)
+        self.paid = np.asarray(paid, dtype=np.int64).reshape(len(self.player_ids), -1)
+
+        # whether anything was booked since the last flush
+        self.dirty = False
+
+    # builds the ledger from the interest_earned / interest_paid arrays of Players, for num_trading_days days
+    @classmethod
+    def from_players(cls, players, num_trading_days):
+        players = list(players)
+
+        def days(amounts):
+            cents = [to_cents(amount) for amount in amounts[:num_trading_days]]
+            return cents + [0] * (num_trading_days - len(cents))
+
+        return cls([player.id for player in players],
+                   [days(player.interest_earned) for player in players],
+                   [days(player.interest_paid) for player in players])
+
+    @property
+    def num_trading_days(self):
+        return self.earned.shape[1]
+
+    # books one tick of interest (cents per player, in player_ids order, negative when paid) on trading day
+    def book(self, amounts, day):
+        if not 1 <= day <= self.num_trading_days:
+            return
+        self.earned[:, day - 1] += np.maximum(amounts, 0)
+        self.paid[:, day - 1] -= np.minimum(amounts, 0)
+        self.dirty = True
+
+    # interest earned and paid (as Decimals) on every day, as (player id, earned per day, paid per day)
+    def state(self):
+        return [(player_id, [from_cents(cents) for cents in earned], [from_cents(cents) for cents in paid])
+                for player_id, earned, paid in zip(self.player_ids, self.earned.tolist(), self.paid.tolist())]
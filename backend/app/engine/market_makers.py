@@ -0,0 +1,145 @@
+import zlib
+import numpy as np
+from .money import to_cents, from_cents
+from .order_book import BookOrder, BUY, SELL, TYPE_GOOD_TIL_CANCELLED
+
+'''
+MarketMakers
+
+The market makers of a regular game. Every market maker keeps one bid and one ask in the book, quoted around a
+reservation price derived from the current price:
+spread: the distance between bid and ask scales with the game's volatility (GameSettings.volatility, in tenths of a
+    percent of the price), times a per market maker width drawn once from the game seed
+skew: a market maker holding inventory shifts both quotes against it (long -> lower quotes, to sell; short -> higher
+    quotes, to buy), by up to half its spread at max_inventory
+size: each side quotes quote_size shares, reduced on the side that would push inventory past max_inventory
+
+Like BotPopulation, the state of all market makers is kept in NumPy arrays and every quote of a tick is computed in
+one vectorized pass. Quotes are updated in place with OrderBook.amend(): a quote whose price and size did not change
+is left alone (keeping its time priority), and a new order is only submitted once a quote has been filled completely.
+
+Market makers' cash and inventory live in memory while the game runs and are written back to their Players when the
+game's state is flushed (flush(), settlement.py), together with the bots.
+'''
+
+# fraction of a market maker's starting cash quoted on each side, and the inventory (in multiples of the quote size)
+# at which it stops quoting on the side that would grow it further
+QUOTE_FRACTION = 0.05
+MAX_INVENTORY_QUOTES = 4
+
+
+class MarketMakers():
+    def __init__(self, player_ids, cash, inventory, seed, volatility, price):
+        self.player_ids = list(player_ids)
+        self._index = {player_id: i for i, player_id in enumerate(self.player_ids)}
+
+        # cash in cents and shares held
+        self.cash = np.asarray(cash, dtype=np.int64)
+        self.inventory = np.asarray(inventory, dtype=np.int64)
+
+        rng = np.random.default_rng(zlib.crc32(f'{seed}:market_makers'.encode()))
+        self.width = rng.uniform(0.5, 1.5, len(self.player_ids))
+        self.spread = max(volatility, 1) / 1000
+
+        # sized on the price when the population is created
+        self.quote_size = np.maximum(self.cash * QUOTE_FRACTION // max(price, 1), 1).astype(np.int64)
+        self.max_inventory = self.quote_size * MAX_INVENTORY_QUOTES
+
+        # each market maker's bid and ask in the book, or None
+        self.bids = [None] * len(self.player_ids)
+        self.asks = [None] * len(self.player_ids)
+        self._next_order_id = 0
+
+        # whether cash / inventory changed since the last flush
+        self.dirty = False
+
+    # builds the market makers from their Players; stock_id is the key of the game's stock in owned_stocks
+    @classmethod
+    def from_players(cls, players, stock_id, seed, volatility, price):
+        players = list(players)
+        return cls([player.id for player in players],
+                   [to_cents(player.money) for player in players],
+                   [player.owned_stocks.get(stock_id, 0) for player in players],
+                   seed, volatility, price)
+
+    def __len__(self):
+        return len(self.player_ids)
+
+    def __contains__(self, player_id):
+        return player_id in self._index
+
+    # computes every market maker's quotes around price (cents)
+    # returns (bid prices, bid sizes, ask prices, ask sizes), a size of 0 means no quote on that side
+    def quotes(self, price):
+        half_spread = np.maximum(price * self.spread * self.width / 2, 1)
+        skew = half_spread * self.inventory / self.max_inventory
+        reservation = price - skew
+
+        bid_prices = np.maximum(np.floor(reservation - half_spread), 1).astype(np.int64)
+        ask_prices = np.maximum(np.ceil(reservation + half_spread), bid_prices + 1).astype(np.int64)
+        bid_sizes = np.clip(self.max_inventory - self.inventory, 0, self.quote_size)
+        ask_sizes = np.clip(self.max_inventory + self.inventory, 0, self.quote_size)
+        return bid_prices, bid_sizes, ask_prices, ask_sizes
+
+    # moves every market maker's quotes to the current price; returns the fills produced
+    def step(self, book, price):
+        bid_prices, bid_sizes, ask_prices, ask_sizes = self.quotes(price)
+
+        fills = []
+        for i in range(len(self.player_ids)):
+            bid = (self.bids, BUY, i, int(bid_prices[i]), int(bid_sizes[i]))
+            ask = (self.asks, SELL, i, int(ask_prices[i]), int(ask_sizes[i]))
+            # move the quote that gets out of the way first, so a market maker never trades with itself
+            old_ask = self.asks[i]
+            first, second = (ask, bid) if old_ask is not None and bid[3] >= old_ask.price else (bid, ask)
+            fills.extend(self._quote(book, *first))
+            fills.extend(self._quote(book, *second))
+        return fills
+
+    # puts the quote of market maker i on one side of the book at price for size shares
+    def _quote(self, book, quotes, side, i, price, size):
+        order = quotes[i]
+        if order is not None and order.id in book.orders:
+            order = book.orders[order.id]
+            if order.price == price and order.remaining == size:
+                return []
+            fills = book.amend(order.id, price, size)
+            quotes[i] = book.orders.get(order.id)
+            return fills
+
+        quotes[i] = None
+        if size == 0:
+            return []
+        self._next_order_id += 1
+        order = BookOrder(("mm", self._next_order_id), self.player_ids[i], side, price, size,
+                          TYPE_GOOD_TIL_CANCELLED)
+        fills = book.submit(order)
+        if order.active:
+            quotes[i] = order
+        return fills
+
+    # applies the market makers' side of fills to cash and inventory
+    def apply_fills(self, fills):
+        for fill in fills:
+            cost = fill.price * fill.quantity
+            buyer = self._index.get(fill.buy_player_id)
+            if buyer is not None:
+                self.cash[buyer] -= cost
+                self.inventory[buyer] += fill.quantity
+                self.dirty = True
+            seller = self._index.get(fill.sell_player_id)
+            if seller is not None:
+                self.cash[seller] += cost
+                self.inventory[seller] -= fill.quantity
+                self.dirty = True
+
+    # adds amounts (cents, one per market maker) to the market makers' cash
+    def add_cash(self, amounts):
+        if len(amounts):
+            self.cash += amounts
+            self.dirty = True
+
+    # current cash (as a Decimal) and inventory of every market maker, as (player id, money, shares)
+    def state(self):
+        return [(player_id, from_cents(cash), int(inventory))
+                for player_id, cash, inventory in zip(self.player_ids, self.cash.tolist(), self.inventory.tolist())]
@@ -0,0 +1,46 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+'''
+Money helpers
+
+Inside the engine, prices and cash are plain ints holding cents, so tick processing and decoding never allocate
+Decimals. Conversion to and from Decimal only happens at the edges: model DecimalFields, request data and responses.
+'''
+
+CENT = Decimal("0.01")
+
+# base interest rate: 10%
+# base interest rate for a loan: 18%
+# assuming 365 days per year, these are the interest rates per day, as fixed point integers scaled by RATE_SCALE
+RATE_SCALE = 10**12
+INTEREST_RATE = round(((1 + 0.10)**(1/365) - 1) * RATE_SCALE)
+INTEREST_LOAN_RATE = round(((1 + 0.18)**(1/365) - 1) * RATE_SCALE)
+
+
+# converts a Decimal, string, int or float amount of dollars to cents, rounding half up
+def to_cents(amount):
+    if isinstance(amount, int):
+        return amount * 100
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+# converts cents back to a Decimal with 2 decimal places
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+# multiplies cents by a RATE_SCALE fixed point rate, rounding half away from zero
+def scale_cents(cents, rate):
+    product = abs(cents) * rate
+    scaled = (product + RATE_SCALE // 2) // RATE_SCALE
+    return scaled if cents >= 0 else -scaled
+
+
+# returns the interest for one period on a cash balance in cents
+# positive balances earn INTEREST_RATE, negative balances are charged INTEREST_LOAN_RATE
+def interest_cents(cents):
+    if cents >= 0:
+        return scale_cents(cents, INTEREST_RATE)
+    return scale_cents(cents, INTEREST_LOAN_RATE)
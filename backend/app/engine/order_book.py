@@ -0,0 +1,605 @@
+import bisect
+from collections import deque, namedtuple
+import numpy as np
+from .money import to_cents
+
+'''
+OrderBook
+
+In-memory limit order book and matching engine for a single game. Orders rest in price levels: each level is a FIFO
+queue of orders at one price together with the total quantity resting there. Each side keeps its level prices in a
+sorted list with the best price at the end, so the best bid / best ask is O(1) and walking the book from the top
+only touches levels, never individual orders. A level is removed as soon as its quantity drops to 0; cancelled and
+amended orders stay in their level's queue until matching reaches them, and are skipped there.
+
+Matching follows price-time priority: an incoming order trades against the best opposite level for as long as the
+prices cross, oldest order first within a level, and always at the resting order's price. Every trade produces a
+Fill.
+
+What happens to an order depends on its type (same values as Order.TYPE_*):
+TYPE_GOOD_TIL_CANCELLED (and TYPE_SOLO): whatever does not trade immediately rests until it is filled or cancelled
+TYPE_GOOD_FOR_DAY: like good 'til cancelled, but expires at the end of the day it was placed on (expire_day)
+TYPE_IMMEDIATE_OR_CANCEL: trades what it can immediately, the remainder is cancelled
+TYPE_FILL_OR_KILL: trades its whole quantity immediately or is cancelled without trading; feasibility is checked
+    against the cumulative quantity of the crossing levels first, so a killed order never touches the book
+TYPE_ALL_OR_NONE: trades its whole quantity at once or not at all. If it cannot be filled immediately it is parked
+    outside the visible book (it cannot be partially filled, so it is not counted as depth) and re-checked on every
+    tick (advance_tick) until it fills or is cancelled
+
+In call auction mode (auction=True) orders are not matched as they arrive. Instead they are collected until
+clear_auction(), which runs once per tick: every collected order is added to the book, a single clearing price is
+computed from the cumulative demand / supply of the (already sorted) price levels, and all crossing orders trade at
+that price in price-time priority. What is left over rests, so the book is never crossed between auctions.
+Immediate or cancel orders take part in the auction and lose whatever it does not fill; fill or kill and all or
+none orders keep their all-at-once semantics by being checked against the resting book as soon as they arrive.
+
+The book also keeps its aggregated L2 depth up to date incrementally: every change to a level's quantity records the
+level's price, and publish_deltas() (once per tick) turns those into (price, new quantity) deltas under a new depth
+version. A client takes a snapshot() once and then only applies the deltas, see deltas_since().
+
+All prices are in cents and all quantities are positive; the side of an order is BUY or SELL.
+'''
+
+BUY = 1
+SELL = -1
+
+# number of ticks of depth deltas kept for clients catching up, see deltas_since()
+DELTA_HISTORY = 64
+
+# order types, same values as Order.TYPE_*
+TYPE_SOLO = 0
+TYPE_ALL_OR_NONE = 1
+TYPE_IMMEDIATE_OR_CANCEL = 2
+TYPE_GOOD_FOR_DAY = 3
+TYPE_GOOD_TIL_CANCELLED = 4
+TYPE_FILL_OR_KILL = 5
+
+
+'''
+BookOrder
+
+Order as the matching engine sees it. ref is the id of the Order model it was created from, or None for orders that
+only live in the engine (bots, market makers). remaining is the quantity that has not been filled yet; active is
+False once the order has been filled or cancelled, so an inactive order with quantity remaining was cancelled.
+'''
+class BookOrder():
+    __slots__ = ("id", "ref", "player_id", "side", "price", "quantity", "remaining", "type", "day", "seq", "active")
+
+    def __init__(self, id, player_id, side, price, quantity, type=0, day=0, ref=None):
+        self.id = id
+        self.ref = ref
+        self.player_id = player_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.remaining = quantity
+        self.type = type
+        self.day = day
+        self.seq = 0
+        self.active = True
+
+    @property
+    def cancelled(self):
+        return not self.active and self.remaining > 0
+
+    # creates a book order from an Order model; negative quantities are sell orders
+    @classmethod
+    def from_order(cls, order):
+        side = BUY if order.quantity > 0 else SELL
+        return cls(order.id, order.from_player_id, side, to_cents(order.price), abs(order.quantity),
+                   int(order.type), order.day_placed_on, ref=order.id)
+
+
+# a single trade between a buy order and a sell order, at price (cents) for quantity shares
+Fill = namedtuple("Fill", ["buy_order_id", "sell_order_id", "buy_player_id", "sell_player_id", "price", "quantity",
+                           "tick", "buy_ref", "sell_ref"])
+
+
+class PriceLevel():
+    __slots__ = ("price", "orders", "quantity", "dead")
+
+    def __init__(self, price):
+        self.price = price
+        self.orders = deque()
+        self.quantity = 0
+
+        # number of inactive orders (cancelled, amended or filled) still in orders
+        self.dead = 0
+
+
+'''
+BookSide
+
+One side of the book: price -> PriceLevel, plus the level prices sorted so that the best price is always last
+(prices are stored as-is for bids and negated for asks). A level is removed as soon as its quantity drops to 0
+(reduce()), so every level in the book has something to trade. Inside a level, inactive orders are skipped when they
+reach the front of the queue, and the queue is compacted once they outnumber the active ones (retire()), so a level
+that bots keep requoting at stays proportional to what rests there.
+'''
+class BookSide():
+    def __init__(self, side):
+        self.side = side
+        self.levels = {}
+        self._keys = []
+
+        # prices of the levels whose quantity changed since the last OrderBook.publish_deltas()
+        self.changed = set()
+
+    def _key(self, price):
+        return price if self.side == BUY else -price
+
+    # best price level, or None if this side is empty
+    def best(self):
+        if not self._keys:
+            return None
+        return self.levels[self._key(self._keys[-1])]
+
+    # levels from the best price outwards
+    # the level being visited (or any level visited before it) may be removed while walking
+    def walk(self):
+        for key in reversed(self._keys):
+            yield self.levels[self._key(key)]
+
+    def add(self, order):
+        level = self.levels.get(order.price)
+        if level is None:
+            level = PriceLevel(order.price)
+            self.levels[order.price] = level
+            bisect.insort(self._keys, self._key(order.price))
+        level.orders.append(order)
+        level.quantity += order.remaining
+        self.changed.add(order.price)
+
+    # takes quantity off a level, removing the level once it is empty
+    # orders left in its queue are inactive (cancelled, amended or filled) and go with it
+    def reduce(self, level, quantity):
+        level.quantity -= quantity
+        self.changed.add(level.price)
+        if level.quantity <= 0 and self.levels.get(level.price) is level:
+            del self.levels[level.price]
+            key = self._key(level.price)
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    # counts an order of level that went inactive while still in the level's queue, and drops the inactive orders
+    # from the queue once they outnumber the active ones
+    def retire(self, level):
+        level.dead += 1
+        if level.dead * 2 > len(level.orders) and self.levels.get(level.price) is level:
+            level.orders = deque(order for order in level.orders if order.active)
+            level.dead = 0
+
+    # whether an incoming order at price on the other side would trade against this level price
+    def crosses(self, level_price, price):
+        if price is None:
+            return True
+        return level_price >= price if self.side == BUY else level_price <= price
+
+    # quantity an incoming order at price could trade right now, counting at most up to needed
+    def available(self, price, needed):
+        total = 0
+        for level in self.walk():
+            if not self.crosses(level.price, price):
+                break
+            total += level.quantity
+            if total >= needed:
+                break
+        return total
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class OrderBook():
+    def __init__(self, auction=False):
+        self.bids = BookSide(BUY)
+        self.asks = BookSide(SELL)
+        self.auction = auction
+
+        # order id -> active resting order (or, in call auction mode, an order waiting for the next auction)
+        self.orders = {}
+
+        # call auction mode: order id -> order collected since the last auction, in arrival order
+        self._batch = {}
+
+        # all or none orders waiting until they can be filled completely, in arrival order
+        self.parked = {}
+
+        # trading day -> ids of good for day orders placed on it
+        self._day_orders = {}
+
+        # level deltas of the last DELTA_HISTORY ticks, as (version, {"bids": {price: quantity}, "asks": ...})
+        self.depth_version = 0
+        self._deltas = deque(maxlen=DELTA_HISTORY)
+
+        self.tick = 0
+        self.last_price = None
+        self._seq = 0
+
+    def best_bid(self):
+        level = self.bids.best()
+        return level.price if level is not None else None
+
+    def best_ask(self):
+        level = self.asks.best()
+        return level.price if level is not None else None
+
+    # aggregated quantity of the best num_levels price levels of each side, as {"bids": [(price, quantity)], "asks": ...}
+    def depth(self, num_levels=10):
+        return {
+            "bids": [(level.price, level.quantity) for level, _ in zip(self.bids.walk(), range(num_levels))],
+            "asks": [(level.price, level.quantity) for level, _ in zip(self.asks.walk(), range(num_levels))]
+        }
+
+    # L2 snapshot: depth() plus the depth version it corresponds to, to continue from with deltas_since()
+    def snapshot(self, num_levels=10):
+        snapshot = self.depth(num_levels)
+        snapshot["version"] = self.depth_version
+        return snapshot
+
+    # closes the current depth version (once per tick): records the new quantity of every level that changed since
+    # the last call, a quantity of 0 meaning the level is gone, and returns them as
+    # {"version": version, "bids": [(price, quantity)], "asks": [...]}
+    # only the changed levels are looked at, so this costs O(levels changed) regardless of the size of the book
+    def publish_deltas(self):
+        delta = {}
+        for name, book_side in (("bids", self.bids), ("asks", self.asks)):
+            levels = book_side.levels
+            delta[name] = {price: levels[price].quantity if price in levels else 0 for price in book_side.changed}
+            book_side.changed = set()
+
+        self.depth_version += 1
+        self._deltas.append((self.depth_version, delta))
+        return self._delta_response(self.depth_version, delta)
+
+    # level changes published after version, merged into one delta (the latest quantity of each level wins)
+    # returns None if version is too old to be caught up from the kept history; the caller needs a new snapshot
+    def deltas_since(self, version):
+        if version > self.depth_version or (self._deltas and version < self._deltas[0][0] - 1) or \
+           (not self._deltas and version != self.depth_version):
+            return None
+
+        merged = {"bids": {}, "asks": {}}
+        for delta_version, delta in self._deltas:
+            if delta_version > version:
+                merged["bids"].update(delta["bids"])
+                merged["asks"].update(delta["asks"])
+        return self._delta_response(self.depth_version, merged)
+
+    def _delta_response(self, version, delta):
+        return {
+            "version": version,
+            "bids": sorted(delta["bids"].items(), reverse=True),
+            "asks": sorted(delta["asks"].items())
+        }
+
+    def _side(self, side):
+        return self.bids if side == BUY else self.asks
+
+    # matches an incoming order against the book according to its type, then rests whatever is left of it if the
+    # type allows it; an order with price None is a market order: it takes any price and never rests
+    # returns the list of fills it produced
+    def submit(self, order):
+        self._seq += 1
+        order.seq = self._seq
+
+        if order.type in (TYPE_FILL_OR_KILL, TYPE_ALL_OR_NONE):
+            opposite = self.asks if order.side == BUY else self.bids
+            if opposite.available(order.price, order.remaining) < order.remaining:
+                if order.type == TYPE_ALL_OR_NONE and order.price is not None:
+                    self.parked[order.id] = order
+                else:
+                    order.active = False
+                return []
+
+        elif self.auction:
+            self._queue(order)
+            return []
+
+        fills = self._match(order)
+
+        if order.remaining == 0 or order.price is None or order.type == TYPE_IMMEDIATE_OR_CANCEL:
+            order.active = False
+        else:
+            self._rest(order)
+            if order.type == TYPE_GOOD_FOR_DAY:
+                self._day_orders.setdefault(order.day, []).append(order.id)
+        return fills
+
+    # cancels a resting or parked order; returns False if it is not in the book (already filled, cancelled or unknown)
+    # the order is removed from its level's queue lazily, when it reaches the front of the queue, when the queue is
+    # compacted or with its level
+    def cancel(self, order_id):
+        order = self.parked.pop(order_id, None)
+        if order is not None:
+            order.active = False
+            return True
+
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return False
+        order.active = False
+        if self._batch.pop(order_id, None) is not None:
+            return True
+        book_side = self._side(order.side)
+        level = book_side.levels.get(order.price)
+        if level is not None:
+            book_side.reduce(level, order.remaining)
+            book_side.retire(level)
+        return True
+
+    # changes the price and/or remaining quantity of a resting order; returns the fills the change produced, or None
+    # if the order is not resting in the book
+    # reducing the quantity keeps the order's place in its level; any other change moves it to the back of its new
+    # level (and matches it first if the new price crosses the book). A quantity of 0 cancels the order
+    def amend(self, order_id, price=None, quantity=None):
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+
+        price = order.price if price is None else price
+        quantity = order.remaining if quantity is None else quantity
+        if quantity <= 0:
+            self.cancel(order_id)
+            return []
+
+        # an order waiting for the next auction has no place in the book yet
+        if order_id in self._batch:
+            order.quantity += quantity - order.remaining
+            order.price = price
+            order.remaining = quantity
+            return []
+
+        book_side = self._side(order.side)
+        level = book_side.levels[order.price]
+        if price == order.price and quantity <= order.remaining:
+            book_side.reduce(level, order.remaining - quantity)
+            order.quantity -= order.remaining - quantity
+            order.remaining = quantity
+            return []
+
+        # the old entry is left in its level's queue and skipped lazily, like a cancelled order
+        order.active = False
+        book_side.reduce(level, order.remaining)
+        book_side.retire(level)
+        del self.orders[order_id]
+
+        amended = BookOrder(order.id, order.player_id, order.side, price, order.quantity - order.remaining + quantity,
+                            order.type, order.day, order.ref)
+        amended.remaining = quantity
+        self._seq += 1
+        amended.seq = self._seq
+
+        if self.auction:
+            self._queue(amended)
+            return []
+
+        fills = self._match(amended)
+        if amended.remaining == 0:
+            amended.active = False
+        else:
+            self._rest(amended)
+        return fills
+
+    # moves the book to a new tick and retries the parked all or none orders; returns the fills they produced
+    def advance_tick(self, tick):
+        self.tick = tick
+        fills = []
+        if not self.parked:
+            return fills
+
+        best = {BUY: self.asks.best(), SELL: self.bids.best()}
+        for order in list(self.parked.values()):
+            opposite = self.asks if order.side == BUY else self.bids
+            # most parked orders do not even cross the top of the book, which is an O(1) check
+            level = best[order.side]
+            if level is None or not opposite.crosses(level.price, order.price):
+                continue
+            if opposite.available(order.price, order.remaining) >= order.remaining:
+                del self.parked[order.id]
+                fills.extend(self._match(order))
+                order.active = False
+                best = {BUY: self.asks.best(), SELL: self.bids.best()}
+        return fills
+
+    # expires every good for day order placed on or before day, returns the expired orders
+    def expire_day(self, day):
+        expired = []
+        for order_day in [d for d in self._day_orders if d <= day]:
+            for order_id in self._day_orders.pop(order_day):
+                order = self.orders.get(order_id)
+                if order is not None and self.cancel(order_id):
+                    expired.append(order)
+        return expired
+
+    # call auction mode: clears every order collected since the last auction at a single price; returns the fills
+    # the clearing price maximizes the traded volume, then minimizes the unmatched volume at that price, then is the
+    # closest to reference_price (the current price of the stock)
+    # collected orders are sorted by price once; only what is left of them after the auction is added to the book
+    def clear_auction(self, reference_price=None):
+        batch, self._batch = self._batch, {}
+
+        market = {BUY: [], SELL: []}
+        limit = {BUY: [], SELL: []}
+        for order in batch.values():
+            (market if order.price is None else limit)[order.side].append(order)
+        limit[BUY].sort(key=lambda order: -order.price)
+        limit[SELL].sort(key=lambda order: order.price)
+
+        price, volume = self._clearing_price(limit, market, reference_price)
+        fills = self._cross(price, volume, limit, market) if volume > 0 else []
+
+        # market orders never rest, and immediate or cancel orders lose whatever the auction did not fill
+        for order in batch.values():
+            if not order.active:
+                continue
+            if order.price is None or order.type == TYPE_IMMEDIATE_OR_CANCEL:
+                order.active = False
+                del self.orders[order.id]
+            else:
+                self._rest(order)
+        return fills
+
+    # returns (clearing price, volume traded at it) for the resting book plus the collected limit and market orders
+    def _clearing_price(self, limit, market, reference_price):
+        # without market orders on the other side, a resting level can only trade if it reaches the best price on the
+        # other side (the book itself is never crossed), so the walk stops there instead of covering the whole book
+        asks = [price for price in (self.best_ask(), limit[SELL][0].price if limit[SELL] else None) if price is not None]
+        bids = [price for price in (self.best_bid(), limit[BUY][0].price if limit[BUY] else None) if price is not None]
+        bid_levels = self._levels_within(self.bids, None if market[SELL] or not asks else min(asks))
+        ask_levels = self._levels_within(self.asks, None if market[BUY] or not bids else max(bids))
+        bid_prices = np.array([level.price for level in bid_levels] + [order.price for order in limit[BUY]],
+                              dtype=np.int64)
+        bid_quantities = np.array([level.quantity for level in bid_levels] +
+                                  [order.remaining for order in limit[BUY]], dtype=np.int64)
+        ask_prices = np.array([level.price for level in ask_levels] + [order.price for order in limit[SELL]],
+                              dtype=np.int64)
+        ask_quantities = np.array([level.quantity for level in ask_levels] +
+                                  [order.remaining for order in limit[SELL]], dtype=np.int64)
+        market_buy = sum(order.remaining for order in market[BUY])
+        market_sell = sum(order.remaining for order in market[SELL])
+
+        candidates = np.union1d(bid_prices, ask_prices)
+        if len(candidates) == 0:
+            return reference_price, min(market_buy, market_sell) if reference_price is not None else 0
+
+        # demand at price p: every bid at p or above, supply: every ask at p or below
+        # with bids in descending and asks in ascending order, both are a lookup into a cumulative sum
+        order = np.argsort(-bid_prices, kind="stable")
+        bid_prices = bid_prices[order]
+        demand_curve = np.concatenate(([0], np.cumsum(bid_quantities[order])))
+        order = np.argsort(ask_prices, kind="stable")
+        ask_prices = ask_prices[order]
+        supply_curve = np.concatenate(([0], np.cumsum(ask_quantities[order])))
+
+        demand = market_buy + demand_curve[np.searchsorted(-bid_prices, -candidates, side="right")]
+        supply = market_sell + supply_curve[np.searchsorted(ask_prices, candidates, side="right")]
+
+        volume = np.minimum(demand, supply)
+        imbalance = np.abs(demand - supply)
+        distance = np.abs(candidates - reference_price) if reference_price is not None else np.zeros_like(candidates)
+        best = np.lexsort((distance, imbalance, -volume))[0]
+        return int(candidates[best]), int(volume[best])
+
+    # levels of a side from the best price outwards, as long as they would trade with an order at price
+    # (all of them if price is None); an empty list if nothing on the other side is left to trade with
+    def _levels_within(self, book_side, price):
+        levels = []
+        for level in book_side.walk():
+            if price is not None and not book_side.crosses(level.price, price):
+                break
+            levels.append(level)
+        return levels
+
+    # trades volume shares between the orders crossing price, best price and oldest order first, all at price
+    def _cross(self, price, volume, limit, market):
+        fills = []
+        buyers = self._crossing(BUY, price, limit[BUY], market[BUY])
+        sellers = self._crossing(SELL, price, limit[SELL], market[SELL])
+        buy, buy_level = next(buyers)
+        sell, sell_level = next(sellers)
+
+        tick = self.tick
+        while True:
+            quantity = min(buy.remaining, sell.remaining, volume)
+            fills.append(Fill(buy.id, sell.id, buy.player_id, sell.player_id, price, quantity, tick, buy.ref,
+                              sell.ref))
+            volume -= quantity
+            buy.remaining -= quantity
+            sell.remaining -= quantity
+            if buy_level is not None:
+                self.bids.reduce(buy_level, quantity)
+            if sell_level is not None:
+                self.asks.reduce(sell_level, quantity)
+
+            if buy.remaining == 0:
+                buy.active = False
+                del self.orders[buy.id]
+                if buy_level is not None:
+                    self.bids.retire(buy_level)
+            if sell.remaining == 0:
+                sell.active = False
+                del self.orders[sell.id]
+                if sell_level is not None:
+                    self.asks.retire(sell_level)
+            if volume == 0:
+                break
+
+            if buy.remaining == 0:
+                buy, buy_level = next(buyers)
+            if sell.remaining == 0:
+                sell, sell_level = next(sellers)
+
+        self.last_price = price
+        return fills
+
+    # the orders of a side that cross price in priority order, as (order, level) pairs: market orders first, then by
+    # price; at the same price resting orders (level is their level) come before collected ones (level is None)
+    # filled resting orders are left in their levels' queues and skipped lazily
+    def _crossing(self, side, price, collected, market_orders):
+        for order in market_orders:
+            yield order, None
+
+        book_side = self._side(side)
+        i = 0
+        for level in book_side.walk():
+            if not book_side.crosses(level.price, price):
+                break
+            while i < len(collected) and collected[i].price != level.price and \
+                    book_side.crosses(collected[i].price, level.price):
+                yield collected[i], None
+                i += 1
+            for order in level.orders:
+                if order.active:
+                    yield order, level
+            while i < len(collected) and collected[i].price == level.price:
+                yield collected[i], None
+                i += 1
+
+        while i < len(collected) and book_side.crosses(collected[i].price, price):
+            yield collected[i], None
+            i += 1
+
+    def _queue(self, order):
+        self._batch[order.id] = order
+        self.orders[order.id] = order
+        if order.type == TYPE_GOOD_FOR_DAY:
+            self._day_orders.setdefault(order.day, []).append(order.id)
+
+    def _rest(self, order):
+        self._side(order.side).add(order)
+        self.orders[order.id] = order
+
+    def _match(self, order):
+        fills = []
+        opposite = self.asks if order.side == BUY else self.bids
+
+        while order.remaining > 0:
+            level = opposite.best()
+            if level is None or not opposite.crosses(level.price, order.price):
+                break
+
+            while order.remaining > 0 and level.quantity > 0:
+                resting = level.orders[0]
+                if not resting.active:
+                    level.orders.popleft()
+                    level.dead -= 1
+                    continue
+
+                quantity = min(order.remaining, resting.remaining)
+                fills.append(self._fill(order, resting, level.price, quantity))
+
+                order.remaining -= quantity
+                resting.remaining -= quantity
+                opposite.reduce(level, quantity)
+
+                if resting.remaining == 0:
+                    resting.active = False
+                    level.orders.popleft()
+                    del self.orders[resting.id]
+
+        return fills
+
+    def _fill(self, incoming, resting, price, quantity):
+        buy, sell = (incoming, resting) if incoming.side == BUY else (resting, incoming)
+        self.last_price = price
+        return Fill(buy.id, sell.id, buy.player_id, sell.player_id, price, quantity, self.tick, buy.ref, sell.ref)
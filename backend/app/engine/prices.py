@@ -1,5 +1,8 @@
 from ..models import GameManager, GameSettings
-from app.tasks import process_buy_stock_solo
+from .money import to_cents, from_cents, interest_cents
+from .settlement import flush_if_due
+from .event_log import snapshot_interval
+from ..push import push_regular_tick, push_solo_tick
 
 
 '''
@@ -20,28 +23,43 @@ def getNextPriceSolo(game_id):
     if stock == None:
         return -1
 
-    new_price = stock.next_values[0]
+    # the tick happens in memory, it is written to the database on the game's next flush
+    hot = manager.get_hot_state(game_id)
 
-    stock.next_values = stock.next_values[1:]
+    # prices are generated on demand, in cents
+    stock.ticks_generated += 1
 
-    stock.current_price = new_price
+    new_price = stock.tick_source.price_at(stock.ticks_generated)
 
-    stock.ticks_generated += 1
+    stock.current_price = from_cents(new_price)
+    hot.dirty = True
+
+    # settle the pending orders, they move from pending to fulfilled on the next flush
+    hot.settle_solo()
+    return stock.current_price
 
-    stock.past_values.append(stock.current_price)
 
+# applies one tick of interest to the player of a solo game, booked on trading_day, then flushes the game if it is
+# due (see flush_if_due()); returns the player
+# positive balances earn interest, negative balances get charged interest (see engine/money.py for the rates)
+def apply_interest_solo(game_id, trading_day):
+    # solo game only has one player, which represents the user playing the game
+    hot = GameManager().get_hot_state(game_id)
+    player = hot.player
 
-    # move orders from pending to fulfilled, and process them via celery
-    fulfilled_orders = stock.pending_orders.all()
+    # in cents
+    diff = interest_cents(to_cents(player.money))
 
-    for order in fulfilled_orders:
-        process_buy_stock_solo(order, stock)
+    if diff >= 0:
+        player.interest_earned[trading_day - 1] += from_cents(diff)
+    else:
+        player.interest_paid[trading_day - 1] += from_cents(-diff)
 
-    stock.fulfilled_orders.add(*fulfilled_orders)
-    stock.pending_orders.clear()
+    player.money = from_cents(to_cents(player.money) + diff)
+    hot.dirty = True
 
-    stock.save()
-    return stock.current_price
+    flush_if_due(hot)
+    return player
 
 
 
@@ -49,7 +67,15 @@ def getNextPriceSolo(game_id):
 '''
 Gets next price in regular mode.
 
-TODO
+Price is based on historical stock data. Orders are matched by the game's order book as they come in; orders that
+were completely filled since the last tick get confirmed.
+Every tick also retries the parked all or none orders, and the first tick of a new trading day expires the previous
+days' good for day orders in one go. Then the market makers requote, the bots trade on the new price, and every
+player's cash accrues interest (see EngineState.advance).
+All of this happens in memory (HotState, models.py) and is written to the database in one go when the game is flushed,
+every GAME_STATE_FLUSH_INTERVAL seconds and after its last tick.
+The tick and everything it produced go to the game's event log, which gets a snapshot of the engine every
+EVENT_LOG_SNAPSHOT_INTERVAL ticks.
 '''
 def getNextPriceRegular(game_id):
     manager = GameManager()
@@ -63,16 +89,84 @@ def getNextPriceRegular(game_id):
     if stock == None:
         return -1
 
-    new_price = stock.next_values[0]
+    # the engine is loaded as of the last tick, before moving on to the next one
+    hot = manager.get_hot_state(game_id)
+    engine = hot.engine
+    event_log = hot.event_log
+
+    # prices are generated on demand, in cents
+    stock.ticks_generated += 1
 
-    stock.next_values = stock.next_values[1:]
+    new_price = stock.tick_source.price_at(stock.ticks_generated)
 
-    stock.current_price = new_price
+    stock.current_price = from_cents(new_price)
+    hot.dirty = True
 
-    stock.ticks_generated += 1
+    event_log.tick(stock.ticks_generated, new_price)
+
+    # the previous days' expired orders get cancelled
+    def new_day(expired, day):
+        for order in expired:
+            if order.ref is not None:
+                hot.cancel(order.ref, day)
+
+    tick_fills = []
+
+    def settle_tick(fills):
+        hot.settle(fills)
+        tick_fills.extend(fills)
+
+    def accrued(interest, day):
+        for player_id, amount in interest.items():
+            event_log.interest(player_id, day, amount)
 
-    stock.past_values.append(stock.current_price)
+    trading_day = engine.advance(stock.ticks_generated, new_price, settle_tick, new_day, accrued)
 
+    if stock.ticks_generated % snapshot_interval() == 0:
+        event_log.snapshot(engine)
 
-    stock.save()
+    # confirm orders that were filled since the last tick
+    hot.confirm(trading_day)
+
+    # one message per tick for every connection watching the game
+    push_regular_tick(game_id, engine, tick_fills)
+
+    flush_if_due(hot)
     return stock.current_price
+
+
+
+'''
+Advances a registered game by one tick, whatever its type. This is what the tick scheduler (scheduler.py) runs for
+the games on server side ticks; the trading day of a solo game's interest follows from the tick instead of coming
+from the client.
+
+Returns the tick's result, {"tick", "price"} plus "player_cash" in solo games, or None if the game is over or not
+registered (which takes it off the scheduler).
+'''
+def advance_game(game_id):
+    manager = GameManager()
+    game = manager.get_game(game_id)
+
+    if game == None:
+        return None
+
+    settings = game.settings
+    with manager.lock(game_id):
+        if game.stock.ticks_generated >= settings.num_trading_days * settings.num_ticks_per_day:
+            return None
+
+        if settings.game_type == GameSettings.GAME_BASE_SOLO:
+            price = getNextPriceSolo(game_id)
+        else:
+            price = getNextPriceRegular(game_id)
+        if price == -1:
+            return None
+
+        tick = game.stock.ticks_generated
+        result = {"tick": tick, "price": price}
+        if settings.game_type == GameSettings.GAME_BASE_SOLO:
+            player = apply_interest_solo(game_id, (tick - 1) // settings.num_ticks_per_day + 1)
+            push_solo_tick(game_id, game.stock, player)
+            result["player_cash"] = player.money
+        return result
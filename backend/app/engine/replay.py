@@ -0,0 +1,72 @@
+from collections import deque
+from .event_log import EVENT_TICK, EVENT_ORDER, EVENT_CANCEL, EVENT_FILL, fill_fields
+from .order_book import BookOrder
+
+'''
+Replay
+
+Rebuilds the engine state of a regular game from its event log (event_log.py): starting from the latest snapshot at
+or before the requested tick, the logged orders, cancels and ticks are fed through the same engine code as the live
+game (EngineState.advance for ticks), which is deterministic given the game seed.
+
+The fills the replay produces are checked against the fills in the log as they are read, so a replay that does not
+reproduce the live game fails with ReplayError instead of silently producing a different state. Interest records
+are outputs as well and are not needed to rebuild the state.
+'''
+
+
+class ReplayError(Exception):
+    pass
+
+
+# rebuilds the EngineState of the game logged in event_log as of tick: after the tick and everything that happened
+# before the next one (orders, cancels). With tick None the whole log is replayed; with end, the log is only replayed
+# up to that offset (where the game's state was last flushed to the database)
+# returns (state, log offset right after the last record replayed), see EventLog.truncate()
+def replay(event_log, tick=None, verify=True, end=None):
+    snapshot = event_log.latest_snapshot(tick, end)
+    if snapshot is None:
+        raise ReplayError(f'no snapshot of game {event_log.game_id} at or before tick {tick}')
+    offset, state = snapshot
+
+    # fills the replay produced that have not been matched against the log yet
+    expected = deque()
+
+    def settle(fills):
+        state.apply_fills(fills)
+        if verify:
+            expected.extend(fills)
+
+    for event in event_log.events(offset):
+        if end is not None and event.end > end:
+            break
+        if event.kind == EVENT_FILL:
+            if verify:
+                if not expected or fill_fields(expected.popleft()) != event.fields:
+                    raise ReplayError(f'replay of game {event_log.game_id} diverged from the log at tick '
+                                      f'{state.tick}, offset {offset}')
+            offset = event.end
+            continue
+
+        if event.kind in (EVENT_TICK, EVENT_ORDER, EVENT_CANCEL) and expected:
+            raise ReplayError(f'replay of game {event_log.game_id} produced fills at tick {state.tick} that are '
+                              f'not in the log')
+
+        if event.kind == EVENT_TICK:
+            event_tick, price = event.fields
+            if tick is not None and event_tick > tick:
+                break
+            state.advance(event_tick, price, settle)
+        elif event.kind == EVENT_ORDER:
+            order_id, player_id, side, price, quantity, order_type, day = event.fields
+            order = BookOrder(order_id, player_id, side, price if price >= 0 else None, quantity, order_type, day,
+                              ref=order_id)
+            settle(state.book.submit(order))
+        elif event.kind == EVENT_CANCEL:
+            state.book.cancel(event.fields[0])
+        offset = event.end
+
+    # the log ends in the middle of the fills of an order or tick, what follows them was never logged
+    if expected:
+        raise ReplayError(f'event log of game {event_log.game_id} ends before the fills of tick {state.tick}')
+    return state, offset
@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+'''
+TickScheduler
+
+Owns the tick clock of the games that run on server side ticks. A single asyncio loop, on its own daemon thread,
+keeps a heap of every scheduled game's next tick deadline and sleeps until the earliest one; the ticks themselves
+(which are synchronous database work) run on a small thread pool, so one loop drives any number of games without
+any HTTP request per tick.
+
+Each game ticks every interval seconds (GameSettings.time_between_ticks). Deadlines advance by the interval from the
+previous deadline rather than from when the tick finished, so a game does not drift; a game whose tick takes longer
+than its interval ticks again as soon as the previous tick is done. A game never has two ticks running at once.
+
+pause() takes a game off the clock and returns the time that was left until its next tick, resume() puts it back on
+with that time left, so pausing keeps the rhythm without the client having to measure anything.
+
+tick(game_id) is called for every due tick and returns the tick's result, or None once the game is over (or gone),
+which unschedules it. Every result is passed to the listeners (add_listener) on the worker thread that ran the tick.
+'''
+
+DEFAULT_WORKERS = 4
+
+
+class ScheduledGame():
+    __slots__ = ("game_id", "interval", "deadline", "remaining", "paused", "running", "version")
+
+    def __init__(self, game_id, interval):
+        self.game_id = game_id
+        self.interval = interval
+        self.deadline = None
+        self.remaining = None
+        self.paused = False
+        self.running = False
+
+        # heap entries of older versions are stale, see TickScheduler._push()
+        self.version = 0
+
+
+class TickScheduler():
+    def __init__(self, tick, workers=DEFAULT_WORKERS, clock=time.monotonic):
+        self._tick = tick
+        self._workers = workers
+        self._clock = clock
+
+        # game id -> ScheduledGame
+        self._games = {}
+
+        # (deadline, seq, game id, version)
+        self._heap = []
+        self._seq = itertools.count()
+
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._executor = None
+        self._thread = None
+        self._stopping = False
+
+        self.ticks = 0
+
+    # starts the loop thread; add() does so on first use
+    def start(self):
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="tick")
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._main, args=(started,), name="tick-scheduler", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._thread = None
+        self._loop = None
+
+    # calls listener(game_id, result) after every tick
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # puts a game on the clock: its first tick is due in delay seconds (one interval if delay is None or not positive)
+    # a paused game only starts ticking once it is resumed, with delay left until its first tick
+    def add(self, game_id, interval, delay=None, paused=False):
+        self.start()
+        delay = delay if delay is not None and delay > 0 else interval
+        with self._lock:
+            game = ScheduledGame(game_id, interval)
+            self._games[game_id] = game
+            if paused:
+                game.paused = True
+                game.remaining = delay
+            else:
+                self._push(game, self._clock() + delay)
+        self._wake()
+
+    # takes a game off the clock
+    def remove(self, game_id):
+        with self._lock:
+            return self._games.pop(game_id, None) is not None
+
+    def __contains__(self, game_id):
+        return game_id in self._games
+
+    # pauses a game, returns the seconds that were left until its next tick (None if the game is not scheduled)
+    def pause(self, game_id):
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is None:
+                return None
+            if not game.paused:
+                game.paused = True
+                game.version += 1
+                # a tick that is running right now counts as done, the next one is an interval later
+                deadline = game.deadline + game.interval if game.running else game.deadline
+                game.remaining = max(deadline - self._clock(), 0)
+            return game.remaining
+
+    # resumes a paused game; its next tick is due after the time that was left when it was paused
+    # returns False if the game is not scheduled
+    def resume(self, game_id):
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is None:
+                return False
+            if game.paused:
+                game.paused = False
+                if game.running:
+                    # scheduled once the running tick is done, see _finished()
+                    game.version += 1
+                    game.deadline = self._clock() + game.remaining
+                else:
+                    self._push(game, self._clock() + game.remaining)
+                game.remaining = None
+        self._wake()
+        return True
+
+    # number of scheduled games, how many of them are paused, and the number of ticks run so far
+    def stats(self):
+        with self._lock:
+            return {
+                "games": len(self._games),
+                "paused": sum(1 for game in self._games.values() if game.paused),
+                "ticks": self.ticks
+            }
+
+    # schedules the next tick of game at deadline, making any earlier heap entry of the game stale
+    def _push(self, game, deadline):
+        game.version += 1
+        game.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), game.game_id, game.version))
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _main(self, started):
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        started.set()
+        try:
+            self._loop.run_until_complete(self._run())
+        finally:
+            self._loop.close()
+
+    async def _run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            timeout = self._dispatch_due()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # starts every tick that is due; returns the seconds until the next deadline, or None if there is none
+    def _dispatch_due(self):
+        with self._lock:
+            heap = self._heap
+            now = self._clock()
+            while heap and heap[0][0] <= now:
+                deadline, _, game_id, version = heapq.heappop(heap)
+                game = self._games.get(game_id)
+                if game is None or game.version != version or game.paused or game.running:
+                    continue
+                game.running = True
+                future = self._loop.run_in_executor(self._executor, self._run_tick, game_id)
+                future.add_done_callback(lambda future, game=game, version=version: self._finished(game, version,
+                                                                                                   future))
+            return max(heap[0][0] - now, 0) if heap else None
+
+    # called on the loop once a tick is done: schedules the game's next tick, or drops the game if it is over
+    def _finished(self, game, version, future):
+        result = future.result()
+        self._wakeup.set()
+        with self._lock:
+            self.ticks += 1
+            game.running = False
+            if self._games.get(game.game_id) is not game or game.paused:
+                return
+            if result is None:
+                del self._games[game.game_id]
+            elif game.version == version:
+                self._push(game, max(game.deadline + game.interval, self._clock()))
+            else:
+                # paused and resumed while the tick was running
+                self._push(game, max(game.deadline, self._clock()))
+
+    # runs on a worker thread; a tick that fails unschedules its game
+    def _run_tick(self, game_id):
+        close_old_connections()
+        try:
+            result = self._tick(game_id)
+        except Exception:
+            traceback.print_exc()
+            return None
+        finally:
+            close_old_connections()
+
+        if result is not None:
+            for listener in self._listeners:
+                try:
+                    listener(game_id, result)
+                except Exception:
+                    traceback.print_exc()
+        return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+# returns the process-wide scheduler, which runs advance_game() (prices.py) for every tick, with
+# TICK_SCHEDULER_WORKERS worker threads; its thread is only started once a game is added
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from .prices import advance_game
+                _scheduler = TickScheduler(advance_game, getattr(settings, "TICK_SCHEDULER_WORKERS", DEFAULT_WORKERS))
+    return _scheduler
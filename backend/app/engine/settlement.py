@@ -0,0 +1,94 @@
+import time
+from django.conf import settings
+from django.db import transaction
+from ..models import GameManager, BaseGame, Player, Order
+
+'''
+Settlement
+
+Writes the state a running game keeps in memory (HotState, models.py) back to the database. Fills, cancels, interest
+and the price cursor are applied in memory as they happen; flush() writes all of it at once, in a single transaction
+with one bulk update per table, so a game costs a few queries every GAME_STATE_FLUSH_INTERVAL seconds instead of
+several on every tick and order.
+'''
+
+
+# seconds between two flushes of a running game (0 flushes every tick), from the GAME_STATE_FLUSH_INTERVAL setting
+def flush_interval():
+    return settings.GAME_STATE_FLUSH_INTERVAL
+
+
+# writes the cash, shares and interest per day of every player of a regular game's engine (an EngineState) back to
+# their Players, in a single bulk update; does nothing if none of it changed since the last flush
+def flush_players(engine, stock):
+    ledger = engine.interest
+    if not ledger.dirty and not any(population.dirty for population in (engine.accounts, *engine.populations)):
+        return
+
+    stock_id = str(stock.id)
+    players = Player.objects.select_for_update().in_bulk(ledger.player_ids)
+    for player_id, money, shares in engine.players():
+        player = players.get(player_id)
+        if player is not None:
+            player.money = money
+            player.owned_stocks[stock_id] = shares
+    for player_id, earned, paid in ledger.state():
+        player = players.get(player_id)
+        if player is not None:
+            player.interest_earned = earned
+            player.interest_paid = paid
+    Player.objects.bulk_update(players.values(), ["money", "owned_stocks", "interest_earned", "interest_paid"])
+
+
+# writes a game's HotState to the database in a single transaction: the orders that changed (and moves the closed
+# ones from the stock's pending orders to its fulfilled orders), the players' cash, shares and interest, the stock's
+# price cursor and, for regular games, the event log offset the database now corresponds to
+def flush(hot):
+    # ticks set dirty, everything that happens between them changes orders
+    if not hot.dirty and not hot.changed:
+        return
+
+    stock = hot.stock
+    orders = [hot.orders[order_id] for order_id in hot.changed if order_id in hot.orders]
+    closed = [order.id for order in orders if order.status in (Order.STATUS_CONFIRMED, Order.STATUS_CANCELLED)]
+
+    # the log has to hold everything up to the offset before the database points at it
+    if hot.event_log is not None:
+        hot.event_log.sync()
+
+    with transaction.atomic():
+        Order.objects.bulk_update(orders, ["quantity_filled", "status", "day_confirmed_on"])
+        if closed:
+            stock.fulfilled_orders.add(*closed)
+            stock.pending_orders.remove(*closed)
+
+        if hot.engine is not None:
+            flush_players(hot.engine, stock)
+        elif hot.dirty and hot.player is not None:
+            hot.player.save(update_fields=["money", "owned_stocks", "interest_earned", "interest_paid"])
+
+        if hot.dirty:
+            stock.save(update_fields=["current_price", "ticks_generated"])
+        if hot.event_log is not None:
+            hot.game.event_log_offset = hot.event_log.size
+            BaseGame.objects.filter(id=hot.game.id).update(event_log_offset=hot.game.event_log_offset)
+    hot.flushed()
+
+
+# flushes a registered game, if it has any state in memory
+def flush_game(game_id):
+    manager = GameManager()
+    if game_id not in manager.hot_states:
+        return
+    with manager.lock(game_id):
+        hot = manager.hot_states.get(game_id)
+        if hot is not None:
+            flush(hot)
+
+
+# flushes a game after a tick if the flush interval has passed since its last flush, or if the game is over
+def flush_if_due(hot):
+    game_settings = hot.game.settings
+    over = hot.stock.ticks_generated >= game_settings.num_trading_days * game_settings.num_ticks_per_day
+    if over or time.monotonic() - hot.flushed_at >= flush_interval():
+        flush(hot)
@@ -0,0 +1,143 @@
+import time
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from ..models import GameManager, HotState, GameSettings, Player, Order
+from .money import from_cents
+from .order_book import BookOrder
+from .settlement import flush
+
+'''
+Simulation
+
+Plays a regular game to its end headless. Every remaining tick (up to num_trading_days * num_ticks_per_day) goes
+through EngineState.advance in memory, the same as in a live game, but without an event log, WebSockets or flushes
+along the way: it all runs in one transaction, which saves the scripted orders first and flushes the game's HotState
+once at the end.
+
+The bots and market makers trade as they do in a live game. The players' orders come from a script, a list of
+orders that are each placed right before a given tick, so a simulated game ends up exactly where the same game would
+when played through the tick endpoint with the same orders placed at the same ticks.
+'''
+
+
+class SimulationError(Exception):
+    pass
+
+
+# parses the order script of a simulation into unsaved Orders, by the tick they are placed before
+# every entry has tick, quantity (negative to sell), price and order_type (Order.TYPE_*, good 'til cancelled by
+# default), and optionally player_id, one of accounts (the game's human players; the first one by default)
+def scripted_orders(script, accounts, first_tick, last_tick, num_ticks_per_day):
+    orders = {}
+    types = {order_type for order_type, _ in Order.TYPE_CHOICES if order_type != Order.TYPE_SOLO}
+    for i, entry in enumerate(script or ()):
+        try:
+            tick = int(entry["tick"])
+            quantity = int(entry["quantity"])
+            price = Decimal(str(entry["price"]))
+            order_type = int(entry.get("order_type", Order.TYPE_GOOD_TIL_CANCELLED))
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise SimulationError(f'order {i} needs an integer tick and quantity, a price and an order type')
+
+        player_id = entry.get("player_id")
+        if player_id is None and accounts.player_ids:
+            player_id = accounts.player_ids[0]
+        player_id = next((account for account in accounts.player_ids if str(account) == str(player_id)), None)
+
+        if not first_tick <= tick <= last_tick:
+            raise SimulationError(f'order {i} is placed before tick {tick}, the simulation runs ticks {first_tick} '
+                                  f'to {last_tick}')
+        if quantity == 0 or price <= 0 or order_type not in types:
+            raise SimulationError(f'order {i} has an invalid quantity, price or order type')
+        if player_id is None:
+            raise SimulationError(f'order {i} is not placed by a player of the game')
+
+        # the trading day the game is in right before tick
+        day = max(tick - 2, 0) // num_ticks_per_day + 1
+        orders.setdefault(tick, []).append(Order(type=order_type, from_player_id=player_id, quantity=quantity,
+                                                 price=price, day_placed_on=day))
+    return orders
+
+
+# plays the rest of a regular game (a BaseGame that is not running in the game manager) in memory, with the players'
+# orders from script (see scripted_orders()), and stores the outcome; returns a summary of the simulation
+def simulate(game, script=()):
+    settings = game.settings
+    if settings.game_type != GameSettings.GAME_BASE:
+        raise SimulationError(f'game {game.id} is not a regular game')
+
+    stock = game.stock
+    first_tick = stock.ticks_generated + 1
+    last_tick = settings.num_trading_days * settings.num_ticks_per_day
+    if first_tick > last_tick:
+        raise SimulationError(f'game {game.id} is already over')
+
+    started = time.perf_counter()
+    engine = GameManager().build_engine(game)
+    script = scripted_orders(script, engine.accounts, first_tick, last_tick, settings.num_ticks_per_day)
+
+    # every Order the simulation can touch: the stock's pending orders and the scripted ones
+    new_orders = [order for tick_orders in script.values() for order in tick_orders]
+    pending = list(stock.pending_orders.all())
+    totals = {"trades": 0, "volume": 0}
+
+    def settle(fills):
+        hot.settle(fills)
+        totals["trades"] += len(fills)
+        totals["volume"] += sum(f.quantity for f in fills)
+
+    def new_day(expired, day):
+        for book_order in expired:
+            if book_order.ref is not None:
+                hot.cancel(book_order.ref, day)
+
+    # the scripted orders are saved before the first tick, so the book and the HotState know them by their ids from
+    # the start; nothing of the simulation is stored unless it runs to the end
+    with transaction.atomic():
+        Order.objects.bulk_create(new_orders)
+        stock.pending_orders.add(*new_orders)
+        hot = HotState(game, engine=engine, orders=[*pending, *new_orders])
+        orders = list(hot.orders.values())
+
+        tick_source = stock.tick_source
+        for tick in range(first_tick, last_tick + 1):
+            for order in script.get(tick, ()):
+                book_order = BookOrder.from_order(order)
+                settle(engine.book.submit(book_order))
+                if book_order.cancelled:
+                    hot.cancel(order.id, order.day_placed_on)
+
+            trading_day = engine.advance(tick, tick_source.price_at(tick), settle, new_day)
+            hot.confirm(trading_day)
+        ran = time.perf_counter() - started
+
+        stock.current_price = from_cents(engine.price)
+        stock.ticks_generated = engine.tick
+        hot.dirty = True
+        statuses = [order.status for order in orders]
+        flush(hot)
+
+    roles = dict(Player.ROLE_CHOICES)
+    play_styles = dict(game.players.values_list("id", "play_style"))
+    players = [{"id": player_id, "role": roles[role], "play_style": play_styles.get(player_id), "money": money,
+                "shares": shares}
+               for role, population in ((Player.ROLE_PLAYER, engine.accounts), (Player.ROLE_BOT, engine.bots),
+                                        (Player.ROLE_MARKET_MAKER, engine.market_makers))
+               for player_id, money, shares in population.state()]
+
+    return {
+        "ticks": last_tick - first_tick + 1,
+        "seconds": round(time.perf_counter() - started, 3),
+        "ticks_per_second": round((last_tick - first_tick + 1) / ran, 1) if ran > 0 else None,
+        "price": from_cents(engine.price),
+        "trades": totals["trades"],
+        "volume": totals["volume"],
+        "orders": {
+            "placed": len(new_orders),
+            "resting": statuses.count(Order.STATUS_PLACED),
+            "filled": statuses.count(Order.STATUS_FILLED) + statuses.count(Order.STATUS_CONFIRMED),
+            "cancelled": statuses.count(Order.STATUS_CANCELLED)
+        },
+        "players": players
+    }
+
@@ -0,0 +1,157 @@
+import numpy as np
+from .money import to_cents, from_cents
+from .interest import interest_cents_array
+
+'''
+EngineState
+
+Everything the matching engine of a regular game keeps in memory, in one object: the order book, the bots, the
+market makers, the cash and shares of the remaining players (the human players) as Accounts, and the interest of
+every player per day (InterestLedger, interest.py). Together with the current tick and price this is enough to carry
+on with the game, so an EngineState is what event log snapshots store (event_log.py) and what a replay rebuilds
+(replay.py).
+
+advance() runs the engine part of a regular tick. The live game (getNextPriceRegular) and a replay both go through
+it, so a replayed tick does exactly what the live tick did.
+'''
+
+
+class EngineState():
+    def __init__(self, book, bots, market_makers, accounts, interest, num_ticks_per_day, tick, price):
+        self.book = book
+        self.bots = bots
+        self.market_makers = market_makers
+        self.accounts = accounts
+
+        # ledger of every player, in the order accounts, bots, market makers
+        self.interest = interest
+        self.num_ticks_per_day = num_ticks_per_day
+
+        # current tick and price (cents); price is what the bots compare the next tick's price against
+        self.tick = tick
+        self.price = price
+
+    # the in-memory participants, see settlement.py
+    @property
+    def populations(self):
+        return (self.bots, self.market_makers)
+
+    # applies fills to every participant involved, in memory only
+    def apply_fills(self, fills):
+        for population in self.populations:
+            population.apply_fills(fills)
+        self.accounts.apply_fills(fills)
+
+    # moves the engine to tick at price (cents): retries the parked all or none orders, expires the previous days' good
+    # for day orders on the first tick of a day, lets the market makers requote and the bots trade, clears the
+    # auction in call auction mode, and accrues the tick's interest
+    # settle(fills) gets the fills of every stage as they happen and has to apply them to the populations before the
+    # next stage runs (the bots decide on their cash); new_day(expired orders, previous day) is called on the first
+    # tick of every day but the first; accrued(interest, trading day) gets the interest of the accounts, in cents by
+    # player id
+    # returns the trading day of tick
+    def advance(self, tick, price, settle, new_day=None, accrued=None):
+        book = self.book
+        previous_price = self.price
+        self.tick = tick
+        self.price = price
+
+        settle(book.advance_tick(tick))
+
+        trading_day = (tick - 1) // self.num_ticks_per_day + 1
+        if (tick - 1) % self.num_ticks_per_day == 0 and trading_day > 1:
+            expired = book.expire_day(trading_day - 1)
+            if new_day is not None:
+                new_day(expired, trading_day - 1)
+
+        # market makers move their quotes to the new price first, so the bots find liquidity around it
+        settle(self.market_makers.step(book, price))
+
+        # every bot decides on this tick's price in one vectorized pass, their orders go to the book in bulk
+        settle(self.bots.step(book, tick, price, previous_price, trading_day))
+
+        # in call auction mode all of the above (and the players' orders since the last tick) only got collected,
+        # they are cleared together here
+        if book.auction:
+            settle(book.clear_auction(price))
+
+        interest = self.accrue_interest(trading_day)
+        if accrued is not None:
+            accrued(interest, trading_day)
+
+        book.publish_deltas()
+        return trading_day
+
+    # applies one tick of interest to the cash of every player at once and books it on trading_day; returns the
+    # interest of the accounts, in cents by player id
+    def accrue_interest(self, trading_day):
+        accounts = self.accounts
+        num_accounts, num_bots = len(accounts.player_ids), len(self.bots)
+        cash = np.concatenate([accounts.balances(), self.bots.cash, self.market_makers.cash])
+        amounts = interest_cents_array(cash)
+
+        accounts.add_cash(amounts[:num_accounts])
+        self.bots.add_cash(amounts[num_accounts:num_accounts + num_bots])
+        self.market_makers.add_cash(amounts[num_accounts + num_bots:])
+        self.interest.book(amounts, trading_day)
+        return dict(zip(accounts.player_ids, amounts[:num_accounts].tolist()))
+
+    # cash (as a Decimal) and shares of every player of the game, as (player id, money, shares)
+    def players(self):
+        return self.accounts.state() + self.bots.state() + self.market_makers.state()
+
+
+'''
+Accounts
+
+Cash (cents) and shares of the players of a regular game that are not simulated by a population, kept up to date from
+the fills involving them and their interest. While the game runs, Accounts is the authority for these players; their
+Players are brought up to date when the game's state is flushed (flush(), settlement.py).
+'''
+class Accounts():
+    def __init__(self, player_ids, cash, shares):
+        self.player_ids = list(player_ids)
+        self.cash = dict(zip(self.player_ids, cash))
+        self.shares = dict(zip(self.player_ids, shares))
+
+        # whether anything changed since the last flush
+        self.dirty = False
+
+    # builds the accounts from Players; stock_id is the key of the game's stock in owned_stocks
+    @classmethod
+    def from_players(cls, players, stock_id):
+        players = list(players)
+        return cls([player.id for player in players],
+                   [to_cents(player.money) for player in players],
+                   [player.owned_stocks.get(stock_id, 0) for player in players])
+
+    def __contains__(self, player_id):
+        return player_id in self.cash
+
+    # cash of every account (cents), in player_ids order
+    def balances(self):
+        return np.array([self.cash[player_id] for player_id in self.player_ids], dtype=np.int64)
+
+    # adds amounts (cents, in player_ids order) to the accounts' cash
+    def add_cash(self, amounts):
+        for player_id, amount in zip(self.player_ids, amounts.tolist()):
+            self.cash[player_id] += amount
+        self.dirty = True
+
+    def apply_fills(self, fills):
+        cash = self.cash
+        shares = self.shares
+        for fill in fills:
+            cost = fill.price * fill.quantity
+            if fill.buy_player_id in cash:
+                cash[fill.buy_player_id] -= cost
+                shares[fill.buy_player_id] += fill.quantity
+                self.dirty = True
+            if fill.sell_player_id in cash:
+                cash[fill.sell_player_id] += cost
+                shares[fill.sell_player_id] -= fill.quantity
+                self.dirty = True
+
+    # current cash (as a Decimal) and shares of every account, as (player id, money, shares)
+    def state(self):
+        return [(player_id, from_cents(self.cash[player_id]), self.shares[player_id]) for player_id in self.player_ids]
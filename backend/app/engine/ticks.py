@@ -0,0 +1,61 @@
+from app.data.data_processing.archive import get_archive
+from app.data.data_processing.decoder import StreamDecoder
+
+'''
+TickSource
+
+Lazy source of a stock's prices. Instead of storing the whole future price path on the stock, any tick can be
+regenerated from (underlying_stock, first_tick_index, tick) on demand.
+
+Prices are read through a resumable StreamDecoder in chunks of CHUNK_SIZE, so advancing tick by tick only decodes
+once per chunk, and jumping to an arbitrary tick costs a seek to the nearest checkpoint.
+
+Tick numbering follows Stock.ticks_generated: the game starts with INITIAL_PRICES prices already shown, tick 0 is
+the last of them, and tick k is the price after k ticks have been generated. All prices are in cents.
+'''
+
+INITIAL_PRICES = 10
+CHUNK_SIZE = 64
+
+
+class TickSource():
+    def __init__(self, underlying_stock, first_tick_index, archive=None):
+        archive = archive or get_archive()
+        self.underlying_stock = underlying_stock
+        self.first_tick_index = first_tick_index
+        self._decoder = StreamDecoder(archive.data(underlying_stock), archive.index(underlying_stock))
+
+        # currently decoded chunk: prices of entries [_chunk_start, _chunk_start + len(_chunk))
+        self._chunk_start = 0
+        self._chunk = self._decoder.read(0)
+
+    # number of ticks available after tick 0
+    def __len__(self):
+        return self._decoder.count - self.first_tick_index - INITIAL_PRICES
+
+    # price at tick, in cents
+    def price_at(self, tick):
+        entry = self.first_tick_index + INITIAL_PRICES - 1 + tick
+        if not self._chunk_start <= entry < self._chunk_start + len(self._chunk):
+            self._load_chunk(entry)
+        return int(self._chunk[entry - self._chunk_start])
+
+    # prices (in cents) from the first initial price up to and including tick
+    def history(self, tick):
+        archive_start = self.first_tick_index
+        if self._decoder.position != archive_start:
+            self._decoder.seek(archive_start)
+        prices = self._decoder.read(INITIAL_PRICES + tick)
+
+        # the decoder is no longer positioned after the current chunk
+        self._chunk_start, self._chunk = archive_start, prices
+        return prices
+
+    def _load_chunk(self, entry):
+        # reading straight on from the end of the current chunk continues the decoder without seeking
+        if entry != self._decoder.position:
+            self._decoder.seek(entry)
+        self._chunk_start = entry
+        self._chunk = self._decoder.read(CHUNK_SIZE)
+        if len(self._chunk) == 0:
+            raise IndexError(f'{self.underlying_stock} has no price for entry {entry}')
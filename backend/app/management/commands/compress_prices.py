@@ -0,0 +1,86 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from app.data.data_processing.compress_data import RAW_DATA_DIR, compress_file
+from app.data.data_processing.decoder import COMPRESSED_DATA_DIR, COLUMNS
+from app.data.data_processing.archive import ARCHIVE_PATH, pack_data
+
+'''
+compress_prices
+
+Compresses every raw data file in a directory (app/data/raw_data/ by default) into the compressed format using a
+process pool. Every file is written atomically together with its seek index, then decoded again and compared to the
+source prices. Finally the price archive is rebuilt so running servers pick up the new data on restart.
+
+usage: python manage.py compress_prices [raw_dir] [--output DIR] [--workers N] [--format {1,2}]
+                                       [--columns open,high,low,volume] [--no-verify] [--no-pack]
+'''
+class Command(BaseCommand):
+    help = "Compresses a directory of raw price files, verifies the round trip and rebuilds the price archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("raw_dir", nargs="?", default=RAW_DATA_DIR)
+        parser.add_argument("--output", default=COMPRESSED_DATA_DIR)
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--format", type=int, choices=[1, 2], default=1, help="compressed format version")
+        parser.add_argument("--columns", default="",
+                            help="comma separated extra columns to store with version 2 (open, high, low, volume)")
+        parser.add_argument("--no-verify", action="store_true", help="skip decoding the output again")
+        parser.add_argument("--no-pack", action="store_true", help="skip rebuilding the price archive")
+
+    def handle(self, *args, **options):
+        raw_dir = options["raw_dir"]
+        output_dir = options["output"]
+        verify = not options["no_verify"]
+        version = options["format"]
+        columns = ["close"] + [column for column in options["columns"].split(",") if column]
+
+        unknown = [column for column in columns if column not in COLUMNS]
+        if unknown:
+            raise CommandError(f'unknown columns: {", ".join(unknown)}')
+        if version == 1 and len(columns) > 1:
+            raise CommandError("extra columns need --format 2")
+
+        if not os.path.isdir(raw_dir):
+            raise CommandError(f'{raw_dir} is not a directory')
+        os.makedirs(output_dir, exist_ok=True)
+
+        files = sorted(f for f in os.listdir(raw_dir) if os.path.isfile(os.path.join(raw_dir, f)))
+
+        start = time.perf_counter()
+        entries, raw_bytes, compressed_bytes = 0, 0, 0
+        failures = []
+
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = {pool.submit(compress_file, os.path.join(raw_dir, f), output_dir, verify, version, columns): f
+                       for f in files}
+            for future in as_completed(futures):
+                try:
+                    _, count, raw_size, compressed_size, _ = future.result()
+                except Exception as e:
+                    failures.append(futures[future])
+                    self.stderr.write(f'{futures[future]}: {e}')
+                    continue
+                entries += count
+                raw_bytes += raw_size
+                compressed_bytes += compressed_size
+
+        elapsed = time.perf_counter() - start
+        done = len(files) - len(failures)
+
+        self.stdout.write(f'compressed {done}/{len(files)} files ({entries} entries) in {elapsed:.2f}s'
+                          f'{", all verified" if verify else ""}')
+        if elapsed > 0:
+            self.stdout.write(f'throughput: {done / elapsed:.1f} files/s, {entries / elapsed:.0f} entries/s, '
+                              f'{raw_bytes / elapsed / 1e6:.2f} MB/s raw')
+        if raw_bytes:
+            self.stdout.write(f'size: {raw_bytes} -> {compressed_bytes} bytes '
+                              f'({compressed_bytes / raw_bytes * 100:.1f}%)')
+
+        if failures:
+            raise CommandError(f'{len(failures)} files failed: {", ".join(sorted(failures))}')
+
+        if not options["no_pack"] and output_dir == COMPRESSED_DATA_DIR:
+            pack_data(output_dir)
+            self.stdout.write(f'rebuilt {ARCHIVE_PATH}')
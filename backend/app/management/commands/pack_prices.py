@@ -0,0 +1,31 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from app.data.data_processing.decoder import COMPRESSED_DATA_DIR
+from app.data.data_processing.archive import ARCHIVE_PATH, pack_data
+
+'''
+pack_prices
+
+Packs every compressed ticker (app/data/compressed_data/ by default) into the price archive the server maps at
+startup (archive.py). The archive is not checked in; run this as a deploy step, before the server starts, so no
+request ever has to pack it.
+
+usage: python manage.py pack_prices [compressed_dir] [--output PATH]
+'''
+class Command(BaseCommand):
+    help = "Packs the compressed price files into the price archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("compressed_dir", nargs="?", default=COMPRESSED_DATA_DIR)
+        parser.add_argument("--output", default=ARCHIVE_PATH)
+
+    def handle(self, *args, **options):
+        compressed_dir = options["compressed_dir"]
+        if not os.path.isdir(compressed_dir):
+            raise CommandError(f'{compressed_dir} is not a directory')
+
+        start = time.perf_counter()
+        num_tickers = pack_data(compressed_dir, options["output"])
+        self.stdout.write(f'packed {num_tickers} tickers into {options["output"]} in '
+                          f'{time.perf_counter() - start:.2f}s')
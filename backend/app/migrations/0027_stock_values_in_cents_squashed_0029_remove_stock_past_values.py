@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ('app', '0027_stock_values_in_cents'),
+        ('app', '0028_remove_stock_next_values'),
+        ('app', '0029_remove_stock_past_values'),
+    ]
+
+    dependencies = [
+        ('app', '0026_alter_player_interest_earned_and_more'),
+    ]
+
+    # ticks are generated on demand from the price archive, the stock no longer stores its past and next values
+    operations = [
+        migrations.RemoveField(
+            model_name='stock',
+            name='next_values',
+        ),
+        migrations.RemoveField(
+            model_name='stock',
+            name='past_values',
+        ),
+    ]
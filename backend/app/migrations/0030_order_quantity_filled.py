@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0027_stock_values_in_cents_squashed_0029_remove_stock_past_values'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='quantity_filled',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
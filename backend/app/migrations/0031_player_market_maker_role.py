@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0030_order_quantity_filled'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='role',
+            field=models.IntegerField(choices=[(0, 'System'), (1, 'Player'), (2, 'Bot'), (3, 'Market maker')], default=0),
+        ),
+    ]
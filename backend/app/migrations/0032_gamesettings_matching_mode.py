@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0031_player_market_maker_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesettings',
+            name='matching_mode',
+            field=models.IntegerField(choices=[(0, 'Continuous matching'), (1, 'Call auction every tick')], default=0),
+        ),
+    ]
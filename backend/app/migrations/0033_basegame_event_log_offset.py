@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0032_gamesettings_matching_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basegame',
+            name='event_log_offset',
+            field=models.BigIntegerField(default=-1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0033_basegame_event_log_offset'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='type',
+            field=models.IntegerField(choices=[(0, 'Order in Solo Mode'), (1, 'All or None order'), (2, 'Immediate or cancel order'), (3, 'Good for day order'), (4, "Good 'til cancelled order"), (5, 'Fill or kill order')], default=0),
+        ),
+    ]
@@ -1,8 +1,20 @@
+import threading
+import time
+from functools import cached_property
 from django.db import models
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 import uuid
 from django.contrib.postgres.fields import ArrayField
+from .engine.money import to_cents, from_cents
+from .engine.ticks import TickSource
+from .engine.order_book import OrderBook, BookOrder
+from .engine.bots import BotPopulation
+from .engine.market_makers import MarketMakers
+from .engine.state import EngineState, Accounts
+from .engine.interest import InterestLedger
+from .engine.event_log import EventLog, EventLogError, event_log_dir, delete_event_log
+from .engine.replay import replay, ReplayError
 
 
 '''
@@ -26,6 +38,28 @@ class GameManager():
             # key: game id
             # value: game model
             cls._instance.games = {}
+
+            # in-memory engine state (order book, bots, market makers) of the current regular games, created on
+            # first use
+            # key: game id
+            # value: EngineState
+            cls._instance.engines = {}
+
+            # event logs of the games in engines
+            # key: game id
+            # value: EventLog
+            cls._instance.event_logs = {}
+
+            # locks serializing ticks and orders of a game, which can now come from different threads (requests and
+            # the tick scheduler)
+            # key: game id
+            # value: RLock
+            cls._instance.locks = {}
+
+            # state of the current games that is only written to the database every so often, see HotState
+            # key: game id
+            # value: HotState
+            cls._instance.hot_states = {}
         return cls._instance
 
     def register_game(self, game_id):
@@ -44,23 +78,322 @@ class GameManager():
             return -1
         
         del self.games[game_id]
+        self.hot_states.pop(game_id, None)
+        self.engines.pop(game_id, None)
+        event_log = self.event_logs.pop(game_id, None)
+        if event_log is not None:
+            event_log.close()
         return 0
         
     def get_game(self, game_id):
         if game_id not in self.games:
             return None
         return self.games[game_id]
+
+    # returns the lock of a game, to hold while advancing it or changing its order book
+    def lock(self, game_id):
+        lock = self.locks.get(game_id)
+        if lock is None:
+            lock = self.locks.setdefault(game_id, threading.RLock())
+        return lock
+
+    # returns the engine state of a registered regular game, or None if the game is not registered or is a solo game
+    # the first time it is requested, the engine is recovered from the game's event log as of the game's last flush;
+    # games without a usable log (or whose log does not line up with the database) get their engine rebuilt from the
+    # database and a new log
+    def get_engine(self, game_id):
+        game = self.games.get(game_id)
+        if game is None or game.settings.game_type != GameSettings.GAME_BASE:
+            return None
+
+        # built under the game's lock, so a tick or an order never races the build, and a game is only built once
+        if game_id not in self.engines:
+            with self.lock(game_id):
+                if game_id not in self.engines:
+                    self._load_engine(game_id)
+        return self.engines[game_id]
+
+    # recovers or builds the engine of a game, with its event log and hot state; they are only registered once they
+    # are complete
+    def _load_engine(self, game_id):
+        game = self.games[game_id]
+        try:
+            event_log = EventLog(event_log_dir(), game_id)
+        except EventLogError:
+            # a log written by another version can not be recovered from, the engine starts over below
+            delete_event_log(game_id)
+            event_log = EventLog(event_log_dir(), game_id)
+        engine = self._recover_engine(game, event_log)
+        recovered = engine is not None
+        if not recovered:
+            engine = self.build_engine(game)
+            event_log.reset()
+            event_log.snapshot(engine)
+
+            # the database points at the new log before anything else is written to it
+            game.event_log_offset = event_log.size
+            BaseGame.objects.filter(id=game.id).update(event_log_offset=game.event_log_offset)
+
+        # a hot state that is already registered may hold state that is not flushed yet, it is never replaced
+        hot = self.hot_states.get(game_id)
+        if hot is None:
+            hot = HotState(game, engine=engine, event_log=event_log, orders=game.stock.pending_orders.all())
+        else:
+            hot.engine = engine
+            hot.event_log = event_log
+        if recovered:
+            self._resubmit_orders(hot)
+        self.event_logs[game_id] = event_log
+        self.hot_states[game_id] = hot
+        self.engines[game_id] = engine
+
+    # returns the hot state of a registered game, or None if the game is not registered
+    def get_hot_state(self, game_id):
+        game = self.games.get(game_id)
+        if game is None:
+            return None
+
+        if game_id not in self.hot_states:
+            if game.settings.game_type == GameSettings.GAME_BASE:
+                self.get_engine(game_id)
+            else:
+                with self.lock(game_id):
+                    if game_id not in self.hot_states:
+                        self.hot_states[game_id] = HotState(game, player=game.players.all().first(),
+                                                            orders=game.stock.pending_orders.all())
+        return self.hot_states[game_id]
+
+    # replays the game's event log up to the offset of the game's last flush, and drops whatever was logged after it;
+    # returns None if there is nothing to replay or the log is unusable
+    def _recover_engine(self, game, event_log):
+        offset = game.event_log_offset
+        if offset < 0 or not event_log.snapshot_index:
+            return None
+        try:
+            engine, end = replay(event_log, end=offset)
+        except (ReplayError, EventLogError):
+            return None
+        if end != offset or engine.tick != game.stock.ticks_generated:
+            return None
+        event_log.truncate(offset)
+
+        # the database stays the authority for the players' orders and cash: orders that were taken out of the game
+        # while it was not running are cancelled, and the players' accounts are reloaded
+        stock = game.stock
+        placed = set(stock.pending_orders.filter(status=Order.STATUS_PLACED).values_list("id", flat=True))
+        book = engine.book
+        for order_id in [order_id for order_id in [*book.orders, *book.parked]
+                         if not isinstance(order_id, tuple) and order_id not in placed]:
+            book.cancel(order_id)
+            event_log.cancel(order_id)
+        engine.accounts = Accounts.from_players(game.players.filter(role=Player.ROLE_PLAYER).order_by("id"),
+                                                str(stock.id))
+        return engine
+
+    # orders placed after the game's last flush were cut from the event log with everything else after it; they are
+    # still placed in the database, and go to the book again in the order they were placed
+    def _resubmit_orders(self, hot):
+        book = hot.engine.book
+        for order in sorted(hot.orders.values(), key=lambda order: order.timestamp):
+            if order.status != Order.STATUS_PLACED or order.id in book.orders or order.id in book.parked:
+                continue
+            book_order = BookOrder.from_order(order)
+            book_order.quantity = book_order.remaining = book_order.quantity - order.quantity_filled
+            hot.event_log.order(book_order)
+            hot.settle(book.submit(book_order))
+            if book_order.cancelled:
+                hot.cancel(order.id, order.day_placed_on)
+
+    # builds the engine of a game from the database: the book from the stock's pending orders, the bots, market
+    # makers and players from their Players; the headless simulation (simulation.py) starts from it as well
+    def build_engine(self, game):
+        stock = game.stock
+        stock_id = str(stock.id)
+        settings = game.settings
+
+        book = OrderBook(auction=settings.matching_mode == GameSettings.MATCHING_CALL_AUCTION)
+        book.tick = stock.ticks_generated
+        for order in stock.pending_orders.filter(status=Order.STATUS_PLACED).order_by("timestamp"):
+            book_order = BookOrder.from_order(order)
+            book_order.remaining -= order.quantity_filled
+            book.submit(book_order)
+
+        price = stock.tick_source.price_at(stock.ticks_generated)
+        players = game.players.order_by("id")
+        humans = list(players.filter(role=Player.ROLE_PLAYER))
+        bot_players = list(players.filter(role=Player.ROLE_BOT))
+        market_maker_players = list(players.filter(role=Player.ROLE_MARKET_MAKER))
+        bots = BotPopulation.from_players(bot_players, stock_id, game.seed, settings.volatility)
+        market_makers = MarketMakers.from_players(market_maker_players, stock_id, game.seed, settings.volatility, price)
+        accounts = Accounts.from_players(humans, stock_id)
+        interest = InterestLedger.from_players([*humans, *bot_players, *market_maker_players],
+                                               settings.num_trading_days)
+        return EngineState(book, bots, market_makers, accounts, interest, settings.num_ticks_per_day,
+                           stock.ticks_generated, price)
+
+    # returns the event log of a registered regular game, or None if the game is not registered or is a solo game
+    def get_event_log(self, game_id):
+        if self.get_engine(game_id) is None:
+            return None
+        return self.event_logs[game_id]
+
+    # returns the order book of a registered regular game, or None if the game is not registered or is a solo game
+    def get_order_book(self, game_id):
+        engine = self.get_engine(game_id)
+        return engine.book if engine is not None else None
+
+    # returns the bot population of a registered regular game, or None if the game is not registered or is a solo game
+    def get_bots(self, game_id):
+        engine = self.get_engine(game_id)
+        return engine.bots if engine is not None else None
+
+    # returns the market makers of a registered regular game, or None if the game is not registered or is a solo game
+    def get_market_makers(self, game_id):
+        engine = self.get_engine(game_id)
+        return engine.market_makers if engine is not None else None
+
+    # returns the in-memory participants of a registered regular game (bots and market makers), see settlement.py
+    def get_populations(self, game_id):
+        engine = self.get_engine(game_id)
+        return engine.populations if engine is not None else ()
+
+
+'''
+HotState
+
+The state of a running game that changes on every tick and order, kept in memory by the GameManager and only written
+to the database every so often (write-behind, see flush() in engine/settlement.py):
+stock: the game's stock, with its price cursor (ticks_generated, current_price)
+engine: regular games only, the EngineState with the cash, shares and interest per day of every player
+event_log: regular games only, the game's EventLog
+player: solo games only, the game's player, with their cash, shares and interest per day
+orders: the game's open orders (the stock's pending orders) by id, with their filled quantity and status
+
+While a game is registered this is the authority for all of the above. A game is flushed on the first tick at least
+GAME_STATE_FLUSH_INTERVAL seconds after its last flush, after its last tick, when it is paused or removed from the
+game manager, and before a request reads any of it from the database.
+
+Durability: every flush is a single transaction, so the database always holds a game as it was at its last flush.
+Only new orders are written as they are placed. A crash loses what happened since the last flush and the game goes
+on from there: a regular game's event log is cut back to the offset of the flush (BaseGame.event_log_offset), then
+the orders that were placed after it are submitted to the book again in the order they were placed, while a solo
+game's pending orders are simply settled on its next tick.
+'''
+class HotState():
+    def __init__(self, game, engine=None, event_log=None, player=None, orders=()):
+        self.game = game
+        self.stock = game.stock
+        self.engine = engine
+        self.event_log = event_log
+        self.player = player
+
+        # open orders by id, and the ids of the ones that changed since the last flush
+        self.orders = {order.id: order for order in orders}
+        self.changed = set()
+
+        # regular games: orders that were filled since the last tick, they get confirmed on the next one
+        self.unconfirmed = []
+        if engine is not None:
+            self.unconfirmed = [order for order in self.orders.values() if order.status == Order.STATUS_FILLED]
+
+        # whether the stock (or the solo player) changed since the last flush, and when that was
+        self.dirty = False
+        self.flushed_at = time.monotonic()
+
+    def add_order(self, order):
+        self.orders[order.id] = order
+
+    # takes orders out of the game without changing them
+    def drop(self, order_ids):
+        for order_id in order_ids:
+            self.orders.pop(order_id, None)
+            self.changed.discard(order_id)
+
+    # settles fills of the game's engine: applies them to the engine's players and to the orders involved (orders
+    # that are completely filled move to STATUS_FILLED), and logs them
+    def settle(self, fills):
+        if not fills:
+            return
+
+        self.engine.apply_fills(fills)
+        for fill in fills:
+            for ref in (fill.buy_ref, fill.sell_ref):
+                order = self.orders.get(ref) if ref is not None else None
+                if order is None:
+                    continue
+                order.quantity_filled += fill.quantity
+                self.changed.add(ref)
+                if order.quantity_filled >= abs(order.quantity):
+                    order.status = Order.STATUS_FILLED
+                    self.unconfirmed.append(order)
+        if self.event_log is not None:
+            self.event_log.fills(fills)
+
+    # marks an order that the matching engine cancelled or expired, on trading day
+    def cancel(self, order_id, day):
+        order = self.orders.get(order_id)
+        if order is not None:
+            order.status = Order.STATUS_CANCELLED
+            order.day_confirmed_on = day
+            self.changed.add(order_id)
+
+    # confirms the orders that were filled since the last tick, on trading day
+    def confirm(self, day):
+        for order in self.unconfirmed:
+            order.status = Order.STATUS_CONFIRMED
+            order.day_confirmed_on = day
+            self.changed.add(order.id)
+        self.unconfirmed.clear()
+
+    # solo games: settles every pending order, each trading its whole quantity at its price; the orders are confirmed
+    # on the day they were placed
+    def settle_solo(self):
+        cash = 0
+        shares = 0
+        for order in self.orders.values():
+            if order.status != Order.STATUS_FILLED:
+                continue
+            cash -= order.quantity * to_cents(order.price)
+            shares += order.quantity
+            order.status = Order.STATUS_CONFIRMED
+            order.day_confirmed_on = order.day_placed_on
+            self.changed.add(order.id)
+
+        if cash or shares:
+            stock_id = str(self.stock.id)
+            player = self.player
+            player.money = from_cents(to_cents(player.money) + cash)
+            player.owned_stocks[stock_id] = player.owned_stocks.get(stock_id, 0) + shares
+            self.dirty = True
+
+    # called once everything was written: the closed orders are forgotten
+    def flushed(self):
+        for order_id in self.changed:
+            order = self.orders.get(order_id)
+            if order is not None and order.status in (Order.STATUS_CONFIRMED, Order.STATUS_CANCELLED):
+                del self.orders[order_id]
+        self.changed.clear()
+
+        engine = self.engine
+        if engine is not None:
+            for population in (engine.accounts, *engine.populations):
+                population.dirty = False
+            engine.interest.dirty = False
+        self.dirty = False
+        self.flushed_at = time.monotonic()
     
 
+
 '''
 Player
 
 Player object; holds player id, player role, amount of money player, and player's owned stocks
 For players owned stocks, key is stock id and value is quantity owned
-3 roles:
+4 roles:
 System: who the player makes transactions with in a solo game (not used currently)
 Player: the player
 Bot: bots in the game that the player is trading against
+Market maker: quotes both sides of the order book in regular games, so there is always someone to trade with
 
 play_style: used for bots to determine the style of play that they have
 
@@ -71,11 +404,13 @@ class Player(models.Model):
     ROLE_SYSTEM = 0
     ROLE_PLAYER = 1
     ROLE_BOT = 2
+    ROLE_MARKET_MAKER = 3
 
     ROLE_CHOICES = [
         (ROLE_SYSTEM, "System"),
         (ROLE_PLAYER, "Player"),
         (ROLE_BOT, "Bot"),
+        (ROLE_MARKET_MAKER, "Market maker"),
     ]
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     role = models.IntegerField(choices=ROLE_CHOICES, default = ROLE_SYSTEM)
@@ -103,6 +438,11 @@ Order
 Order that a player places for a stock
 Type: type or order
 TYPE_SOLO: orders placed in solo mode, these get executed immediately
+TYPE_ALL_OR_NONE: trades its whole quantity at once; waits outside the order book until that is possible
+TYPE_IMMEDIATE_OR_CANCEL: trades what it can immediately, the rest is cancelled
+TYPE_GOOD_FOR_DAY: rests in the order book until filled or until the end of the trading day it was placed on
+TYPE_GOOD_TIL_CANCELLED: rests in the order book until filled or cancelled
+TYPE_FILL_OR_KILL: trades its whole quantity immediately, or is cancelled without trading
 
 Status: status of order
 STATUS_PLACED: order has been placed
@@ -120,6 +460,7 @@ tick immediately after when the order has been fulfilled and transitioned to STA
 from_player: player that placed the order
 timestamp: timestamp at which order was placed
 quantity: amount of stocks to purchase/sell, a non-zero integer; negative values reflect selling the stock
+quantity_filled: amount of stocks that have been traded so far in regular mode, always positive
 price: in solo mode, price of stock at time of order, or in regular mode, price that user want to buy/sell at
 
 day_placed_on: what trading day the order was placed on
@@ -159,6 +500,7 @@ class Order(models.Model):
     from_player = models.ForeignKey(Player, related_name="from_player", on_delete=models.CASCADE)
     timestamp = models.DateTimeField(default=timezone.now, editable=False)
     quantity = models.BigIntegerField()
+    quantity_filled = models.BigIntegerField(default=0)
     price = models.DecimalField(default=0, decimal_places=2, max_digits=20)
     day_placed_on = models.IntegerField(default=0)
     day_confirmed_on = models.IntegerField(default=0)
@@ -172,6 +514,7 @@ class Order(models.Model):
             "from_player": self.from_player.to_dict(),
             "timestamp": self.timestamp,
             "quantity": self.quantity,
+            "quantity_filled": self.quantity_filled,
             "price": self.price,
             "day_placed_on": self.day_placed_on,
             "day_confirmed_on": self.day_confirmed_on
@@ -189,8 +532,9 @@ generate random events in the game.
 ticks_generated: number of ticks generated for this stock
 underlying_stock: name of the real-world stock that prices are derived from
 first_tick_index: the index from the stock data that corresponds to the first price generated
-past_values: stock values that have been generated
-next_values: next stock values
+tick_source: lazily generates stock values from underlying_stock and first_tick_index (not stored)
+past_values: stock values that have been generated, in cents; derived from tick_source up to ticks_generated,
+so advancing a tick only writes ticks_generated and current_price
 
 pending_orders: orders that are stil pending
 fulfilled_orders: order that have been fulfilled
@@ -210,8 +554,6 @@ class Stock(models.Model):
     buy_orders = models.JSONField(default=dict)
     sell_orders = models.JSONField(default=dict)
 
-    past_values = ArrayField(models.DecimalField(default=0, decimal_places=2, max_digits=20), default=list)
-    next_values = ArrayField(models.DecimalField(default=0, decimal_places=2, max_digits=20), default=list)
 
     pending_orders = models.ManyToManyField(Order, related_name="pending_orders")
     fulfilled_orders = models.ManyToManyField(Order, related_name="fulfilled_orders")
@@ -229,11 +571,18 @@ class Stock(models.Model):
             "first_tick_index": self.first_tick_index,
             "buy_orders": self.buy_orders,
             "sell_orders": self.sell_orders,
-            "next_values": self.next_values,
-            "past_values": self.past_values,
+            "past_values": [from_cents(value) for value in self.past_values],
             "pending_orders": [order.to_dict() for order in self.pending_orders.all()],
             "fulfilled_orders": [order.to_dict() for order in self.fulfilled_orders.all()]
         }
+
+    @cached_property
+    def tick_source(self):
+        return TickSource(self.underlying_stock, self.first_tick_index)
+
+    @property
+    def past_values(self):
+        return self.tick_source.history(self.ticks_generated).tolist()
     
 
 
@@ -256,6 +605,17 @@ class GameSettings(models.Model):
         (GAME_OPTIONS, "Options mode")
     ]
 
+    # how orders are matched in regular games
+    # continuous: every order is matched against the order book as soon as it arrives
+    # call auction: orders are collected during a tick and cleared together at a single price on the next tick
+    MATCHING_CONTINUOUS = 0
+    MATCHING_CALL_AUCTION = 1
+
+    MATCHING_CHOICES = [
+        (MATCHING_CONTINUOUS, "Continuous matching"),
+        (MATCHING_CALL_AUCTION, "Call auction every tick")
+    ]
+
     game_type = models.IntegerField(choices=GAME_CHOICES, default = GAME_BASE_SOLO)
     num_bots = models.IntegerField(default=30)
     num_market_makers = models.IntegerField(default=3)
@@ -265,6 +625,7 @@ class GameSettings(models.Model):
     starting_cash = models.IntegerField(default=1000)
     volatility = models.IntegerField(default=10)
     seed = models.TextField(default="")
+    matching_mode = models.IntegerField(choices=MATCHING_CHOICES, default = MATCHING_CONTINUOUS)
 
 
     def to_dict(self):
@@ -278,7 +639,8 @@ class GameSettings(models.Model):
             "time_between_ticks": self.time_between_ticks,
             "starting_cash": self.starting_cash,
             "volatility": self.volatility,
-            "seed": self.seed
+            "seed": self.seed,
+            "matching_mode": self.get_matching_mode_display()
         }
 
 
@@ -296,6 +658,8 @@ stock: stock object associated with this game
 time_to_next_tick: amount of time left to the next game time; used when pausing/resuming the game
 is_paused: whether the game is paused or not
 settings: settings associated with the game
+event_log_offset: regular games, the offset of the game's event log as of the last time the game's state was written
+to the database (-1 if it never was); the event log is cut back to it when the game is loaded again, see HotState
 
 '''
 class BaseGame(models.Model):
@@ -308,6 +672,7 @@ class BaseGame(models.Model):
     time_to_next_tick = models.FloatField(default=-1)
     is_paused = models.BooleanField(default=True)
     settings = models.ForeignKey(GameSettings, related_name="settings",  on_delete=models.CASCADE, default=None)
+    event_log_offset = models.BigIntegerField(default=-1)
 
     def to_dict(self):
         return {
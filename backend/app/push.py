@@ -0,0 +1,100 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .engine.money import from_cents
+
+'''
+Push
+
+Sends game updates to the WebSocket connections of a game (consumers.py). Every game has one channel layer group;
+a tick or a batch of fills is computed once and sent to the group as a single message, and each connection picks
+out what it shows its own player.
+
+Messages only hold strings and numbers (money and prices as strings, like the REST views), so they go through any
+channel layer:
+game.tick: tick, price, order_book_deltas (regular games), trades (volume and last price of the tick), fills (the
+    fills of players, per player and order), players (cash and shares of the players, by player id)
+game.fills: fills and players as above, for fills that happened between ticks (a player's order trading on arrival)
+'''
+
+
+def game_group(game_id):
+    return f'game_{game_id}'
+
+
+def _send(game_id, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        async_to_sync(channel_layer.group_send)(game_group(game_id), message)
+
+
+def _money(cents):
+    return str(from_cents(cents))
+
+
+# the fills of the players in accounts (an Accounts), one entry per player and order involved
+def _player_fills(fills, accounts):
+    entries = []
+    for fill in fills:
+        for player_id, ref, side in ((fill.buy_player_id, fill.buy_ref, "buy"),
+                                     (fill.sell_player_id, fill.sell_ref, "sell")):
+            if player_id in accounts:
+                entries.append({
+                    "player_id": str(player_id),
+                    "order_id": str(ref) if ref is not None else None,
+                    "side": side,
+                    "price": _money(fill.price),
+                    "quantity": fill.quantity,
+                    "tick": fill.tick
+                })
+    return entries
+
+
+def _balances(accounts):
+    return {str(player_id): {"money": _money(accounts.cash[player_id]), "shares": accounts.shares[player_id]}
+            for player_id in accounts.player_ids}
+
+
+# pushes a regular game's tick: its price (cents), the order book levels that changed, and the fills of the tick
+def push_regular_tick(game_id, engine, fills):
+    book = engine.book
+    deltas = book.deltas_since(book.depth_version - 1)
+    _send(game_id, {
+        "type": "game.tick",
+        "tick": engine.tick,
+        "price": _money(engine.price),
+        "order_book_deltas": {
+            "version": deltas["version"],
+            "bids": [[_money(price), quantity] for price, quantity in deltas["bids"]],
+            "asks": [[_money(price), quantity] for price, quantity in deltas["asks"]]
+        },
+        "trades": {
+            "volume": sum(fill.quantity for fill in fills),
+            "last_price": _money(fills[-1].price) if fills else None
+        },
+        "fills": _player_fills(fills, engine.accounts),
+        "players": _balances(engine.accounts)
+    })
+
+
+# pushes fills of a regular game that happened between ticks
+def push_fills(game_id, engine, fills):
+    if fills:
+        _send(game_id, {
+            "type": "game.fills",
+            "fills": _player_fills(fills, engine.accounts),
+            "players": _balances(engine.accounts)
+        })
+
+
+# pushes a solo game's tick, with the cash and shares of its player
+def push_solo_tick(game_id, stock, player):
+    _send(game_id, {
+        "type": "game.tick",
+        "tick": stock.ticks_generated,
+        "price": str(stock.current_price),
+        "order_book_deltas": None,
+        "trades": None,
+        "fills": [],
+        "players": {str(player.id): {"money": str(player.money),
+                                     "shares": player.owned_stocks.get(str(stock.id), 0)}}
+    })
@@ -36,6 +36,8 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    # daphne replaces runserver with an ASGI server, so the game WebSockets (app/consumers.py) are served too
+    "daphne",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -44,7 +46,8 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "app",
     "rest_framework",
-    "corsheaders"
+    "corsheaders",
+    "channels"
 ]
 
 MIDDLEWARE = [
@@ -81,6 +84,15 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "app.wsgi.application"
+ASGI_APPLICATION = "app.asgi.application"
+
+# groups of the game WebSockets (app/push.py); the in-memory layer only reaches connections of the same process,
+# use channels_redis' RedisChannelLayer when running more than one
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer"
+    }
+}
 
 
 # Database
@@ -140,6 +152,32 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Price data settings
+# maximum total size of the decoded price series kept in memory by each process
+PRICE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+# Event log settings
+# directory of the regular games' event logs and engine snapshots
+EVENT_LOG_DIR = BASE_DIR / "event_logs"
+# ticks between two snapshots of a game's engine; replaying a game never covers more ticks than this
+EVENT_LOG_SNAPSHOT_INTERVAL = 100
+
+
+# Tick scheduler settings
+# whether registered games tick on the server (every time_between_ticks seconds) unless the client says otherwise;
+# with False, games only tick when the client asks for the next price
+SERVER_TICKS = False
+# worker threads running the scheduled games' ticks
+TICK_SCHEDULER_WORKERS = 4
+
+
+# Game state settings
+# seconds between two writes of a running game's in-memory state (prices, cash, positions, orders) to the database,
+# 0 writes it on every tick; a crash loses at most this much of a game, which goes on from its last write
+GAME_STATE_FLUSH_INTERVAL = 5
+
+
 # Celery settings
 CELERY_BROKER_URL = "redis://redis:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
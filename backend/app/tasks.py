@@ -1,9 +1,11 @@
 from celery import shared_task
-from .models import Order, Stock, Player
-from decimal import Decimal
+from .models import Order, Stock, Player, GameManager
+from .engine.order_book import BookOrder
+from .push import push_fills
 
 
 SUCCESS = 1
+FAILURE = 0
 
 @shared_task
 def my_test_task():
@@ -13,49 +15,46 @@ def my_test_task():
 
 # handles purchasing of a stock by a player in solo mode
 # this function will move the order into the pending orders list of the stock object, and update the status of the order
-# the process_buy_stock_solo object, which will get triggered on the next game tick, will apply changes to the models
+# the order gets settled on the next game tick, together with the other pending orders (see HotState.settle_solo())
 @shared_task
-def handle_buy_stock_solo(order, stock):
+def handle_buy_stock_solo(order, stock, game_id=None):
     order.status = Order.STATUS_FILLED
     order.save()
     stock.pending_orders.add(order)
-    stock.save()
-    return SUCCESS
-
-
-# this function runs every game tick, processing all the orders in the pending orders list of the stock object
-@shared_task
-def process_buy_stock_solo(order, stock):
-    player = order.from_player
-    quantity = order.quantity
-    price = order.price
-    stock_id = str(stock.id)
-
-    total_cost = Decimal(str(quantity * price)).quantize(Decimal("0.01"))
-
-    # add check to see if player has enough money? or allow player to go negative?
-    player.money -= total_cost
-
-    if stock_id not in player.owned_stocks:
-        player.owned_stocks[stock_id] = 0
-
-    player.owned_stocks[stock_id] += quantity
-
-    player.save()
-
-    order.status = Order.STATUS_CONFIRMED
-    order.day_confirmed_on = order.day_placed_on
-    order.save()
 
+    manager = GameManager()
+    if game_id is not None and manager.get_game(game_id) is not None:
+        with manager.lock(game_id):
+            manager.get_hot_state(game_id).add_order(order)
     return SUCCESS
 
 
 # handles purchasing of a stock in regular mode
-# TODO
+# the order is sent to the game's matching engine; whatever trades immediately is settled right away, the rest
+# rests in the order book (and in the stock's pending orders) until it is matched by a later order
 @shared_task
-def handle_buy_stock_regular(order, stock):
+def handle_buy_stock_regular(order, stock, game_id):
+    manager = GameManager()
+    engine = manager.get_engine(game_id)
+    if engine is None:
+        return FAILURE
+
+    # the order itself is written right away, what happens to it afterwards is written on the game's next flush
     order.status = Order.STATUS_PLACED
     order.save()
     stock.pending_orders.add(order)
-    stock.save()
+
+    # the game may be ticking on the scheduler's thread at the same time
+    with manager.lock(game_id):
+        hot = manager.get_hot_state(game_id)
+        hot.add_order(order)
+        book_order = BookOrder.from_order(order)
+        hot.event_log.order(book_order)
+        fills = engine.book.submit(book_order)
+        hot.settle(fills)
+
+        # killed fill or kill orders and the unfilled part of immediate or cancel orders never rest in the book
+        if book_order.cancelled:
+            hot.cancel(order.id, order.day_placed_on)
+    push_fills(game_id, engine, fills)
     return SUCCESS
\ No newline at end of file
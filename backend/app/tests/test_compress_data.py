@@ -0,0 +1,19 @@
+import numpy as np
+from django.test import SimpleTestCase
+from app.data.data_processing.compress_data import encode_prices, encode_columns
+from app.data.data_processing.decoder import decode_prices, decode_window, encode_index, parse_index
+
+
+class CompressDataTests(SimpleTestCase):
+    # a series of a single price has a header and no delta entries, in both format versions
+    def test_single_entry_round_trip(self):
+        for encoded in (encode_prices([1234]), encode_columns({"close": [1234]})):
+            self.assertEqual(decode_prices(encoded).tolist(), [1234])
+            self.assertEqual(decode_window(encoded, 0, 5, parse_index(encode_index(encoded))).tolist(), [1234])
+
+    def test_round_trip(self):
+        prices = np.random.default_rng(0).integers(100, 100000, 1000)
+        for encoded in (encode_prices(prices), encode_columns({"close": prices})):
+            self.assertTrue(np.array_equal(decode_prices(encoded), prices))
+            self.assertTrue(np.array_equal(decode_window(encoded, 300, 50, parse_index(encode_index(encoded))),
+                                           prices[300:350]))
@@ -0,0 +1,34 @@
+import os
+import tempfile
+from django.test import SimpleTestCase
+from ..engine.event_log import EventLog, EventLogError, EVENT_TICK, SNAPSHOT_HEADER
+
+
+class ReadOnlyEventLogTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def test_missing_log_is_not_created(self):
+        with self.assertRaises(EventLogError):
+            EventLog(self.directory, "game", read_only=True)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_snapshot_being_written_is_left_alone(self):
+        writer = EventLog(self.directory, "game")
+        writer.tick(1, 10000)
+
+        # a snapshot the writer is still in the middle of
+        writer._snapshots.write(SNAPSHOT_HEADER.pack(1, writer.size, 100) + bytes(10))
+        writer._snapshots.flush()
+        size = os.path.getsize(writer.snapshot_path)
+
+        reader = EventLog(self.directory, "game", read_only=True)
+        self.assertEqual(reader.snapshot_index, [])
+        self.assertEqual([event.kind for event in reader.events()], [EVENT_TICK])
+        reader.close()
+        self.assertEqual(os.path.getsize(writer.snapshot_path), size)
+
+        # a writer opening it again drops it
+        writer.close()
+        EventLog(self.directory, "game").close()
+        self.assertLess(os.path.getsize(writer.snapshot_path), size)
@@ -0,0 +1,45 @@
+import tempfile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from ..models import BaseGame, GameManager, Player, Order
+
+
+@override_settings(EVENT_LOG_DIR=tempfile.mkdtemp())
+class SoloGameManagerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post("/create-base-game-solo/", {
+            "num_trading_days": 3, "num_ticks_per_day": 20, "time_between_ticks": 1, "starting_cash": 1000,
+            "volatility": 10, "seed": "solo"
+        }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.game = BaseGame.objects.get(id=response.data["base_game"]["id"])
+        self.game_id = str(self.game.id)
+        self.player = self.game.players.get(role=Player.ROLE_PLAYER)
+
+        self.manager = GameManager()
+        self.assertEqual(self.client.post(f'/register-base-game/{self.game_id}/').status_code, 200)
+        self.addCleanup(self.manager.remove_game, self.game_id)
+
+    def tick(self):
+        response = self.client.post(f'/get-next-base-game-price-solo/{self.game_id}/', {"trading_day": 1}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_solo_game_has_no_engine(self):
+        self.tick()
+        hot = self.manager.get_hot_state(self.game_id)
+
+        self.assertIsNone(self.manager.get_engine(self.game_id))
+        self.assertEqual(self.client.get(f'/get-order-book/{self.game_id}/').status_code, 400)
+        response = self.client.post("/create-base-order/", {
+            "order_type": Order.TYPE_GOOD_TIL_CANCELLED, "player_id": str(self.player.id),
+            "timestamp": "2024-01-01T00:00:00Z", "quantity": 1, "price": "10.00", "game_id": self.game_id,
+            "stock_id": str(self.game.stock.id), "day_placed_on": 1
+        }, format="json")
+        self.assertNotEqual(response.status_code, 200)
+
+        # the solo game's hot state is untouched and the game keeps ticking
+        self.assertNotIn(self.game_id, self.manager.engines)
+        self.assertIs(self.manager.get_hot_state(self.game_id), hot)
+        self.assertEqual(hot.player.id, self.player.id)
+        self.tick()
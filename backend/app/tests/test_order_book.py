@@ -0,0 +1,33 @@
+from django.test import SimpleTestCase
+from ..engine.order_book import OrderBook, BookOrder, BUY, SELL
+
+
+class OrderBookTests(SimpleTestCase):
+    def test_requoting_keeps_the_level_queue_bounded(self):
+        book = OrderBook()
+        book.submit(BookOrder("resting", 1, BUY, 100, 5))
+        book.submit(BookOrder("bot", 2, BUY, 100, 1))
+
+        # every increase moves the order to the back of its level and leaves its old entry behind
+        for quantity in range(2, 10002):
+            self.assertEqual(book.amend("bot", quantity=quantity), [])
+
+        level = book.bids.levels[100]
+        self.assertEqual(level.quantity, 5 + 10001)
+        self.assertLessEqual(len(level.orders), 4)
+        self.assertEqual(level.dead, sum(1 for order in level.orders if not order.active))
+
+    def test_cancel_and_amend_by_id_keep_time_priority(self):
+        book = OrderBook()
+        for order_id in ("first", "second", "third"):
+            book.submit(BookOrder(order_id, order_id, SELL, 100, 1))
+
+        self.assertTrue(book.cancel("second"))
+        self.assertFalse(book.cancel("second"))
+        # a price change requeues the order behind everything resting at the new price
+        book.amend("first", price=99)
+        book.amend("first", price=100)
+
+        fills = book.submit(BookOrder("buyer", "buyer", BUY, 100, 2))
+        self.assertEqual([fill.sell_order_id for fill in fills], ["third", "first"])
+        self.assertEqual(len(book.asks), 0)
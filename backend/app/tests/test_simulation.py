@@ -0,0 +1,49 @@
+import tempfile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from ..models import BaseGame, Player, Order
+
+
+@override_settings(EVENT_LOG_DIR=tempfile.mkdtemp())
+class SimulationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response = self.client.post("/create-base-game-regular/", {
+            "num_bots": 20, "num_market_makers": 3, "num_trading_days": 3, "num_ticks_per_day": 20,
+            "time_between_ticks": 1, "starting_cash": 1000, "volatility": 10, "seed": "simulation"
+        }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.game = BaseGame.objects.get(id=response.data["base_game"]["id"])
+        self.player = self.game.players.get(role=Player.ROLE_PLAYER)
+
+    def simulate(self, script):
+        response = self.client.post(f'/simulate-base-game/{self.game.id}/', {"orders": script}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data["summary"]
+
+    def test_scripted_orders_are_stored(self):
+        summary = self.simulate([
+            # crosses the market makers' quotes right away
+            {"tick": 3, "quantity": 5, "price": "1000.00", "order_type": Order.TYPE_GOOD_TIL_CANCELLED},
+            # nobody buys this high, and it does not rest
+            {"tick": 10, "quantity": -2, "price": "9999.00", "order_type": Order.TYPE_IMMEDIATE_OR_CANCEL},
+            # nobody sells this low, it rests to the end of the game
+            {"tick": 20, "quantity": 4, "price": "0.01", "order_type": Order.TYPE_GOOD_TIL_CANCELLED},
+        ])
+        self.assertEqual(summary["orders"]["placed"], 3)
+
+        orders = Order.objects.filter(from_player=self.player).order_by("quantity")
+        self.assertEqual([(order.quantity, order.quantity_filled, order.status) for order in orders], [
+            (-2, 0, Order.STATUS_CANCELLED),
+            (4, 0, Order.STATUS_PLACED),
+            (5, 5, Order.STATUS_CONFIRMED),
+        ])
+
+        stock = self.game.stock
+        stock.refresh_from_db()
+        self.assertEqual(stock.ticks_generated, 60)
+        self.assertEqual(set(stock.pending_orders.values_list("quantity", flat=True)), {4})
+        self.assertEqual(set(stock.fulfilled_orders.values_list("quantity", flat=True)), {5, -2})
+
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.owned_stocks[str(stock.id)], 5)
@@ -17,7 +17,9 @@ from django.contrib import admin
 from django.urls import path
 from .views.game import create_base_game_solo, delete_base_game, get_game_manager, register_base_game, get_next_base_game_price_solo, get_next_base_game_price_regular
 from .views.game import create_tutorial, pause_base_game, resume_base_game, remove_game_from_manager, create_base_game_regular
-from .views.stock import create_base_order, remove_pending_orders, get_orders_placed_on_day
+from .views.game import get_order_book, get_order_book_deltas, get_game_state_at_tick, get_scheduler_stats
+from .views.game import simulate_base_game
+from .views.stock import create_base_order, remove_pending_orders, get_orders_placed_on_day, get_price_cache_stats
 from .views.player import get_interest_earned_and_paid
 
 urlpatterns = [
@@ -36,6 +38,12 @@ urlpatterns = [
     path('create-base-order/', create_base_order, name='create-base-order'),
     path('remove-pending-orders/<str:stock_id>/', remove_pending_orders, name='remove-pending-orders'),
     path('get-orders-placed-on-day/', get_orders_placed_on_day, name='get-orders-placed-on-day'),
-    path('get-interest-earned-and-paid/<str:player_id>/<str:trading_day>/', get_interest_earned_and_paid, name='get-interest-earned-and-paid')
+    path('get-interest-earned-and-paid/<str:player_id>/<str:trading_day>/', get_interest_earned_and_paid, name='get-interest-earned-and-paid'),
+    path('get-price-cache-stats/', get_price_cache_stats, name='get-price-cache-stats'),
+    path('get-order-book/<str:game_id>/', get_order_book, name='get-order-book'),
+    path('get-order-book-deltas/<str:game_id>/<str:version>/', get_order_book_deltas, name='get-order-book-deltas'),
+    path('get-game-state-at-tick/<str:game_id>/<str:tick>/', get_game_state_at_tick, name='get-game-state-at-tick'),
+    path('get-scheduler-stats/', get_scheduler_stats, name='get-scheduler-stats'),
+    path('simulate-base-game/<str:game_id>/', simulate_base_game, name='simulate-base-game')
     ]
 
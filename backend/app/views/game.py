@@ -1,11 +1,19 @@
-from decimal import Decimal
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from ..models import BaseGame, GameManager, Player, GameSettings
-from ..engine.prices import getNextPriceSolo, getNextPriceRegular
+from ..engine.prices import getNextPriceSolo, getNextPriceRegular, apply_interest_solo
+from ..engine.money import from_cents
+from ..engine.settlement import flush_game
+from ..engine.event_log import EventLog, EventLogError, event_log_dir, delete_event_log
+from ..engine.replay import replay, ReplayError
+from ..engine.scheduler import get_scheduler
+from ..engine.simulation import simulate, SimulationError
+from ..push import push_solo_tick
+from django.conf import settings as django_settings
+from django.core.exceptions import ObjectDoesNotExist
 from .player import create_player
-from .stock import create_stock
+from .stock import create_stock, book_levels_to_dict
 
 import string
 import random
@@ -81,12 +89,18 @@ def create_base_game_regular(request):
     starting_cash = request.data.get("starting_cash")
     volatility = request.data.get("volatility")
     seed = request.data.get("seed")
+    matching_mode = request.data.get("matching_mode", GameSettings.MATCHING_CONTINUOUS)
 
     # generate a random seed if no seed provided
     if seed is None or seed == "":
         characters = string.ascii_letters + string.digits
         seed = ''.join(random.choices(characters, k=16))
 
+    if matching_mode not in (GameSettings.MATCHING_CONTINUOUS, GameSettings.MATCHING_CALL_AUCTION):
+        return Response({
+        "error": "Invalid matching mode"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
     if num_bots is None or num_market_makers is None or num_trading_days is None or \
        num_ticks_per_day is None or time_between_ticks is None or \
        starting_cash is None or volatility is None: 
@@ -99,7 +113,7 @@ def create_base_game_regular(request):
     settings = GameSettings(game_type = game_type, num_bots = num_bots, num_market_makers = num_market_makers,
                             num_trading_days = num_trading_days, num_ticks_per_day = num_ticks_per_day,
                             time_between_ticks = time_between_ticks, starting_cash = starting_cash,
-                            volatility = volatility, seed = seed)
+                            volatility = volatility, seed = seed, matching_mode = matching_mode)
     
     settings.save()
 
@@ -109,7 +123,9 @@ def create_base_game_regular(request):
     random.seed(seed)
     # play style is randomly generated from 1-100, for now
     bots = [create_player(Player.ROLE_BOT, starting_cash, random.randint(1, 100), num_trading_days) for _ in range(num_bots)]
-    if player is None or None in bots:
+    market_makers = [create_player(Player.ROLE_MARKET_MAKER, starting_cash, 0, num_trading_days)
+                     for _ in range(num_market_makers)]
+    if player is None or None in bots or None in market_makers:
         return Response({
         "error": "Error with player creation"    
         }, status=status.HTTP_400_BAD_REQUEST)
@@ -118,10 +134,10 @@ def create_base_game_regular(request):
     base_game.settings = settings
     base_game.seed = seed
     base_game.stock = stock
-    base_game.num_players = 1 + num_bots
+    base_game.num_players = 1 + num_bots + num_market_makers
     base_game.save()
 
-    base_game.players.set([player, *bots])
+    base_game.players.set([player, *bots, *market_makers])
 
     base_game.save()
 
@@ -154,8 +170,11 @@ def delete_base_game(request, game_id):
     try:
         game = BaseGame.objects.get(id=game_id)  
         stock = game.stock
+        get_scheduler().remove(game_id)
+        GameManager().remove_game(game_id)
         stock.delete()
         game.delete()
+        delete_event_log(game_id)
         return Response({
             "message": f"Base game with id {game_id} deleted successfully",
             "game_id" : game_id,
@@ -173,7 +192,9 @@ def get_game_manager(request):
 
     serialized_games = {}
 
-    for game_id, game in manager.games.items():
+    # the games' players are read from the database
+    for game_id, game in list(manager.games.items()):
+        flush_game(game_id)
         serialized_games[game_id] = game.to_dict()
 
     return Response({
@@ -182,10 +203,16 @@ def get_game_manager(request):
     }, status=status.HTTP_200_OK)
 
 
+# registers a game with the game manager
+# with server_ticks (SERVER_TICKS by default) the game's ticks are driven by the tick scheduler instead of the client:
+# it ticks every time_between_ticks seconds while it is not paused
 @api_view(['POST'])
 def register_base_game(request, game_id):
     manager = GameManager()
     ret = manager.register_game(game_id)
+    if ret == 0 and request.data.get("server_ticks", getattr(django_settings, "SERVER_TICKS", False)):
+        game = manager.get_game(game_id)
+        get_scheduler().add(game_id, game.settings.time_between_ticks, game.time_to_next_tick, game.is_paused)
     if (ret == -1):
         return Response({
             "note": f"Base game with id {game_id} already registered",
@@ -203,6 +230,7 @@ def register_base_game(request, game_id):
         return Response({
             "success": f"Base game with id {game_id} registered successfully",
             "game_id" : game_id,
+            "server_ticks": game_id in get_scheduler(),
             "game": BaseGame.objects.get(id=game_id).to_dict()
             },status=status.HTTP_200_OK)
     
@@ -211,11 +239,12 @@ def register_base_game(request, game_id):
 @api_view(['DELETE'])
 def remove_game_from_manager(request, game_id):
     manager = GameManager()
-    print(game_id)
+
+    # the game's state is kept in memory, save it before the game is dropped
+    get_scheduler().remove(game_id)
+    flush_game(game_id)
     ret = manager.remove_game(game_id)
 
-    for game in manager.games:
-        print(type(game))
     if (ret == -1):
         return Response({
             "note": f"Game with id {game_id} does not exist in game manager",
@@ -223,6 +252,8 @@ def remove_game_from_manager(request, game_id):
             },status=status.HTTP_400_BAD_REQUEST)
     
     if (ret == 0):
+        for other_game_id in list(manager.games):
+            flush_game(other_game_id)
         return Response({
             "success": f"Base game with id {game_id} removed from game manager successfully",
             "game_id" : game_id,
@@ -231,12 +262,6 @@ def remove_game_from_manager(request, game_id):
     
 
 
-# base interest rate: 10%
-# base interest rate for a loan: 18%
-# assuming 365 days per year, these values are the interest rates per day
-INTEREST_RATE = (1 + 0.10)**(1/365)
-INTEREST_LOAN_RATE = (1 + 0.18)**(1/365)
-
 # gets the next price in a solo game, and process interest
 @api_view(['POST'])
 def get_next_base_game_price_solo(request, game_id):
@@ -247,81 +272,201 @@ def get_next_base_game_price_solo(request, game_id):
             "error": "trading_day parameter not supplied"           
             },status=status.HTTP_400_BAD_REQUEST)
 
-    price = getNextPriceSolo(game_id)
+    manager = GameManager()
+    with manager.lock(game_id):
+        price = getNextPriceSolo(game_id)
 
-    if price == -1:
-         return Response({
-            "error": f"Base game with id {game_id} not registered yet, or game type mismatch"            
-            },status=status.HTTP_400_BAD_REQUEST)
-    
+        if price == -1:
+             return Response({
+                "error": f"Base game with id {game_id} not registered yet, or game type mismatch"            
+                },status=status.HTTP_400_BAD_REQUEST)
+
+        # update player's cash based on interest
+        game = manager.get_game(game_id)
+        player = apply_interest_solo(game_id, trading_day)
+        push_solo_tick(game_id, game.stock, player)
 
+    return Response({
+            "success": f"Base game with id {game_id} price updated successfully",
+            "price": price,
+            "player_cash": player.money
+            },status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def get_next_base_game_price_regular(request, game_id):
     manager = GameManager()
-    game = manager.get_game(game_id)
+    with manager.lock(game_id):
+        price = getNextPriceRegular(game_id)
+
+        if price == -1:
+             return Response({
+                "error": f"Regular game with id {game_id} not registered yet, or game type mismatch"            
+                },status=status.HTTP_400_BAD_REQUEST)
+
+        # the order book levels that changed during this tick
+        book = manager.get_order_book(game_id)
+        deltas = book.deltas_since(book.depth_version - 1)
 
-    if game == None or game.settings.game_type != GameSettings.GAME_BASE_SOLO:
+    return Response({
+            "success": f"Regular game with id {game_id} price updated successfully",
+            "price": price,
+            "order_book_deltas": book_levels_to_dict(deltas)
+            
+            },status=status.HTTP_200_OK)
+
+
+# returns the top levels of a regular game's order book, aggregated per price, with the depth version they belong to
+# query parameter levels: number of levels per side, 10 by default
+@api_view(['GET'])
+def get_order_book(request, game_id):
+    book = GameManager().get_order_book(game_id)
+    if book is None:
         return Response({
-            "error": f"Base game with id {game_id} not registered yet, or game type mismatch"            
+            "error": f"Regular game with id {game_id} not registered yet"
+            },status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        num_levels = int(request.query_params.get("levels", 10))
+    except ValueError:
+        return Response({
+            "error": "levels must be an integer"
+            },status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+            "success": f"Returned order book of game with id {game_id}",
+            "order_book": book_levels_to_dict(book.snapshot(num_levels))
+            },status=status.HTTP_200_OK)
+
+
+# returns every order book level that changed after depth version, as [price, new quantity] (0: the level is gone)
+# if version is too old to catch up from, the response has resync set and the client should fetch get-order-book again
+@api_view(['GET'])
+def get_order_book_deltas(request, game_id, version):
+    book = GameManager().get_order_book(game_id)
+    if book is None:
+        return Response({
+            "error": f"Regular game with id {game_id} not registered yet"
             },status=status.HTTP_400_BAD_REQUEST)
-    
-    # solo game only has one player, which represents the user playing the game
-    player = game.players.all().first()
 
-    # update player's cash based on interest
-    money = float(player.money)
-    tmp = money
+    try:
+        deltas = book.deltas_since(int(version))
+    except ValueError:
+        return Response({
+            "error": "version must be an integer"
+            },status=status.HTTP_400_BAD_REQUEST)
 
-    # give player interest
-    if money >= 0:
-        money *= INTEREST_RATE
-    # charge player interest
-    else:
-        money *= INTEREST_LOAN_RATE
+    if deltas is None:
+        return Response({
+            "success": f"Order book of game with id {game_id} needs a new snapshot",
+            "resync": True,
+            "version": book.depth_version
+            },status=status.HTTP_200_OK)
 
-    # round back to 2 decimal place and find diff
-    tmp = Decimal(str(tmp)).quantize(Decimal("0.01"))
-    money = Decimal(str(money)).quantize(Decimal("0.01"))
-    diff = money - tmp
+    return Response({
+            "success": f"Returned order book deltas of game with id {game_id}",
+            "resync": False,
+            "order_book_deltas": book_levels_to_dict(deltas)
+            },status=status.HTTP_200_OK)
 
-    if diff >= 0:
-        player.interest_earned[trading_day - 1] += diff
-    else:
-        player.interest_paid[trading_day - 1] += diff * -1
+# rebuilds a regular game as it was at a tick from its event log, and returns the price, every player's cash and
+# shares and the top of the order book at that point
+@api_view(['GET'])
+def get_game_state_at_tick(request, game_id, tick):
+    try:
+        tick = int(tick)
+    except ValueError:
+        return Response({
+            "error": "tick must be an integer"
+            },status=status.HTTP_400_BAD_REQUEST)
 
+    if not EventLog.exists(game_id):
+        return Response({
+            "error": f"Game with id {game_id} has no event log"
+            },status=status.HTTP_400_BAD_REQUEST)
 
-    player.money = money
-    player.save()
+    try:
+        event_log = EventLog(event_log_dir(), game_id, read_only=True)
+    except EventLogError as e:
+        return Response({
+            "error": f"Game with id {game_id} could not be replayed to tick {tick}: {e}"
+            },status=status.HTTP_400_BAD_REQUEST)
+    try:
+        engine, _ = replay(event_log, tick)
+    except (ReplayError, EventLogError) as e:
+        return Response({
+            "error": f"Game with id {game_id} could not be replayed to tick {tick}: {e}"
+            },status=status.HTTP_400_BAD_REQUEST)
+    finally:
+        event_log.close()
 
     return Response({
-            "success": f"Base game with id {game_id} price updated successfully",
-            "price": price,
-            "player_cash": money
+            "success": f"Replayed game with id {game_id} to tick {engine.tick}",
+            "tick": engine.tick,
+            "price": from_cents(engine.price),
+            "players": [{"id": player_id, "money": money, "shares": shares}
+                        for player_id, money, shares in engine.players()],
+            "order_book": book_levels_to_dict(engine.book.snapshot())
             },status=status.HTTP_200_OK)
 
 
-@api_view(['GET'])
-def get_next_base_game_price_regular(request, game_id):
-    price = getNextPriceRegular(game_id)
+# plays the rest of a regular game headless, in memory, and stores the outcome in one go; returns a summary
+# orders: the players' orders, each placed right before a tick, as {"tick", "quantity", "price", "order_type",
+# "player_id"} (see simulation.py); without any, only the bots and market makers trade
+# the game must not be running in the game manager
+@api_view(['POST'])
+def simulate_base_game(request, game_id):
+    if GameManager().get_game(game_id) is not None:
+        return Response({
+            "error": f"Base game with id {game_id} is running, remove it from the game manager first"
+            },status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        game = BaseGame.objects.select_related("settings", "stock").get(id=game_id)
+    except ObjectDoesNotExist:
+        return Response({
+            "error": f"Base game with id {game_id} does not exist"
+            },status=status.HTTP_400_BAD_REQUEST)
 
-    if price == -1:
-         return Response({
-            "error": f"Regular game with id {game_id} not registered yet, or game type mismatch"            
+    try:
+        summary = simulate(game, request.data.get("orders"))
+    except SimulationError as e:
+        return Response({
+            "error": f"Base game with id {game_id} could not be simulated: {e}"
             },status=status.HTTP_400_BAD_REQUEST)
 
+    # the game's event log no longer lines up with it, a later run rebuilds the engine from the database
+    delete_event_log(game_id)
 
     return Response({
-            "success": f"Regular game with id {game_id} price updated successfully",
-            "price": price 
-            
+            "success": f"Simulated base game with id {game_id}",
+            "summary": summary
             },status=status.HTTP_200_OK)
 
+
+# returns how many games are on server side ticks, how many of them are paused, and the ticks run so far
+@api_view(['GET'])
+def get_scheduler_stats(request):
+    return Response({
+        "success": "Returned tick scheduler stats",
+        "scheduler": get_scheduler().stats()
+        }, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 def pause_base_game(request, game_id):
     pause_time = request.data.get('time')
     try:
         game = BaseGame.objects.get(id=game_id)  
         game.is_paused = True
-        game.time_to_next_tick = pause_time
-        game.save()
+        # games on server side ticks know how long it was until their next tick, the client's time is only used
+        # for games it drives itself
+        remaining = get_scheduler().pause(game_id)
+        game.time_to_next_tick = remaining if remaining is not None else pause_time
+        game.save(update_fields=["is_paused", "time_to_next_tick"])
+
+        # the game's state is kept in memory, it is saved while the game is paused
+        flush_game(game_id)
         return Response({
             "message": f"Base game with id {game_id} paused successfully",
             "game_id" : game_id,
@@ -342,7 +487,8 @@ def resume_base_game(request, game_id):
         game = BaseGame.objects.get(id=game_id)  
         game.is_paused = False
         game.time_to_next_tick = -1
-        game.save()
+        game.save(update_fields=["is_paused", "time_to_next_tick"])
+        get_scheduler().resume(game_id)
         return Response({
             "message": f"Base game with id {game_id} resumed successfully",
             "game_id" : game_id,
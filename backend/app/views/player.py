@@ -1,4 +1,5 @@
 from ..models import Player
+from ..engine.settlement import flush_game
 from rest_framework.decorators import api_view
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.response import Response
@@ -8,7 +9,7 @@ from rest_framework import status
 def create_player(role, money, play_style, num_trading_days):
 
     # invalid role
-    if role not in (Player.ROLE_SYSTEM, Player.ROLE_PLAYER, Player.ROLE_BOT):
+    if role not in (Player.ROLE_SYSTEM, Player.ROLE_PLAYER, Player.ROLE_BOT, Player.ROLE_MARKET_MAKER):
         return None
     
     player = Player()
@@ -30,6 +31,10 @@ def create_player(role, money, play_style, num_trading_days):
 def get_interest_earned_and_paid(request, player_id, trading_day):
     try:
         trading_day = int(trading_day)
+
+        # interest is kept in memory while a game runs
+        for game_id in Player.objects.get(id=player_id).players.values_list("id", flat=True):
+            flush_game(str(game_id))
         player = Player.objects.get(id=player_id)
     except ObjectDoesNotExist:
         return Response({
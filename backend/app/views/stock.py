@@ -1,14 +1,16 @@
-from ..models import Stock, Order, Player
+from ..models import Stock, Order, Player, GameManager
 import random
 import json
-import os
-from app.data.data_processing.compress_data import uncompress_data
-from bitarray import bitarray
+from app.data.data_processing.archive import get_archive
+from app.data.data_processing.price_cache import get_price_cache
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from app.tasks import handle_buy_stock_solo, handle_buy_stock_regular, SUCCESS
 from django.core.exceptions import ObjectDoesNotExist
+from app.engine.money import from_cents
+from app.engine.settlement import flush, flush_game
+from app.engine.ticks import INITIAL_PRICES
 
 
 # creates a stock
@@ -24,40 +26,30 @@ def create_stock(seed, total_ticks):
     data = random.choice(data)
 
     # select random historical stock to derive prices from
-    stocks = [f for f in os.listdir("app/data/compressed_data")]
-    if stocks is None:
+    archive = get_archive()
+    stocks = archive.tickers
+    if not stocks:
         return None
-    
-    underlying_stock = random.choice(stocks)
 
-    stock.underlying_stock = underlying_stock[:-11]
-
-    # read in the number of entries in this file
-    filePath = f'app/data/compressed_data/{underlying_stock}'
-    ba = bitarray()
-    with open(filePath, 'rb') as f:
-        ba.fromfile(f)
+    underlying_stock = random.choice(stocks)
 
-    ba = ba.to01()
+    stock.underlying_stock = underlying_stock
 
-    # number of data points
-    points = int(ba[3:19], 2)
+    # number of data points, read from the ticker catalog without touching the ticker's data
+    points = archive.metadata(underlying_stock).count
 
     # pick a random place within the file to act as the starting  point
     start_index = random.randint(0, points - total_ticks - 11)
 
-    # get data points
-    prices = uncompress_data(underlying_stock, start_index, total_ticks + 10)
-
-    # set initial prices
-    initial_prices = prices[:10]
+    # get the initial data points, in cents
+    # popular tickers are served from the decoded series cache without decoding anything
+    # the prices after them are generated tick by tick from the stock's tick_source
+    initial_prices = get_price_cache().window(underlying_stock, start_index, INITIAL_PRICES).tolist()
 
     stock.first_tick_index = start_index
     stock.ticks_generated = 0
-    stock.next_values = prices[10:]
-    stock.past_values = initial_prices
 
-    stock.current_price = initial_prices[-1]
+    stock.current_price = from_cents(initial_prices[-1])
     stock.stock_name = data["stock_name"]
     stock.company_name = data["company_name"]
     stock.description = data["description"]
@@ -65,7 +57,16 @@ def create_stock(seed, total_ticks):
     
     stock.save()
 
-    return stock, initial_prices
+    return stock, [from_cents(price) for price in initial_prices]
+
+# converts the prices of an order book snapshot or delta from cents to dollars
+def book_levels_to_dict(levels):
+    return {
+        "version": levels["version"],
+        "bids": [[from_cents(price), quantity] for price, quantity in levels["bids"]],
+        "asks": [[from_cents(price), quantity] for price, quantity in levels["asks"]]
+    }
+
 
 # creates a new order in a base game
 @api_view(['POST'])
@@ -111,7 +112,11 @@ def create_base_order(request):
     # solo mode orders
     if order_type == Order.TYPE_SOLO:
         # send request to celery
-        if handle_buy_stock_solo(order, stock) == SUCCESS:
+        if handle_buy_stock_solo(order, stock, game_id) == SUCCESS:
+            # a running game's player and stock are ahead of the database
+            hot = GameManager().get_hot_state(game_id)
+            if hot is not None:
+                player, stock = hot.player, hot.stock
             return Response({
             "success": "Order Placed",
             "order": order.to_dict(),
@@ -133,12 +138,21 @@ def create_base_order(request):
                         Order.TYPE_GOOD_TIL_CANCELLED,
                         Order.TYPE_FILL_OR_KILL]:
         # send request to celery
-        if handle_buy_stock_regular(order, stock) == SUCCESS:
+        if handle_buy_stock_regular(order, stock, game_id) == SUCCESS:
+            # the player's cash and shares are kept by the game's engine while it runs
+            engine = GameManager().get_engine(game_id)
+            if player.id in engine.accounts:
+                player.money = from_cents(engine.accounts.cash[player.id])
+                player.owned_stocks[str(stock.id)] = engine.accounts.shares[player.id]
+
+            # the order book is sent as a top of book snapshot rather than the whole stock, later changes come in as
+            # deltas with each tick
+            book = engine.book
             return Response({
             "success": "Order Placed",
             "order": order.to_dict(),
             "player": player.to_dict(),
-            "stock": stock.to_dict()
+            "order_book": book_levels_to_dict(book.snapshot())
             }, status=status.HTTP_200_OK)
         
         else:
@@ -165,6 +179,23 @@ def remove_pending_orders(request, stock_id):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+    # take the orders out of the running games as well (and out of their matching engine), once what they did so far
+    # is saved
+    manager = GameManager()
+    for game in stock.games.all():
+        game_id = str(game.id)
+        if game_id not in manager.hot_states:
+            continue
+        with manager.lock(game_id):
+            hot = manager.hot_states[game_id]
+            flush(hot)
+            order_ids = list(hot.orders)
+            if hot.engine is not None:
+                for order_id in order_ids:
+                    if hot.engine.book.cancel(order_id):
+                        hot.event_log.cancel(order_id)
+            hot.drop(order_ids)
+
     order_count = stock.pending_orders.count()
     stock.pending_orders.clear()
     return Response({
@@ -186,6 +217,10 @@ def get_orders_placed_on_day(request):
         "error": "stock does not exist"
         }, status=status.HTTP_400_BAD_REQUEST)
 
+    # orders are confirmed in memory while a game runs
+    for game in stock.games.all():
+        flush_game(str(game.id))
+
     orders = []
     for order in stock.fulfilled_orders.all():
         if order.day_placed_on == trading_day:
@@ -194,4 +229,13 @@ def get_orders_placed_on_day(request):
     return Response({
         "success": f"Returned orders placed on day {trading_day}",
         "orders": orders
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+# returns hit / miss / eviction counters of the decoded price series cache
+@api_view(['GET'])
+def get_price_cache_stats(request):
+    return Response({
+        "success": "Returned price cache stats",
+        "price_cache": get_price_cache().stats()
+        }, status=status.HTTP_200_OK)
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
 
 application = get_wsgi_application()
+
+# load the ticker catalog before the first request, see archive.py
+from app.data.data_processing.archive import get_archive  # noqa: E402
+get_archive()
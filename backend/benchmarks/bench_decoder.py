@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from bitarray import bitarray
+
+from app.data.data_processing.decoder import COMPRESSED_DATA_DIR, V2_VERSION, format_version, read_compressed, \
+    read_header, read_index, decode_prices, decode_window
+
+'''
+Decoder benchmark
+
+Decodes the full history of every version 1 file in compressed_data/ with both the original bit-string decoder
+(reference_decode, below) and the vectorized NumPy decoder, checks that both agree, and reports the time taken by
+each.
+Then decodes a game-sized window at the start, middle and end of every file using the seek index, to show that
+the cost does not depend on where the window falls.
+
+Run from the backend directory:
+    python -m benchmarks.bench_decoder [max_files]
+'''
+
+# the original bit-string decoder of version 1 files, kept here as the reference the NumPy decoder is checked against;
+# returns a list of numPoints prices (Decimals) from the start of the file
+def reference_decode(buf, numPoints):
+    ba = bitarray()
+    ba.frombytes(buf)
+
+    ba = ba.to01()
+
+    # read in the offset and trim it off
+    offset = int(ba[:3], 2)
+
+    ba = ba[3:len(ba) - offset]
+
+
+    ba = ba[16:]
+
+    # read in initial value
+    prev_value = Decimal(str(int(ba[:27], 2) / 100)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    prices = [prev_value]
+
+    # current index
+    i = 27
+
+    while i < len(ba):
+        if len(prices) >= numPoints:
+            break
+
+        bits_to_read = int(ba[i: i + 5], 2)
+        i += 5
+
+        # no change in price, continue
+        if bits_to_read == 0:
+            prices.append(prev_value)
+            continue
+
+        # read in bit for positive/negative change
+        bit_sign = ba[i]
+        i += 1
+        sign = -1 if bit_sign == "0" else 1
+
+        # read in the next bits_to_read bytes for the difference
+        # add the 1 back in 
+        diff = Decimal(str(sign * int("1" + ba[i : i + bits_to_read - 1], 2))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        i += bits_to_read - 1
+
+        prev_value = prev_value + diff / 100
+        prices.append(prev_value)
+    return prices
+
+
+def main():
+    files = sorted(f for f in os.listdir(COMPRESSED_DATA_DIR) if f.endswith(".bin"))
+    files = [f for f in files if format_version(read_compressed(f)) != V2_VERSION]
+    if len(sys.argv) > 1:
+        files = files[:int(sys.argv[1])]
+
+    legacy_time = 0.0
+    numpy_time = 0.0
+    total_points = 0
+    mismatches = []
+
+    for fileName in files:
+        buf = read_compressed(fileName)
+        _, count, _ = read_header(buf)
+        total_points += count
+
+        t0 = time.perf_counter()
+        legacy = reference_decode(buf, count)
+        t1 = time.perf_counter()
+        fast = decode_prices(read_compressed(fileName))
+        t2 = time.perf_counter()
+
+        legacy_time += t1 - t0
+        numpy_time += t2 - t1
+
+        if len(legacy) != len(fast) or any(int(a * 100) != int(b) for a, b in zip(legacy, fast)):
+            mismatches.append(fileName)
+
+    print(f'files decoded:   {len(files)} ({total_points} prices)')
+    print(f'reference:       {legacy_time:.3f}s ({legacy_time / len(files) * 1000:.3f} ms/file)')
+    print(f'decode_prices:   {numpy_time:.3f}s ({numpy_time / len(files) * 1000:.3f} ms/file)')
+    print(f'speedup:         {legacy_time / numpy_time:.1f}x')
+    print(f'mismatches:      {len(mismatches)} {mismatches[:10]}')
+
+    # window decoding with the seek index, 200 ticks + 10 initial prices
+    window = 210
+    for label, position in (("start", 0.0), ("middle", 0.5), ("end", 1.0)):
+        elapsed = 0.0
+        for fileName in files:
+            buf = read_compressed(fileName)
+            index = read_index(fileName)
+            _, count, _ = read_header(buf)
+            start = int((count - window) * position)
+
+            t0 = time.perf_counter()
+            decode_window(buf, start, window, index)
+            elapsed += time.perf_counter() - t0
+        print(f'window at {label + ":":7}  {elapsed / len(files) * 1000:.3f} ms/file')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+from app.engine.order_book import OrderBook, BookOrder, BUY, SELL
+from app.engine.bots import BotPopulation
+from app.engine.market_makers import MarketMakers
+
+'''
+Matching engine benchmark suite
+
+Microbenchmarks of app/engine, each run against books of every depth in --depths (price levels per side, with
+ORDERS_PER_LEVEL orders each) and, for the full tick, every population size in --bots:
+insert: resting orders that do not cross the book
+cancel: cancelling random resting orders
+amend: requoting random resting orders by id, to a new price on their side of the book or a larger quantity, the way
+    bots and market makers requote
+match: marketable orders that sweep part of the book
+depth: top of book depth queries
+tick_continuous / tick_auction: a whole engine tick without the database: market makers requote, every bot
+    decides and submits, fills are applied in memory (and, in auction mode, the auction clears)
+
+Everything is seeded (--seed), and every benchmark is run --repeat times on a fresh book, keeping the fastest run.
+Results are printed as a table and written as JSON to --output. Given a --baseline file from an earlier run, any
+benchmark that got more than --tolerance slower is reported and the exit status is 1, so the suite can gate changes
+to the engine.
+
+Run from the backend directory:
+    python -m benchmarks.bench_engine [--depths 10 100 1000] [--bots 100 1000] [--output results.json]
+                                      [--baseline previous.json]
+'''
+
+MID_PRICE = 10000
+ORDERS_PER_LEVEL = 5
+NUM_OPS = 20000
+NUM_TICKS = 20
+
+
+# a book with depth levels per side around MID_PRICE; returns the book and the ids of its orders
+def seeded_book(rng, depth):
+    book = OrderBook()
+    ids = []
+    for level in range(1, depth + 1):
+        for _ in range(ORDERS_PER_LEVEL):
+            for side, price in ((BUY, MID_PRICE - level), (SELL, MID_PRICE + level)):
+                order_id = len(ids)
+                book.submit(BookOrder(order_id, order_id % 50, side, price, rng.randint(1, 100)))
+                ids.append(order_id)
+    return book, ids
+
+
+def bench_insert(rng, depth):
+    book, ids = seeded_book(rng, depth)
+    orders = [BookOrder(len(ids) + i, 0, side, MID_PRICE - side * rng.randint(1, depth), rng.randint(1, 100))
+              for i, side in enumerate(rng.choice((BUY, SELL)) for _ in range(NUM_OPS))]
+    t0 = time.perf_counter()
+    for order in orders:
+        book.submit(order)
+    return time.perf_counter() - t0, len(orders)
+
+
+def bench_cancel(rng, depth):
+    book, ids = seeded_book(rng, depth)
+    targets = rng.sample(ids, min(NUM_OPS, len(ids)))
+    t0 = time.perf_counter()
+    for order_id in targets:
+        book.cancel(order_id)
+    return time.perf_counter() - t0, len(targets)
+
+
+def bench_amend(rng, depth):
+    book, ids = seeded_book(rng, depth)
+    # order ids alternate between the sides, see seeded_book()
+    amends = []
+    for _ in range(NUM_OPS):
+        i = rng.randrange(len(ids))
+        side = BUY if i % 2 == 0 else SELL
+        if rng.random() < 0.5:
+            amends.append((ids[i], MID_PRICE - side * rng.randint(1, depth), None))
+        else:
+            amends.append((ids[i], None, rng.randint(101, 200)))
+    t0 = time.perf_counter()
+    for order_id, price, quantity in amends:
+        book.amend(order_id, price=price, quantity=quantity)
+    return time.perf_counter() - t0, len(amends)
+
+
+def bench_match(rng, depth):
+    book, ids = seeded_book(rng, depth)
+    # each order takes out roughly one level; the book is refilled behind it so it never runs dry
+    orders = []
+    refills = []
+    for i in range(NUM_OPS):
+        side = rng.choice((BUY, SELL))
+        orders.append(BookOrder(len(ids) + 2 * i, 1, side, MID_PRICE + side * depth, ORDERS_PER_LEVEL * 50))
+        refills.append(BookOrder(len(ids) + 2 * i + 1, 2, -side, MID_PRICE + side * rng.randint(1, depth),
+                                 ORDERS_PER_LEVEL * 50))
+    t0 = time.perf_counter()
+    for order, refill in zip(orders, refills):
+        book.submit(refill)
+        book.submit(order)
+    return time.perf_counter() - t0, len(orders)
+
+
+def bench_depth(rng, depth):
+    book, _ = seeded_book(rng, depth)
+    t0 = time.perf_counter()
+    for _ in range(NUM_OPS):
+        book.depth(10)
+    return time.perf_counter() - t0, NUM_OPS
+
+
+def _bench_tick(rng, depth, num_bots, auction):
+    book, _ = seeded_book(rng, depth)
+    book.auction = auction
+    bots = BotPopulation(range(num_bots), [10**7] * num_bots, [0] * num_bots,
+                         [rng.randint(1, 100) for _ in range(num_bots)], "bench", 10)
+    market_makers = MarketMakers([f'mm{i}' for i in range(3)], [10**8] * 3, [0] * 3, "bench", 10, MID_PRICE)
+    path = np.cumsum(np.random.default_rng(rng.randint(0, 2**32)).integers(-5, 6, NUM_TICKS + 1)) + MID_PRICE
+
+    t0 = time.perf_counter()
+    for tick in range(1, NUM_TICKS + 1):
+        price, previous_price = int(path[tick]), int(path[tick - 1])
+        book.advance_tick(tick)
+        fills = market_makers.step(book, price)
+        fills += bots.step(book, tick, price, previous_price, 1)
+        if auction:
+            fills += book.clear_auction(price)
+        bots.apply_fills(fills)
+        market_makers.apply_fills(fills)
+    return time.perf_counter() - t0, NUM_TICKS
+
+
+BENCHMARKS = {
+    "insert": bench_insert,
+    "cancel": bench_cancel,
+    "amend": bench_amend,
+    "match": bench_match,
+    "depth": bench_depth,
+}
+
+TICK_BENCHMARKS = {
+    "tick_continuous": lambda rng, depth, num_bots: _bench_tick(rng, depth, num_bots, False),
+    "tick_auction": lambda rng, depth, num_bots: _bench_tick(rng, depth, num_bots, True),
+}
+
+
+# runs benchmark repeat times with the same seed, returns the fastest (seconds, ops)
+def _best_of(benchmark, repeat, seed, *params):
+    runs = [benchmark(random.Random(seed), *params) for _ in range(repeat)]
+    return min(runs)
+
+
+def run_suite(depths, bot_counts, repeat, seed):
+    results = []
+    for depth in depths:
+        for name, benchmark in BENCHMARKS.items():
+            seconds, ops = _best_of(benchmark, repeat, seed, depth)
+            results.append(_result(name, depth, None, seconds, ops))
+        for num_bots in bot_counts:
+            for name, benchmark in TICK_BENCHMARKS.items():
+                seconds, ops = _best_of(benchmark, repeat, seed, depth, num_bots)
+                results.append(_result(name, depth, num_bots, seconds, ops))
+    return results
+
+
+def _result(name, depth, num_bots, seconds, ops):
+    return {
+        "name": name,
+        "depth": depth,
+        "bots": num_bots,
+        "ops": ops,
+        "seconds": seconds,
+        "us_per_op": seconds / ops * 1e6,
+        "ops_per_sec": ops / seconds if seconds else None
+    }
+
+
+def _key(result):
+    return (result["name"], result["depth"], result["bots"])
+
+
+# returns the results that are more than tolerance slower than the same benchmark in baseline
+def regressions(results, baseline, tolerance):
+    previous = {_key(result): result for result in baseline["results"]}
+    slower = []
+    for result in results:
+        before = previous.get(_key(result))
+        if before is not None and result["us_per_op"] > before["us_per_op"] * (1 + tolerance):
+            slower.append((result, before))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching engine benchmark suite")
+    parser.add_argument("--depths", type=int, nargs="+", default=[10, 100, 1000],
+                        help="price levels per side of the seeded book")
+    parser.add_argument("--bots", type=int, nargs="+", default=[100, 1000], help="bot counts for the tick benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks/engine_results.json", help="JSON results file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline, as a fraction")
+    options = parser.parse_args()
+
+    results = run_suite(options.depths, options.bots, options.repeat, options.seed)
+
+    print(f'{"benchmark":>16} {"depth":>6} {"bots":>6} {"us/op":>10} {"ops/s":>12}')
+    for result in results:
+        bots = result["bots"] if result["bots"] is not None else "-"
+        print(f'{result["name"]:>16} {result["depth"]:>6} {bots:>6} {result["us_per_op"]:>10.2f} '
+              f'{result["ops_per_sec"]:>12.0f}')
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": options.seed,
+            "repeat": options.repeat,
+            "num_ops": NUM_OPS,
+            "num_ticks": NUM_TICKS
+        },
+        "results": results
+    }
+    with open(options.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f'results written to {os.path.abspath(options.output)}')
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            slower = regressions(results, json.load(f), options.tolerance)
+        for result, before in slower:
+            print(f'REGRESSION {result["name"]} depth={result["depth"]} bots={result["bots"]}: '
+                  f'{before["us_per_op"]:.2f} -> {result["us_per_op"]:.2f} us/op')
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
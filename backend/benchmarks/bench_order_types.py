@@ -0,0 +1,84 @@
+import random
+import sys
+import time
+from app.engine.order_book import OrderBook, BookOrder, BUY, SELL, TYPE_ALL_OR_NONE, TYPE_IMMEDIATE_OR_CANCEL, \
+    TYPE_GOOD_FOR_DAY, TYPE_GOOD_TIL_CANCELLED, TYPE_FILL_OR_KILL
+
+'''
+Order type benchmark
+
+Throughput of the matching engine for each order type. Every run starts from a book seeded with DEPTH_LEVELS price
+levels per side around MID_PRICE, ORDERS_PER_LEVEL orders each, then submits a stream of random orders of a single
+type; prices are spread around the mid price so that part of the stream crosses and part of it rests. All or none
+orders additionally pay for one advance_tick() every TICK_EVERY orders, and good for day orders for expiring the
+whole day at the end of the run.
+
+Run from the backend directory:
+    python -m benchmarks.bench_order_types [num_orders]
+'''
+
+MID_PRICE = 10000
+DEPTH_LEVELS = 50
+ORDERS_PER_LEVEL = 10
+TICK_EVERY = 100
+
+ORDER_TYPES = (("GTC", TYPE_GOOD_TIL_CANCELLED), ("GFD", TYPE_GOOD_FOR_DAY), ("IOC", TYPE_IMMEDIATE_OR_CANCEL),
+               ("FOK", TYPE_FILL_OR_KILL), ("AON", TYPE_ALL_OR_NONE))
+
+
+def seed_book(rng):
+    book = OrderBook()
+    order_id = 0
+    for level in range(1, DEPTH_LEVELS + 1):
+        for _ in range(ORDERS_PER_LEVEL):
+            order_id += 1
+            book.submit(BookOrder(order_id, 1, BUY, MID_PRICE - level, rng.randint(1, 100),
+                                  TYPE_GOOD_TIL_CANCELLED))
+            order_id += 1
+            book.submit(BookOrder(order_id, 2, SELL, MID_PRICE + level, rng.randint(1, 100),
+                                  TYPE_GOOD_TIL_CANCELLED))
+    return book, order_id
+
+
+def make_orders(rng, order_type, num_orders, first_id):
+    orders = []
+    for i in range(num_orders):
+        side = BUY if rng.random() < 0.5 else SELL
+        price = MID_PRICE + side * rng.randint(-DEPTH_LEVELS, DEPTH_LEVELS // 5)
+        orders.append(BookOrder(first_id + i, 3, side, price, rng.randint(1, 300), order_type, day=1))
+    return orders
+
+
+# returns (seconds, number of fills, number of orders cancelled by the engine, orders left resting or parked)
+def bench_type(order_type, num_orders, seed=0):
+    rng = random.Random(seed)
+    book, last_id = seed_book(rng)
+    orders = make_orders(rng, order_type, num_orders, last_id + 1)
+
+    fills = 0
+    t0 = time.perf_counter()
+    for i, order in enumerate(orders):
+        fills += len(book.submit(order))
+        if order_type == TYPE_ALL_OR_NONE and i % TICK_EVERY == 0:
+            fills += len(book.advance_tick(i))
+    if order_type == TYPE_GOOD_FOR_DAY:
+        book.expire_day(1)
+    elapsed = time.perf_counter() - t0
+
+    cancelled = sum(1 for order in orders if order.cancelled)
+    left = sum(1 for order in orders if order.active)
+    return elapsed, fills, cancelled, left
+
+
+def main():
+    num_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f'{"type":>4} {"orders/s":>10} {"us/order":>9} {"fills":>8} {"cancelled":>10} {"left":>7}')
+    for name, order_type in ORDER_TYPES:
+        elapsed, fills, cancelled, left = bench_type(order_type, num_orders)
+        print(f'{name:>4} {num_orders / elapsed:>10.0f} {elapsed / num_orders * 1e6:>9.2f} {fills:>8} '
+              f'{cancelled:>10} {left:>7}')
+
+
+if __name__ == "__main__":
+    main()
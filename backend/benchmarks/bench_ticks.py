@@ -0,0 +1,76 @@
+import sys
+import time
+from app.data.data_processing.archive import get_archive
+from app.engine.ticks import TickSource, INITIAL_PRICES
+
+'''
+Tick advance benchmark
+
+Compares the per-tick cost of the old array-based advance (next_values = next_values[1:], past_values.append(),
+then both arrays serialized for the row update) with the cursor-based advance (TickSource.price_at() and two
+scalar columns), for increasing game lengths. The database round-trip itself is not included; the array
+serialization stands in for the size of the row update.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ticks [ticker]
+'''
+
+GAME_LENGTHS = (200, 2000, 8000)
+
+
+# what the driver sends for an array column
+def _serialize(values):
+    return "{" + ",".join(map(str, values)) + "}"
+
+
+def bench_arrays(prices, length):
+    past_values = list(prices[:INITIAL_PRICES])
+    next_values = list(prices[INITIAL_PRICES:INITIAL_PRICES + length])
+    timings = []
+    for _ in range(length):
+        t0 = time.perf_counter()
+        new_price = next_values[0]
+        next_values = next_values[1:]
+        past_values.append(new_price)
+        _serialize(past_values)
+        _serialize(next_values)
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+def bench_cursor(ticker, length):
+    source = TickSource(ticker, 0)
+    ticks_generated = 0
+    timings = []
+    for _ in range(length):
+        t0 = time.perf_counter()
+        ticks_generated += 1
+        new_price = source.price_at(ticks_generated)
+        _serialize([new_price, ticks_generated])
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+# mean cost of a tick in microseconds, over the whole game and over its first and last 10% of ticks
+def _summary(timings):
+    tenth = max(len(timings) // 10, 1)
+    mean = lambda values: sum(values) / len(values) * 1e6
+    return mean(timings), mean(timings[:tenth]), mean(timings[-tenth:])
+
+
+def main():
+    ticker = sys.argv[1] if len(sys.argv) > 1 else "aapl"
+    archive = get_archive()
+    prices = archive.decode_window(ticker, 0, archive.count(ticker)).tolist()
+
+    print(f'{"ticks":>6} {"mode":>7} {"mean us/tick":>13} {"first 10%":>10} {"last 10%":>10}')
+    for length in GAME_LENGTHS:
+        if length + INITIAL_PRICES > len(prices):
+            continue
+        for mode, timings in (("arrays", bench_arrays(prices, length)), ("cursor", bench_cursor(ticker, length))):
+            mean, first, last = _summary(timings)
+            print(f'{length:>6} {mode:>7} {mean:>13.2f} {first:>10.2f} {last:>10.2f}')
+
+
+if __name__ == "__main__":
+    main()